@@ -0,0 +1,105 @@
+"""
+Measures how many documents per second BulkProcessor can batch, against the string concatenation buffer it used before
+batches were kept as chunks of bytes.  No cluster is needed: _bulk requests go to a session that discards the body.
+
+    python benchmarks/bulk_processor_benchmark.py --documents 100000
+"""
+import argparse
+import json
+import logging
+import time
+
+from digital_thought_commons.elasticsearch import bulkProcessor
+from digital_thought_commons.elasticsearch.bulkProcessor import BulkProcessor
+
+
+class DiscardingResponse:
+    status_code = 200
+    content = b''
+
+    def json(self):
+        return {'took': 0, 'errors': False, 'items': []}
+
+
+class DiscardingSession:
+
+    def __init__(self) -> None:
+        self.headers = {}
+        self.bytes_sent = 0
+
+    def post(self, url, data=None, headers=None):
+        self.bytes_sent += len(data)
+        return DiscardingResponse()
+
+
+class StringBufferBulkProcessor:
+    """
+    The previous batch buffer: the body is rebuilt by string concatenation and re-encoded on every action.
+    """
+
+    def __init__(self, request_session, batch_size, batch_max_size_bytes) -> None:
+        self.request_session = request_session
+        self.batch_size = batch_size
+        self.batch_max_size_bytes = batch_max_size_bytes
+        self.entries = ""
+        self.current_batch_size = 0
+
+    def process_batch(self):
+        if self.current_batch_size > 0:
+            self.request_session.post('/_bulk', data=self.entries)
+        self.entries = ""
+        self.current_batch_size = 0
+
+    def _check_for_processing(self):
+        if len(self.entries.encode('utf-8')) > self.batch_max_size_bytes or self.current_batch_size >= self.batch_size:
+            self.process_batch()
+
+    def index(self, index, entry, _id=None):
+        self._check_for_processing()
+        self.entries = self.entries + json.dumps({"index": {"_index": index, "_id": _id}}) + "\n"
+        self.entries = self.entries + json.dumps(entry) + "\n"
+        self.current_batch_size += 1
+        self._check_for_processing()
+
+    def close(self):
+        self.process_batch()
+
+
+def build_document(number):
+    return {'event_timestamp': 1609459200000 + number, 'event_type': 'INFO', 'event_source': 'benchmark',
+            'event_message': 'Benchmark document {} with a message of typical log line length'.format(number),
+            'details': {'filename': 'benchmark.py', 'line_number': number % 500, 'thread_name': 'MainThread'}}
+
+
+def run(processor, documents):
+    start = time.perf_counter()
+    for number in range(documents):
+        processor.index('benchmark', build_document(number), _id=str(number))
+    processor.close()
+    return documents / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='BulkProcessor batching throughput')
+    arg_parser.add_argument('--documents', action='store', type=int, default=50000)
+    arg_parser.add_argument('--batch-sizes', action='store', type=int, nargs='+', default=[1000, 10000])
+    args = arg_parser.parse_args()
+
+    logging.getLogger('elastic').setLevel(logging.WARNING)
+    batch_max_size_bytes = 100 * 1024 * 1024
+    encoders = ['json'] + (['orjson'] if bulkProcessor.orjson is not None else [])
+
+    print('{:>10}  {:<24}  {:>12}  {:>8}'.format('batch_size', 'buffer', 'docs/sec', 'speedup'))
+    for batch_size in args.batch_sizes:
+        baseline = run(StringBufferBulkProcessor(DiscardingSession(), batch_size, batch_max_size_bytes),
+                       args.documents)
+        print('{:>10}  {:<24}  {:>12,.0f}  {:>7.1f}x'.format(batch_size, 'string concatenation', baseline, 1))
+        for encoder in encoders:
+            docs_per_second = run(BulkProcessor(DiscardingSession(), '', batch_size, batch_max_size_bytes,
+                                                json_encoder=encoder), args.documents)
+            print('{:>10}  {:<24}  {:>12,.0f}  {:>7.1f}x'.format(batch_size, 'byte chunks ({})'.format(encoder),
+                                                                  docs_per_second, docs_per_second / baseline))
+
+
+if __name__ == '__main__':
+    main()
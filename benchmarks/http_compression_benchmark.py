@@ -0,0 +1,156 @@
+"""
+Measures the bytes on the wire of _bulk and _search requests with and without http_compress, through the same
+requests session ElasticsearchConnection uses.  Requests go to a local HTTP server standing in for the cluster, which
+counts the bytes it reads from and writes to each socket and answers with a typical search response, gzip compressed
+when asked to.  requests always asks for compressed responses, so http_compress mostly shrinks the request bodies.
+
+    python benchmarks/http_compression_benchmark.py --documents 5000
+"""
+import argparse
+import gzip
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from digital_thought_commons import internet
+
+
+class CountingReader:
+
+    def __init__(self, reader, counters) -> None:
+        self.reader = reader
+        self.counters = counters
+
+    def read(self, *args):
+        data = self.reader.read(*args)
+        self.counters['received'] += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self.reader.readline(*args)
+        self.counters['received'] += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+
+class CountingSocket:
+
+    def __init__(self, sock, counters) -> None:
+        self.sock = sock
+        self.counters = counters
+
+    def sendall(self, data, *args):
+        self.counters['sent'] += len(data)
+        return self.sock.sendall(data, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class ClusterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    search_response = b''
+
+    def setup(self):
+        self.request = CountingSocket(self.request, self.server.counters)
+        super().setup()
+        self.rfile = CountingReader(self.rfile, self.server.counters)
+
+    def __respond(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = self.search_response
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = __respond
+    do_POST = __respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ClusterServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), ClusterHandler)
+        self.counters = {'received': 0, 'sent': 0}
+
+
+def build_document(number):
+    return {'event_timestamp': 1609459200000 + number, 'event_type': 'INFO', 'event_source': 'benchmark',
+            'event_message': 'Benchmark document {} with a message of typical log line length'.format(number),
+            'details': {'filename': 'benchmark.py', 'line_number': number % 500, 'thread_name': 'MainThread'}}
+
+
+def build_bulk_body(documents):
+    lines = []
+    for number in range(documents):
+        lines.append(json.dumps({'index': {'_index': 'benchmark', '_id': str(number)}}))
+        lines.append(json.dumps(build_document(number)))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def build_search_response(hits):
+    return json.dumps({'took': 3, 'timed_out': False, 'hits': {'total': {'value': hits, 'relation': 'eq'}, 'hits': [
+        {'_index': 'benchmark', '_id': str(number), '_score': 1.0, '_source': build_document(number)}
+        for number in range(hits)]}}).encode('utf-8')
+
+
+def measure(server, http_compress, compression_level, bulk_body, search_query, requests_per_type):
+    root_url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    session = internet.retry_request_session(http_compress=http_compress, compression_level=compression_level)
+    server.counters.update({'received': 0, 'sent': 0})
+    start = time.perf_counter()
+    for _ in range(requests_per_type):
+        session.post(root_url + '_bulk', data=bulk_body, headers={'Content-Type': 'application/x-ndjson'})
+        session.get(root_url + 'benchmark/_search', json=search_query).json()
+    elapsed = time.perf_counter() - start
+    session.close()
+    return dict(server.counters), elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Bytes on the wire with and without http_compress')
+    arg_parser.add_argument('--documents', action='store', type=int, default=5000,
+                            help='Documents per bulk request and hits per search response')
+    arg_parser.add_argument('--requests', action='store', type=int, default=5,
+                            help='Number of bulk and of search requests sent for each mode')
+    arg_parser.add_argument('--levels', action='store', type=int, nargs='+', default=[1, 6, 9])
+    args = arg_parser.parse_args()
+
+    ClusterHandler.search_response = build_search_response(args.documents)
+    bulk_body = build_bulk_body(args.documents)
+    search_query = {'size': args.documents, 'query': {'bool': {'filter': [
+        {'term': {'event_source': 'benchmark'}}, {'range': {'event_timestamp': {'gte': 1609459200000}}}]}}}
+
+    server = ClusterServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        modes = [('uncompressed', False, 6)] + [('gzip level {}'.format(level), True, level) for level in args.levels]
+        print('{:<16}  {:>14}  {:>14}  {:>14}  {:>8}  {:>10}'.format('mode', 'sent bytes', 'received bytes',
+                                                                     'total bytes', 'ratio', 'seconds'))
+        baseline = None
+        for name, http_compress, level in modes:
+            counters, elapsed = measure(server, http_compress, level, bulk_body, search_query, args.requests)
+            # The server received what the client sent and vice versa
+            total = counters['received'] + counters['sent']
+            baseline = baseline or total
+            print('{:<16}  {:>14,}  {:>14,}  {:>14,}  {:>7.1%}  {:>10.2f}'.format(
+                name, counters['received'], counters['sent'], total, total / baseline, elapsed))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,45 @@
-import _sqlite3
-import base64
 import getpass
 import hashlib
-import json
 import logging
 import os
 import pathlib
 import time
 from _sqlite3 import Error
-
-import yaml
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 
 from digital_thought_commons import elasticsearch
+from .cacheBackend import CacheBackend, CacheEntry
+from .cacheKey import canonical_signature, canonical_value, legacy_signature, normalize_domain, normalize_ip
+from .compaction import CacheCompactor
+from .elasticCache import ElasticCacheBackend
+from .fileCache import FileCacheBackend
+from .memoryCache import MemoryCache, QueueCache
+from .metrics import CacheMetrics, MetricsReporter
+from .payloadCodec import PayloadCodec
+from .registry import CacheRegistry, get_async_cache, get_cache, registry
+from .singleFlight import SingleFlight
+from . import keyMigration, snapshot
+from .sqliteEngine import SQLiteEngine
+from .tieredCache import TieredCacheBackend
 
 cache_resource_folder = "{}/../_resources/cache".format(str(pathlib.Path(__file__).parent.absolute()))
 default_cache_configuration_file = f'{cache_resource_folder}/default_cache_config.yaml'
 system_cache_configuration_file = './config/loggingConfig.yaml'
 
+#Milliseconds each class of error response is cached for when not configured, 0 = not cached
+default_negative_cache_ttl = {'not_found': 0, 'rate_limited': 0, 'server_error': 0, 'error': 0}
 
-class QueueCache:
-
-    def __init__(self, size, name):
-        self.size = size
-        self.name = name
-        self.queue_keys = []
-        self.queue = {}
-
-    def put(self, key, obj):
-        if len(self.queue_keys) >= self.size:
-            last_index = self.queue_keys[0]
-            try:
-                self.queue.pop(last_index)
-                self.queue_keys.remove(last_index)
-                logging.debug("Queue Full. Removing key {} from QueueCache: {}".format(key, self.name))
-            except:
-                logging.debug("Error Removing Key  {} from QueueCache: {}".format(key, self.name))
-
-        self.queue_keys.append(key)
-        self.queue[key] = obj
-
-    def lookup(self, key):
-        obj = None
-        if key in self.queue_keys:
-            try:
-                obj = self.queue[key]
-                self.queue.pop(key)
-                self.queue_keys.remove(key)
-                logging.debug("Retrieved key {} from QueueCache: {}".format(key, self.name))
-            except:
-                logging.debug("Error Retrieving Key  {} from QueueCache: {}".format(key, self.name))
-
-        return obj
 
-    def items(self):
-        return self.queue
-
-    def keys(self):
-        return self.queue_keys
+def error_class(json_resp) -> str:
+    status_code = json_resp.get('status_code')
+    if status_code == 404:
+        return 'not_found'
+    if status_code == 429:
+        return 'rate_limited'
+    if isinstance(status_code, int) and 500 <= status_code < 600:
+        return 'server_error'
+    return 'error'
 
 
 class APICache:
@@ -71,26 +54,74 @@ class APICache:
         else:
             self.configuration_file = default_cache_configuration_file
 
-        with open(self.configuration_file, 'r') as config_file:
-            self.config = yaml.safe_load(config_file)
+        self.config = registry.configuration(self.configuration_file)
         self.cache_name = cache_name
-        self.memory_cache = QueueCache(self.config['memory_cache_size'], self.cache_name)
+        self.metrics = CacheMetrics(cache_name=self.cache_name)
+        codec_config = self.config.get('codec', {})
+        self.codec = PayloadCodec(serializer=codec_config.get('serializer', 'auto'),
+                                  compression=codec_config.get('compression', 'zlib'),
+                                  compression_level=codec_config.get('compression_level', 6),
+                                  compression_threshold=codec_config.get('compression_threshold', 1024))
+        self.memory_cache = MemoryCache(name=self.cache_name, max_entries=self.config['memory_cache_size'],
+                                        max_bytes=self.config.get('memory_cache_max_bytes'),
+                                        policy=self.config.get('memory_cache_policy', 'lru'))
         if self.config['cache_type'] == 'file':
-            self.__configure_file_cache()
+            self.backend = self.__configure_file_cache()
         elif self.config['cache_type'] == 'elastic':
-            self.__configure_elastic_cache()
+            self.backend = self.__configure_elastic_cache()
+        elif self.config['cache_type'] == 'tiered':
+            self.backend = self.__configure_tiered_cache()
         else:
             raise Exception("Unknown Cache Type: {}".format(self.config['cache_type']))
 
         self.max_age = self.config['default_max_age']
+        self.lookup_concurrency = self.config.get('lookup_concurrency', 4)
+        self.stale_while_revalidate = self.config.get('stale_while_revalidate', 0)
+        self.single_flight = SingleFlight()
+        self.refresh_executor = None
+        if self.stale_while_revalidate > 0:
+            self.refresh_executor = ThreadPoolExecutor(max_workers=self.lookup_concurrency,
+                                                       thread_name_prefix='APICacheRefresh:{}'.format(self.cache_name))
 
         if self.cache_name.replace(' ', '_') + '_max_age' in self.config:
             self.max_age = self.config[self.cache_name.replace(' ', '_') + '_max_age']
 
+        self.negative_cache_ttl = dict(default_negative_cache_ttl)
+        self.negative_cache_ttl.update(self.config.get('negative_cache_ttl') or {})
+        self.negative_cache_ttl.update(self.config.get(self.cache_name.replace(' ', '_') + '_negative_cache_ttl') or {})
+        self.rate_limit_backoff = self.config.get('rate_limit_backoff', 60000)
+        self.key_normalizers = {}
+        self.legacy_key_fallback = self.config.get('legacy_key_fallback', True)
+
+        self.compactor = None
+        if self.config.get('compaction_interval', 0) > 0:
+            self.compactor = CacheCompactor(caches=[self], interval=self.config['compaction_interval'])
+            self.compactor.start()
+
+        self.metrics_reporter = None
+        if self.config.get('metrics_interval', 0) > 0:
+            self.metrics_reporter = MetricsReporter(caches=[self], interval=self.config['metrics_interval'],
+                                                    logger_name=self.config.get('metrics_logger', 'api_cache_metrics'))
+            self.metrics_reporter.start()
+
+        if self.config.get('memory_cache_preload', 0) > 0:
+            self.preload_memory_cache(self.config['memory_cache_preload'])
+
     def __configure_elastic_cache(self):
-        self.elastic_connection = elasticsearch.ElasticsearchConnection(api_key=self.config['elastic']['api_key'],
-                                                                        server=self.config['elastic']['server'],
-                                                                        port=self.config['elastic']['port'])
+        elastic_config = self.config['elastic']
+        # Caches on the same cluster share one connection, and its pool, through the connection registry
+        self.elastic_connection = elasticsearch.get_connection(api_key=elastic_config['api_key'],
+                                                               server=elastic_config['server'],
+                                                               port=elastic_config['port'],
+                                                               http_compress=elastic_config.get('http_compress', False),
+                                                               compression_level=elastic_config.get('compression_level',
+                                                                                                    6),
+                                                               pool_size=elastic_config.get('pool_size', 10))
+        return ElasticCacheBackend(elastic_connection=self.elastic_connection, cache_name=self.cache_name,
+                                   index=self.config['elastic'].get('index', 'api-cache-v2'),
+                                   bulk_batch_size=self.config['elastic'].get('bulk_batch_size', 500),
+                                   flush_interval=self.config['elastic'].get('flush_interval', 1.0),
+                                   concurrent_requests=self.config['elastic'].get('concurrent_requests', 2))
 
     def __configure_file_cache(self):
         self.cache_location = r'.\cache'
@@ -100,134 +131,472 @@ class APICache:
         if not os.path.exists(self.cache_location):
             os.mkdir(self.cache_location)
 
-        self.cache_file = self.cache_location + '/' + self.cache_name.replace(' ', '_') + '.cache'
+        if self.config['file'].get('database'):
+            self.cache_file = self.cache_location + '/' + self.config['file']['database']
+        else:
+            self.cache_file = self.cache_location + '/' + self.cache_name.replace(' ', '_') + '.cache'
 
         try:
-            self.connection = _sqlite3.connect(self.cache_file, check_same_thread=False)
-            self.__create_table()
+            engine = registry.engine(database_file=self.cache_file,
+                                     journal_mode=self.config['file'].get('journal_mode', 'wal'),
+                                     synchronous=self.config['file'].get('synchronous', 'normal'),
+                                     busy_timeout=self.config['file'].get('busy_timeout', 5000))
+            backend = FileCacheBackend(engine=engine, cache_name=self.cache_name,
+                                       commit_batch_size=self.config['file'].get('commit_batch_size', 100),
+                                       commit_interval=self.config['file'].get('commit_interval', 1.0),
+                                       vacuum=self.config['file'].get('vacuum', 'incremental'))
             logging.info('Initialised cache for {} located at {}'.format(self.cache_name, self.cache_file))
+            return backend
         except Error as er:
-            logging.exception('Error occurred while initialising cache file {}'.format(self.cache_file), er)
+            logging.exception('Error occurred while initialising cache file {}'.format(self.cache_file))
             raise er
 
-    def __create_table(self):
-        create_cache_table = """ CREATE TABLE IF NOT EXISTS cache (
-                                                id integer PRIMARY KEY,
-                                                signature_hash text,
-                                                lookup_timestamp integer,
-                                                encoded_response text,
-                                                username text,
-                                                cache_name text
-                                            ); """
-        self.connection.execute(create_cache_table)
-
-    def __generate_hash(self, args):
-        signature_string = self.cache_name
-        for key, value in args.items():
-            signature_string += '{}={}'.format(key, value)
+    def __configure_tiered_cache(self):
+        local = self.__configure_file_cache()
+        try:
+            shared = self.__configure_elastic_cache()
+        except Exception:
+            local.close()
+            raise
+        return TieredCacheBackend(local=local, shared=shared,
+                                  promote=self.config.get('tiered', {}).get('promote', True))
+
+    def add_key_normalizer(self, argument, normalizer: Callable):
+        """
+        Applies normalizer to the value of argument when building cache keys, e.g. normalize_ip for an IP address, so
+        differently formatted values of the same lookup share an entry.  The value passed to the lookup method is not
+        changed.
+        """
+        self.key_normalizers[argument] = normalizer
+
+    def _generate_hash(self, args):
+        signature_string = canonical_signature(self.cache_name, args, self.key_normalizers)
+        return hashlib.sha256(bytes(signature_string, 'utf-8')).hexdigest()
 
+    def _legacy_hash(self, args):
+        signature_string = legacy_signature(self.cache_name, args)
         return hashlib.sha256(bytes(signature_string, 'utf-8')).hexdigest()
 
-    def __lookup_file_cache(self, signature_hash, current_timestamp):
-        encoded_value = None
+    def _legacy_hashes(self, signature_hashes, list_of_kwargs, legacy_keys=None) -> dict:
+        """
+        Maps each signature hash to the hash its lookup had before keys were canonicalised, when they differ.  The
+        legacy hash is built from the lookup's legacy key when one is given, otherwise from its arguments.
+        """
+        if not self.legacy_key_fallback:
+            return {}
+        legacy_keys = legacy_keys or [None] * len(list_of_kwargs)
+        legacy_hashes = {}
+        for signature_hash, kwargs, legacy_key in zip(signature_hashes, list_of_kwargs, legacy_keys):
+            legacy_hash = self._legacy_hash(kwargs if legacy_key is None else legacy_key)
+            if legacy_hash != signature_hash:
+                legacy_hashes[signature_hash] = legacy_hash
+        return legacy_hashes
+
+    def _migrate_entries(self, legacy_hashes: dict, min_timestamp) -> dict:
+        """
+        Copies entries stored under legacy hashes to their canonical signature hash, keeping their lookup_timestamp.
+        Returns the migrated entries by canonical signature hash.
+        """
+        if len(legacy_hashes) == 0:
+            return {}
+        legacy_entries = self.backend.lookup_many(list(set(legacy_hashes.values())), min_timestamp=min_timestamp)
+        entries = {}
+        for signature_hash, legacy_hash in legacy_hashes.items():
+            entry = legacy_entries.get(legacy_hash)
+            if entry is not None:
+                entries[signature_hash] = CacheEntry(signature_hash=signature_hash,
+                                                     lookup_timestamp=entry.lookup_timestamp,
+                                                     encoded_response=entry.encoded_response,
+                                                     cache_name=entry.cache_name or self.cache_name,
+                                                     username=entry.username)
+        if len(entries) > 0:
+            logging.debug('Migrated %s legacy cache signatures of %s', len(entries), self.cache_name)
+            self.backend.store_many(list(entries.values()))
+        return entries
+
+    def _lookup_memory(self, signature_hash):
+        start = time.perf_counter()
+        payload = self.memory_cache.lookup(signature_hash)
+        self.metrics.observe('memory', start)
+        if payload is not None:
+            self.metrics.increment('memory_hits')
+        return payload
+
+    def __record_backend_hit(self, entry, current_timestamp):
+        self.metrics.increment('backend_hits')
+        self.metrics.backend_hit_age.record(current_timestamp - entry.lookup_timestamp)
+        if entry.lookup_timestamp < current_timestamp - self.max_age:
+            self.metrics.increment('stale_hits')
+            return True
+        return False
+
+    def __is_expired_negative(self, entry, payload, current_timestamp) -> bool:
+        # A negative entry past its TTL is in the stale window, but is not served stale nor refreshed in the background
+        return entry.lookup_timestamp < current_timestamp - self.max_age and \
+            self._response_ttl(self.codec.deserialize(payload)) is not None
+
+    def _min_timestamp(self, current_timestamp) -> int:
+        """
+        Oldest lookup_timestamp still served, as a fresh entry or a stale one while it is refreshed.  Lookups,
+        compaction, preloading and snapshot imports all use it, so compaction never removes an entry a lookup would
+        still serve.
+        """
+        return current_timestamp - self.max_age - self.stale_while_revalidate
+
+    def _remember(self, signature_hash, payload, lookup_timestamp, current_timestamp) -> bool:
+        """
+        Keeps a payload read from the backend in the memory cache for what remains of its max_age, which for a back
+        dated negative entry is what remains of its negative cache TTL.  Expired and stale entries are not kept.
+        """
+        remaining = lookup_timestamp + self.max_age - current_timestamp
+        if remaining > 0:
+            self.memory_cache.put(signature_hash, payload, ttl=remaining)
+        return remaining > 0
+
+    def _lookup_cache(self, signature_hash, current_timestamp, legacy_hash=None):
+        payload = None
+        stale = False
+        start = time.perf_counter()
         try:
-            logging.debug('Looking up signature {} in cache that is not older than {}'.
-                          format(signature_hash, str(current_timestamp - self.max_age)))
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT lookup_timestamp, encoded_response FROM cache WHERE signature_hash=? "
-                           "AND lookup_timestamp>=?", (signature_hash, current_timestamp - self.max_age))
-
-            recent_timestamp = 0
-            for row in cursor.fetchall():
-                if row[0] > recent_timestamp:
-                    encoded_value = base64.b64decode(row[1]).decode("UTF-8")
-                    recent_timestamp = row[0]
+            logging.debug('Looking up signature %s in cache that is not older than %s', signature_hash,
+                          current_timestamp - self.max_age)
+            min_timestamp = self._min_timestamp(current_timestamp)
+            entry = self.backend.lookup(signature_hash, min_timestamp=min_timestamp)
+            if entry is None and legacy_hash is not None:
+                entry = self._migrate_entries({signature_hash: legacy_hash}, min_timestamp).get(signature_hash)
+            if entry is not None:
+                payload = self.codec.decode(entry.encoded_response)
+                if self.__is_expired_negative(entry, payload, current_timestamp):
+                    payload = None
+                else:
+                    stale = self.__record_backend_hit(entry, current_timestamp)
+                    self._remember(signature_hash, payload, entry.lookup_timestamp, current_timestamp)
 
         except Exception as ex:
-            logging.exception("Error encountered while looking up cache signature: {}".format(signature_hash), ex)
+            self.metrics.increment('backend_errors')
+            logging.exception("Error encountered while looking up cache signature: {}".format(signature_hash))
 
-        return encoded_value
+        self.metrics.observe('backend', start)
+        return payload, stale
 
-    def __lookup_elastic_cache(self, signature_hash, current_timestamp):
-        encoded_value = None
+    def _lookup_many_cache(self, signature_hashes, current_timestamp, legacy_hashes=None):
+        payloads = {}
+        stale = []
+        start = time.perf_counter()
         try:
-            logging.debug('Looking up signature {} in cache that is not older than {}'.
-                          format(signature_hash, str(current_timestamp - self.max_age)))
-            query = {"size": 100, "query": {"bool": {"must": [{"term": {"signature_hash": signature_hash}},
-                                                              {"range": {"lookup_timestamp": {
-                                                                  "gte": current_timestamp - self.max_age}
-                                                              }}]}}}
-
-            recent_timestamp = 0
-            scroll_query = self.elastic_connection.get_scroller()
-            for entry in scroll_query.query("api-cache", query):
-                if entry['_source']['lookup_timestamp'] > recent_timestamp:
-                    encoded_value = base64.b64decode(entry['_source']['encoded_response']).decode("UTF-8")
-                    recent_timestamp = entry['_source']['lookup_timestamp']
-            scroll_query.clear()
+            min_timestamp = self._min_timestamp(current_timestamp)
+            entries = self.backend.lookup_many(signature_hashes, min_timestamp=min_timestamp)
+            if legacy_hashes:
+                entries.update(self._migrate_entries({signature_hash: legacy_hash
+                                                      for signature_hash, legacy_hash in legacy_hashes.items()
+                                                      if signature_hash not in entries}, min_timestamp))
+            for signature_hash, entry in entries.items():
+                payload = self.codec.decode(entry.encoded_response)
+                if self.__is_expired_negative(entry, payload, current_timestamp):
+                    continue
+                payloads[signature_hash] = payload
+                if self.__record_backend_hit(entry, current_timestamp):
+                    stale.append(signature_hash)
+                self._remember(signature_hash, payloads[signature_hash], entry.lookup_timestamp, current_timestamp)
         except Exception as ex:
-            logging.exception("Error encountered while looking up cache signature: {}".format(signature_hash), ex)
-
-        return encoded_value
-
-    def __lookup_cache(self, signature_hash, current_timestamp):
-        if self.config['cache_type'] == 'file':
-            return self.__lookup_file_cache(signature_hash=signature_hash, current_timestamp=current_timestamp)
-        elif self.config['cache_type'] == 'elastic':
-            return self.__lookup_elastic_cache(signature_hash=signature_hash, current_timestamp=current_timestamp)
-
-    def __store_to_file_cache(self, signature_hash, current_timestamp, encoded_response, username):
+            self.metrics.increment('backend_errors')
+            logging.exception("Error encountered while looking up {} cache signatures".format(len(signature_hashes)))
+
+        self.metrics.observe('backend', start)
+        return payloads, stale
+
+    def _record_live(self, start, json_resp=None, error=False):
+        self.metrics.observe('live', start)
+        self.metrics.increment('live_fetches')
+        if error:
+            self.metrics.increment('live_errors')
+        elif isinstance(json_resp, dict) and 'error' in json_resp:
+            self.metrics.increment('error_responses')
+
+    def _response_ttl(self, json_resp):
+        """
+        Returns None when a response is cached for max_age, otherwise the negative cache TTL in milliseconds of its
+        class of error (0 when it is not cached).
+        """
+        if not isinstance(json_resp, dict) or 'error' not in json_resp or self.config['cache_error_responses']:
+            return None
+        return self.negative_cache_ttl.get(error_class(json_resp), 0)
+
+    def _record_backoff(self, json_resp):
+        if not isinstance(json_resp, dict) or 'error' not in json_resp:
+            return
+        if json_resp.get('retry_after') is not None:
+            delay = int(json_resp['retry_after'] * 1000)
+        elif json_resp.get('status_code') == 429:
+            delay = self.rate_limit_backoff
+        else:
+            return
+
+        if delay > 0:
+            logging.warning('{} responded with status code {}, live lookups are suspended for {}ms'
+                            .format(self.cache_name, json_resp.get('status_code'), delay))
+            registry.back_off(self.cache_name, int(round(time.time() * 1000)) + delay)
+
+    def _suspended_response(self):
+        """
+        Returns the error response served in place of a live lookup while the provider is backing off, otherwise None.
+        """
+        until = registry.backing_off_until(self.cache_name)
+        if until <= int(round(time.time() * 1000)):
+            return None
+        self.metrics.increment('suspended_lookups')
+        return {'error': 'Live lookups for {} are suspended until {} after being rate limited'
+                .format(self.cache_name, until), 'status_code': 429, 'suspended_until': until}
+
+    def __fetch_live(self, lookup_method, signature_hash, kwargs, miss=True):
+        # Only runs in the single flight leader, so a signature is counted once however many callers wait for it
+        if miss:
+            self.metrics.increment('misses')
+        suspended = self._suspended_response()
+        if suspended is not None:
+            return self.codec.serialize(suspended), 0
+
+        logging.debug('Looking up signature %s from live source', signature_hash)
+        start = time.perf_counter()
         try:
-            logging.debug('Storing signature {} in cache'.
-                          format(signature_hash))
-
-            cursor = self.connection.cursor()
-            cursor.execute("INSERT INTO cache(signature_hash, lookup_timestamp, encoded_response, cache_name, username)"
-                           " VALUES(?,?,?,?,?)",
-                           (signature_hash, current_timestamp, encoded_response, self.cache_name, username))
-            self.connection.commit()
+            json_resp = lookup_method(**kwargs)
+        except Exception:
+            self._record_live(start, error=True)
+            raise
+        self._record_live(start, json_resp)
+        self._record_backoff(json_resp)
+        ttl = self._response_ttl(json_resp)
+        payload = self.codec.serialize(json_resp)
+        if ttl != 0:
+            self.memory_cache.put(signature_hash, payload, ttl=ttl)
+        return payload, ttl
+
+    def __refresh(self, lookup_method, signature_hash, kwargs):
+        try:
+            (payload, ttl), shared = self.single_flight.do(signature_hash, self.__fetch_live, lookup_method,
+                                                           signature_hash, kwargs, False)
+            if ttl != 0 and not shared:
+                self._store_to_cache(signature_hash, int(round(time.time() * 1000)), payload, ttl=ttl)
         except Exception as ex:
-            logging.exception("Error encountered while storing to cache signature: {}".format(signature_hash), ex)
-
-    def __store_to_elastic_cache(self, signature_hash, current_timestamp, encoded_response, username):
+            logging.exception("Error encountered while refreshing stale cache signature: {}".format(signature_hash))
+
+    def __schedule_refresh(self, lookup_method, signature_hash, kwargs):
+        if not self.single_flight.in_flight(signature_hash):
+            logging.debug('Serving stale signature %s while it is refreshed', signature_hash)
+            self.refresh_executor.submit(self.__refresh, lookup_method, signature_hash, kwargs)
+
+    def _build_entry(self, signature_hash, current_timestamp, payload, username, ttl=None):
+        if ttl is not None:
+            # Negative entries are back dated so they expire ttl milliseconds from now under the usual max_age check
+            current_timestamp = current_timestamp - self.max_age + ttl
+        return CacheEntry(signature_hash=signature_hash, lookup_timestamp=current_timestamp,
+                          encoded_response=self.codec.encode(payload), cache_name=self.cache_name, username=username)
+
+    def __record_stored(self, entries, start):
+        self.metrics.observe('store', start)
+        self.metrics.increment('entries_stored', len(entries))
+        self.metrics.increment('bytes_stored', sum(len(entry.encoded_response) for entry in entries))
+
+    def _store_to_cache(self, signature_hash, current_timestamp, payload, ttl=None):
+        start = time.perf_counter()
         try:
-            doc = {'signature_hash': signature_hash, 'encoded_response': encoded_response,
-                   'cache_name': self.cache_name, 'lookup_timestamp': current_timestamp,
-                   'username': username}
-
-            resp = self.elastic_connection.index_document(index='api-cache', document=doc)
-
-            if resp['status_code'] != 201:
-                raise Exception('Failed to store item to Elastic cache: {}'.format(str(resp)))
-
+            logging.debug('Storing signature %s in cache', signature_hash)
+            entry = self._build_entry(signature_hash, current_timestamp, payload, getpass.getuser(), ttl=ttl)
+            self.backend.store(entry)
+            self.__record_stored([entry], start)
         except Exception as ex:
-            logging.exception("Error encountered while storing to cache signature: {}".format(signature_hash), ex)
+            self.metrics.increment('backend_errors')
+            logging.exception("Error encountered while storing to cache signature: {}".format(signature_hash))
 
-    def __store_to_cache(self, signature_hash, current_timestamp, response):
-        username = getpass.getuser()
-        encoded_response = base64.b64encode(response.encode("UTF-8")).decode("UTF-8")
-        if self.config['cache_type'] == 'file':
-            self.__store_to_file_cache(signature_hash, current_timestamp, encoded_response, username)
-        elif self.config['cache_type'] == 'elastic':
-            self.__store_to_elastic_cache(signature_hash, current_timestamp, encoded_response, username)
+    def _store_many_to_cache(self, payloads, current_timestamp):
+        """
+        payloads maps each signature hash to a tuple of its payload and negative cache TTL (None for a response).
+        """
+        if len(payloads) == 0:
+            return
 
-    def lookup(self, lookup_method, **kwargs):
-        signature_hash = self.__generate_hash(kwargs)
+        username = getpass.getuser()
+        start = time.perf_counter()
+        try:
+            logging.debug('Storing %s signatures in cache', len(payloads))
+            entries = [self._build_entry(signature_hash, current_timestamp, payload, username, ttl=ttl)
+                       for signature_hash, (payload, ttl) in payloads.items()]
+            self.backend.store_many(entries)
+            self.__record_stored(entries, start)
+        except Exception as ex:
+            self.metrics.increment('backend_errors')
+            logging.exception("Error encountered while storing {} signatures to cache".format(len(payloads)))
+
+    def lookup(self, lookup_method, /, **kwargs):
+        """
+        Returns the cached response of lookup_method(**kwargs), calling it on a miss.
+        """
+        return self.lookup_with_legacy_key(lookup_method, None, **kwargs)
+
+    def lookup_with_legacy_key(self, lookup_method, legacy_key: dict, /, **kwargs):
+        """
+        lookup, where legacy_key holds the arguments the lookup was keyed by before keys were canonicalised when they
+        differ from kwargs, e.g. a query_url built before the IP address in it was normalised, so entries stored under
+        the old key are still found.  legacy_key is passed positionally, so kwargs may hold any argument name.
+        """
+        signature_hash = self._generate_hash(kwargs)
         current_timestamp = int(round(time.time() * 1000))
 
-        response = self.memory_cache.lookup(signature_hash)
-
-        if response is None:
-            response = self.__lookup_cache(signature_hash, current_timestamp)
-
-        if response is None:
-            logging.debug('Looking up signature {} from live source'.
-                          format(signature_hash))
-            json_resp = lookup_method(**kwargs)
-            response = json.dumps(json_resp)
-
-            if self.config['cache_error_responses'] or 'error' not in json_resp:
-                self.__store_to_cache(signature_hash, current_timestamp, response)
-
-        self.memory_cache.put(signature_hash, response)
-        return json.loads(response)
+        payload = self._lookup_memory(signature_hash)
+        if payload is not None:
+            return self.codec.deserialize(payload)
+
+        payload, stale = self._lookup_cache(signature_hash, current_timestamp,
+                                            self._legacy_hashes([signature_hash], [kwargs],
+                                                                [legacy_key]).get(signature_hash))
+
+        if payload is None:
+            (payload, ttl), shared = self.single_flight.do(signature_hash, self.__fetch_live, lookup_method,
+                                                           signature_hash, kwargs)
+            if shared:
+                self.metrics.increment('coalesced')
+            if ttl != 0 and not shared:
+                self._store_to_cache(signature_hash, current_timestamp, payload, ttl=ttl)
+            return self.codec.deserialize(payload)
+
+        if stale:
+            self.__schedule_refresh(lookup_method, signature_hash, kwargs)
+        return self.codec.deserialize(payload)
+
+    def lookup_many(self, lookup_method, list_of_kwargs: List[dict], legacy_keys: List[dict] = None) -> List[dict]:
+        """
+        Looks up many signatures at once.  Memory hits are resolved first, the remainder are fetched from the
+        persistent cache in a single query and only true misses are passed to lookup_method, using up to
+        lookup_concurrency threads.  Responses are returned in the same order as list_of_kwargs.  legacy_keys, when
+        given, holds the legacy key (see lookup_with_legacy_key) of each lookup in list_of_kwargs, or None.
+        """
+        current_timestamp = int(round(time.time() * 1000))
+        signature_hashes = [self._generate_hash(kwargs) for kwargs in list_of_kwargs]
+
+        payloads = {}
+        for signature_hash in signature_hashes:
+            if signature_hash not in payloads:
+                payload = self._lookup_memory(signature_hash)
+                if payload is not None:
+                    payloads[signature_hash] = payload
+
+        missing = list(dict.fromkeys(signature_hash for signature_hash in signature_hashes
+                                     if signature_hash not in payloads))
+        stale = []
+        if len(missing) > 0:
+            legacy_hashes = self._legacy_hashes(signature_hashes, list_of_kwargs, legacy_keys)
+            found, stale = self._lookup_many_cache(missing, current_timestamp,
+                                                   {signature_hash: legacy_hashes[signature_hash]
+                                                    for signature_hash in missing if signature_hash in legacy_hashes})
+            payloads.update(found)
+
+        live = {}
+        for signature_hash, kwargs in zip(signature_hashes, list_of_kwargs):
+            if signature_hash in stale:
+                self.__schedule_refresh(lookup_method, signature_hash, kwargs)
+            elif signature_hash not in payloads and signature_hash not in live:
+                live[signature_hash] = kwargs
+
+        if len(live) > 0:
+            logging.debug('Looking up %s signatures from live source', len(live))
+            to_store = {}
+            error = None
+            with ThreadPoolExecutor(max_workers=self.lookup_concurrency,
+                                    thread_name_prefix='APICache:{}'.format(self.cache_name)) as executor:
+                futures = {signature_hash: executor.submit(self.single_flight.do, signature_hash, self.__fetch_live,
+                                                           lookup_method, signature_hash, kwargs)
+                           for signature_hash, kwargs in live.items()}
+                for signature_hash, future in futures.items():
+                    try:
+                        (payload, ttl), shared = future.result()
+                    except Exception as ex:
+                        error = error or ex
+                        continue
+
+                    if shared:
+                        self.metrics.increment('coalesced')
+                    if ttl != 0 and not shared:
+                        to_store[signature_hash] = (payload, ttl)
+                    payloads[signature_hash] = payload
+
+            self._store_many_to_cache(to_store, current_timestamp)
+            if error is not None:
+                raise error
+
+        return [self.codec.deserialize(payloads[signature_hash]) for signature_hash in signature_hashes]
+
+    def compact(self):
+        start = time.time()
+        min_timestamp = self._min_timestamp(int(round(start * 1000)))
+        report = self.backend.compact(min_timestamp)
+
+        report.update({'cache_name': self.cache_name, 'cache_type': self.config['cache_type'],
+                       'duration_ms': int(round((time.time() - start) * 1000))})
+        return report
+
+    def preload_memory_cache(self, count) -> int:
+        """
+        Fills the memory cache with those of the count most recently looked up entries that are still fresh.  Stale
+        entries are left to the backend, where a lookup serves them and refreshes them.  Returns the number of entries
+        preloaded.
+        """
+        current_timestamp = int(round(time.time() * 1000))
+        try:
+            entries = self.backend.most_recent(count, min_timestamp=self._min_timestamp(current_timestamp))
+        except Exception as ex:
+            logging.exception('Error encountered while preloading memory cache for {}'.format(self.cache_name))
+            return 0
+
+        # Oldest first, so the most recent entries are the last to be evicted
+        preloaded = 0
+        for entry in reversed(entries):
+            if self._remember(entry.signature_hash, self.codec.decode(entry.encoded_response), entry.lookup_timestamp,
+                              current_timestamp):
+                preloaded += 1
+        logging.info('Preloaded {} entries into memory cache for {}'.format(preloaded, self.cache_name))
+        return preloaded
+
+    def migrate_keys(self, list_of_kwargs: List[dict]) -> int:
+        """
+        Rehashes the stored entries of the given lookups from their legacy signature hash to their canonical one.
+        Each lookup is its keyword arguments, or a (kwargs, legacy_key) pair.
+        """
+        return keyMigration.migrate_keys(self, list_of_kwargs)
+
+    def export_snapshot(self, snapshot_file, min_timestamp: int = 0, max_timestamp: int = None) -> int:
+        return snapshot.export_snapshot(self, snapshot_file, min_timestamp=min_timestamp, max_timestamp=max_timestamp)
+
+    def import_snapshot(self, snapshot_file) -> int:
+        # Entries that have already expired are not imported
+        min_timestamp = self._min_timestamp(int(round(time.time() * 1000)))
+        return snapshot.import_snapshot(self, snapshot_file, min_timestamp=min_timestamp)
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the cache's counters, latency histograms and memory tier usage.
+        """
+        stats = self.metrics.stats()
+        stats.update({'cache_type': self.config['cache_type'], 'max_age': self.max_age,
+                      'memory': self.memory_cache.stats(), 'backend': self.backend.stats()})
+        return stats
+
+    def flush(self):
+        self.backend.flush()
+
+    def close(self):
+        if self.compactor is not None:
+            self.compactor.stop()
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+        if self.refresh_executor is not None:
+            self.refresh_executor.shutdown(wait=True)
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+from .asyncCache import AsyncAPICache
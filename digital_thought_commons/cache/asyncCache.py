@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from typing import List
+
+from . import APICache
+
+
+class AsyncAPICache(APICache):
+    """
+    asyncio counterpart of APICache, with the same configuration, codec and tiers.  Given api_cache (as
+    get_async_cache() does with the APICache of the same name) it uses that cache's memory cache, persistent backend
+    and metrics, so an entry either one caches is seen by the other at once, and api_cache remains the one that closes
+    them; otherwise it opens its own.
+    lookup_method must be a coroutine function.  Live lookups run on the event loop and concurrent lookups of the same
+    signature share one call, while the persistent backend is accessed through the loop's default executor so a cache
+    read or commit never blocks the loop.
+    """
+
+    def __init__(self, cache_name, custom_config_file: str = None, api_cache: APICache = None):
+        if api_cache is None:
+            super().__init__(cache_name, custom_config_file=custom_config_file)
+        else:
+            # Shares every tier, helper and setting of api_cache rather than opening a second set
+            vars(self).update(vars(api_cache))
+        self.api_cache = api_cache
+        self.async_lookup_concurrency = self.config.get('async_lookup_concurrency', 100)
+        self.flights = {}
+        self.refreshes = set()
+
+    async def __fetch_live(self, lookup_method, signature_hash, kwargs, miss=True):
+        loop = asyncio.get_running_loop()
+        key = (loop, signature_hash)
+        flight = self.flights.get(key)
+        if flight is not None:
+            # Shielded so a cancelled follower does not cancel the shared call
+            return await asyncio.shield(flight), True
+
+        if miss:
+            self.metrics.increment('misses')
+
+        suspended = self._suspended_response()
+        if suspended is not None:
+            return (self.codec.serialize(suspended), 0), False
+
+        flight = loop.create_future()
+        self.flights[key] = flight
+        try:
+            logging.debug('Looking up signature %s from live source', signature_hash)
+            start = time.perf_counter()
+            try:
+                json_resp = await lookup_method(**kwargs)
+            except Exception:
+                self._record_live(start, error=True)
+                raise
+            self._record_live(start, json_resp)
+            self._record_backoff(json_resp)
+            ttl = self._response_ttl(json_resp)
+            payload = self.codec.serialize(json_resp)
+            if ttl != 0:
+                self.memory_cache.put(signature_hash, payload, ttl=ttl)
+            result = (payload, ttl)
+            flight.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as ex:
+            flight.set_exception(ex)
+            # Marks the exception as retrieved when no other caller is waiting on it
+            flight.exception()
+            raise
+        finally:
+            self.flights.pop(key, None)
+
+    async def __fetch_bounded(self, semaphore, lookup_method, signature_hash, kwargs):
+        async with semaphore:
+            return await self.__fetch_live(lookup_method, signature_hash, kwargs)
+
+    async def __refresh(self, lookup_method, signature_hash, kwargs):
+        try:
+            (payload, ttl), shared = await self.__fetch_live(lookup_method, signature_hash, kwargs, miss=False)
+            if ttl != 0 and not shared:
+                await asyncio.get_running_loop().run_in_executor(None, self._store_to_cache, signature_hash,
+                                                                 int(round(time.time() * 1000)), payload, ttl)
+        except Exception as ex:
+            logging.exception("Error encountered while refreshing stale cache signature: {}".format(signature_hash))
+
+    def __schedule_refresh(self, lookup_method, signature_hash, kwargs):
+        if (asyncio.get_running_loop(), signature_hash) not in self.flights:
+            logging.debug('Serving stale signature %s while it is refreshed', signature_hash)
+            task = asyncio.ensure_future(self.__refresh(lookup_method, signature_hash, kwargs))
+            self.refreshes.add(task)
+            task.add_done_callback(self.refreshes.discard)
+
+    async def lookup(self, lookup_method, /, **kwargs):
+        return await self.lookup_with_legacy_key(lookup_method, None, **kwargs)
+
+    async def lookup_with_legacy_key(self, lookup_method, legacy_key: dict, /, **kwargs):
+        signature_hash = self._generate_hash(kwargs)
+        current_timestamp = int(round(time.time() * 1000))
+        loop = asyncio.get_running_loop()
+
+        payload = self._lookup_memory(signature_hash)
+        if payload is not None:
+            return self.codec.deserialize(payload)
+
+        payload, stale = await loop.run_in_executor(None, self._lookup_cache, signature_hash, current_timestamp,
+                                                    self._legacy_hashes([signature_hash], [kwargs],
+                                                                        [legacy_key]).get(signature_hash))
+
+        if payload is None:
+            (payload, ttl), shared = await self.__fetch_live(lookup_method, signature_hash, kwargs)
+            if shared:
+                self.metrics.increment('coalesced')
+            if ttl != 0 and not shared:
+                await loop.run_in_executor(None, self._store_to_cache, signature_hash, current_timestamp, payload, ttl)
+            return self.codec.deserialize(payload)
+
+        if stale:
+            self.__schedule_refresh(lookup_method, signature_hash, kwargs)
+        return self.codec.deserialize(payload)
+
+    async def lookup_many(self, lookup_method, list_of_kwargs: List[dict],
+                          legacy_keys: List[dict] = None) -> List[dict]:
+        """
+        Looks up many signatures at once, keeping up to async_lookup_concurrency live lookups in flight.  Responses are
+        returned in the same order as list_of_kwargs.  legacy_keys is as for APICache.lookup_many.
+        """
+        current_timestamp = int(round(time.time() * 1000))
+        loop = asyncio.get_running_loop()
+        signature_hashes = [self._generate_hash(kwargs) for kwargs in list_of_kwargs]
+
+        payloads = {}
+        for signature_hash in signature_hashes:
+            if signature_hash not in payloads:
+                payload = self._lookup_memory(signature_hash)
+                if payload is not None:
+                    payloads[signature_hash] = payload
+
+        missing = list(dict.fromkeys(signature_hash for signature_hash in signature_hashes
+                                     if signature_hash not in payloads))
+        stale = []
+        if len(missing) > 0:
+            legacy_hashes = self._legacy_hashes(signature_hashes, list_of_kwargs, legacy_keys)
+            found, stale = await loop.run_in_executor(None, self._lookup_many_cache, missing, current_timestamp,
+                                                      {signature_hash: legacy_hashes[signature_hash]
+                                                       for signature_hash in missing if signature_hash in legacy_hashes})
+            payloads.update(found)
+
+        live = {}
+        for signature_hash, kwargs in zip(signature_hashes, list_of_kwargs):
+            if signature_hash in stale:
+                self.__schedule_refresh(lookup_method, signature_hash, kwargs)
+            elif signature_hash not in payloads and signature_hash not in live:
+                live[signature_hash] = kwargs
+
+        if len(live) > 0:
+            logging.debug('Looking up %s signatures from live source', len(live))
+            semaphore = asyncio.Semaphore(self.async_lookup_concurrency)
+            results = await asyncio.gather(*[self.__fetch_bounded(semaphore, lookup_method, signature_hash, kwargs)
+                                             for signature_hash, kwargs in live.items()], return_exceptions=True)
+            to_store = {}
+            error = None
+            for signature_hash, result in zip(live.keys(), results):
+                if isinstance(result, BaseException):
+                    error = error or result
+                    continue
+
+                (payload, ttl), shared = result
+                if shared:
+                    self.metrics.increment('coalesced')
+                if ttl != 0 and not shared:
+                    to_store[signature_hash] = (payload, ttl)
+                payloads[signature_hash] = payload
+
+            await loop.run_in_executor(None, self._store_many_to_cache, to_store, current_timestamp)
+            if error is not None:
+                raise error
+
+        return [self.codec.deserialize(payloads[signature_hash]) for signature_hash in signature_hashes]
+
+    def close(self):
+        if self.api_cache is None:
+            super().close()
+
+    async def aclose(self):
+        if len(self.refreshes) > 0:
+            await asyncio.gather(*self.refreshes, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
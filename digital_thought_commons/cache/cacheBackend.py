@@ -0,0 +1,57 @@
+from typing import Dict, Iterator, List, Optional
+
+
+class CacheEntry:
+
+    def __init__(self, signature_hash: str, lookup_timestamp: int, encoded_response, cache_name: str = None,
+                 username: str = None) -> None:
+        self.signature_hash: str = signature_hash
+        self.lookup_timestamp: int = lookup_timestamp
+        self.encoded_response = encoded_response
+        self.cache_name: str = cache_name
+        self.username: str = username
+
+
+class CacheBackend:
+
+    def lookup(self, signature_hash: str, min_timestamp: int = 0) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def lookup_many(self, signature_hashes: List[str], min_timestamp: int = 0) -> Dict[str, CacheEntry]:
+        entries = {}
+        for signature_hash in signature_hashes:
+            entry = self.lookup(signature_hash, min_timestamp=min_timestamp)
+            if entry is not None:
+                entries[signature_hash] = entry
+        return entries
+
+    def store(self, entry: CacheEntry):
+        raise NotImplementedError
+
+    def store_many(self, entries: List[CacheEntry]):
+        for entry in entries:
+            self.store(entry)
+
+    def compact(self, min_timestamp: int) -> dict:
+        raise NotImplementedError
+
+    def iterate(self, min_timestamp: int = 0, max_timestamp: int = None) -> Iterator[CacheEntry]:
+        raise NotImplementedError
+
+    def most_recent(self, count: int, min_timestamp: int = 0) -> List[CacheEntry]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
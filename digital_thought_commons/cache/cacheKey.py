@@ -0,0 +1,72 @@
+import enum
+import ipaddress
+from typing import Callable, Dict
+
+
+def canonical_value(value) -> str:
+    """
+    Formats a lookup argument so equal values produce the same string whatever their type or formatting.
+    Strings are stripped, integral floats are formatted as integers, collections are formatted element by element (sets
+    and dict keys in sorted order) and IP address objects use their compressed form.  Integers and strings format
+    exactly as str() did, so keys of single argument lookups are unchanged by canonicalisation.
+    """
+    if isinstance(value, enum.Enum):
+        return canonical_value(value.value)
+    if isinstance(value, bool) or value is None:
+        return str(value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode('UTF-8', errors='replace').strip()
+    if isinstance(value, dict):
+        return '{' + ','.join('{}={}'.format(canonical_value(key), canonical_value(value[key]))
+                              for key in sorted(value, key=canonical_value)) + '}'
+    if isinstance(value, (set, frozenset)):
+        return '[' + ','.join(sorted(canonical_value(item) for item in value)) + ']'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(canonical_value(item) for item in value) + ']'
+    return str(value)
+
+
+def canonical_signature(cache_name, args: dict, normalizers: Dict[str, Callable] = None) -> str:
+    """
+    Builds the signature string of a lookup: the cache name followed by each argument as name=value in sorted name
+    order.  normalizers maps argument names to a function applied to the value before it is formatted.
+    """
+    normalizers = normalizers or {}
+    signature_string = cache_name
+    for key in sorted(args):
+        value = args[key]
+        if key in normalizers:
+            value = normalizers[key](value)
+        signature_string += '{}={}'.format(key, canonical_value(value))
+    return signature_string
+
+
+def legacy_signature(cache_name, args: dict) -> str:
+    """
+    Signature string built before keys were canonicalised, arguments in call order formatted with str().
+    """
+    signature_string = cache_name
+    for key, value in args.items():
+        signature_string += '{}={}'.format(key, value)
+    return signature_string
+
+
+def normalize_ip(value):
+    """
+    Compressed, lower case form of an IPv4 or IPv6 address.  Values that are not an IP address are returned stripped.
+    """
+    try:
+        return str(ipaddress.ip_address(str(value).strip()))
+    except ValueError:
+        return str(value).strip()
+
+
+def normalize_domain(value):
+    """
+    Lower case domain name without a trailing dot.
+    """
+    return str(value).strip().lower().rstrip('.')
@@ -0,0 +1,41 @@
+import logging
+import threading
+from typing import List
+
+from digital_thought_commons.utils import bytes
+
+
+class CacheCompactor(threading.Thread):
+    """
+    Periodically compacts a set of caches in the background.  Each cache is compacted against its own max_age plus
+    stale_while_revalidate, so entries still served stale are kept.
+    """
+
+    def __init__(self, caches: List, interval: float) -> None:
+        threading.Thread.__init__(self, name='CacheCompactor', daemon=True)
+        self.caches = caches
+        self.interval = interval
+        self.reports = []
+        self.__stop_event = threading.Event()
+
+    def compact(self):
+        reports = []
+        for cache in self.caches:
+            try:
+                report = cache.compact()
+                logging.info('Compacted cache {} [{}]: {} expired, {} superseded, {} reclaimed.  Took {}ms'
+                             .format(report['cache_name'], report['cache_type'], report['expired'],
+                                     report['superseded'], bytes.bytes_to_readable_unit(report['bytes_reclaimed'] or 0),
+                                     report['duration_ms']))
+                reports.append(report)
+            except Exception as ex:
+                logging.exception('Error encountered while compacting cache {}: {}'.format(cache.cache_name, str(ex)))
+        self.reports = reports
+        return reports
+
+    def run(self) -> None:
+        while not self.__stop_event.wait(self.interval):
+            self.compact()
+
+    def stop(self):
+        self.__stop_event.set()
@@ -0,0 +1,170 @@
+import atexit
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+from .cacheBackend import CacheBackend, CacheEntry
+
+
+class ElasticCacheBackend(CacheBackend):
+    """
+    Elasticsearch backed cache store.
+    Documents use the signature hash as their _id, so reads are a single GET/_mget and writes replace the document.
+    Writes are queued and handed by a background thread to the backend's BulkProcessor, which sends them on up to
+    concurrent_requests flusher threads, once bulk_batch_size writes are pending or flush_interval seconds have passed.
+    Documents are versioned by lookup_timestamp (external_gte), so a write older than the stored entry, e.g. from
+    another process, a tiered promotion or a snapshot import, is ignored by Elasticsearch.
+    """
+    index_template = 'api-cache-v2'
+
+    def __init__(self, elastic_connection, cache_name, index='api-cache-v2', bulk_batch_size=500,
+                 flush_interval=1.0, concurrent_requests=2) -> None:
+        self.elastic_connection = elastic_connection
+        self.cache_name = cache_name
+        self.index = index
+        self.bulk_batch_size = max(int(bulk_batch_size), 1)
+        self.flush_interval = flush_interval
+        self.pending = OrderedDict()
+        self.__lock = threading.RLock()
+        self.__write_lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__closed = threading.Event()
+
+        if self.index == self.index_template:
+            template = self.elastic_connection.default_index_templates()[self.index_template]
+            self.elastic_connection.install_index_template(template_name=self.index_template, template=template)
+
+        # Stale writes are rejected with a 409 version conflict, which is not an error for a cache
+        self.bulk_processor = self.elastic_connection.bulk_processor(batch_size=self.bulk_batch_size,
+                                                                     concurrent_requests=concurrent_requests,
+                                                                     ignore_status=(409,))
+
+        self.__writer = threading.Thread(target=self.__write_periodically, daemon=True,
+                                         name='ElasticCacheWriter:{}'.format(self.cache_name))
+        self.__writer.start()
+        atexit.register(self.close)
+
+    def __write_periodically(self):
+        while not self.__closed.is_set():
+            self.__wake.wait(self.flush_interval)
+            self.__wake.clear()
+            self.flush()
+
+    def __build_entry(self, document) -> CacheEntry:
+        return CacheEntry(signature_hash=document['_id'], lookup_timestamp=document['_source']['lookup_timestamp'],
+                          encoded_response=base64.b64decode(document['_source']['encoded_response']),
+                          cache_name=document['_source'].get('cache_name'),
+                          username=document['_source'].get('username'))
+
+    @staticmethod
+    def __encode(encoded_response):
+        # Binary fields are sent as base64 strings
+        if isinstance(encoded_response, (bytes, bytearray)):
+            return base64.b64encode(encoded_response).decode('UTF-8')
+        return encoded_response
+
+    def lookup(self, signature_hash: str, min_timestamp: int = 0) -> Optional[CacheEntry]:
+        with self.__lock:
+            entry = self.pending.get(signature_hash)
+        if entry is None:
+            document = self.elastic_connection.find_by_id(self.index, signature_hash, alias_index=False)
+            if not document.get('found', False):
+                return None
+            entry = self.__build_entry(document)
+
+        return entry if entry.lookup_timestamp >= min_timestamp else None
+
+    def lookup_many(self, signature_hashes: List[str], min_timestamp: int = 0) -> Dict[str, CacheEntry]:
+        entries = {}
+        remaining = []
+        with self.__lock:
+            for signature_hash in signature_hashes:
+                entry = self.pending.get(signature_hash)
+                if entry is None:
+                    remaining.append(signature_hash)
+                elif entry.lookup_timestamp >= min_timestamp:
+                    entries[signature_hash] = entry
+
+        if len(remaining) > 0:
+            for document in self.elastic_connection.find_by_ids(self.index, remaining):
+                if document.get('found', False):
+                    entry = self.__build_entry(document)
+                    if entry.lookup_timestamp >= min_timestamp:
+                        entries[entry.signature_hash] = entry
+        return entries
+
+    def store(self, entry: CacheEntry):
+        self.store_many([entry])
+
+    def store_many(self, entries: List[CacheEntry]):
+        with self.__lock:
+            for entry in entries:
+                self.pending.pop(entry.signature_hash, None)
+                self.pending[entry.signature_hash] = entry
+            if len(self.pending) >= self.bulk_batch_size:
+                self.__wake.set()
+
+    def flush(self):
+        with self.__write_lock:
+            with self.__lock:
+                entries = list(self.pending.values())
+            if len(entries) == 0:
+                return
+
+            try:
+                for entry in entries:
+                    self.bulk_processor.index(index=self.index, _id=entry.signature_hash, entry={
+                        'signature_hash': entry.signature_hash, 'encoded_response': self.__encode(entry.encoded_response),
+                        'cache_name': entry.cache_name or self.cache_name, 'lookup_timestamp': entry.lookup_timestamp,
+                        'username': entry.username}, version=entry.lookup_timestamp, version_type='external_gte')
+                self.bulk_processor.flush()
+                logging.debug('Sent {} entries to elastic cache index {}'.format(len(entries), self.index))
+            except Exception as ex:
+                # The entries stay pending, so they are still served and are sent by the next flush
+                logging.exception('Error encountered while sending {} entries to elastic cache index {}: {}'
+                                  .format(len(entries), self.index, str(ex)))
+                return
+
+            with self.__lock:
+                for entry in entries:
+                    if self.pending.get(entry.signature_hash) is entry:
+                        self.pending.pop(entry.signature_hash)
+
+    def compact(self, min_timestamp: int) -> dict:
+        self.flush()
+        query = {"query": {"bool": {"filter": [{"term": {"cache_name": self.cache_name}},
+                                               {"range": {"lookup_timestamp": {"lt": min_timestamp}}}]}}}
+        expired = self.elastic_connection.delete_by_query(index=self.index, query=query).get('deleted', 0)
+        return {'expired': expired, 'superseded': 0, 'bytes_reclaimed': None}
+
+    def __query(self, min_timestamp, max_timestamp=None):
+        timestamp_range = {"gte": min_timestamp}
+        if max_timestamp is not None:
+            timestamp_range["lt"] = max_timestamp
+        return {"bool": {"filter": [{"term": {"cache_name": self.cache_name}},
+                                    {"range": {"lookup_timestamp": timestamp_range}}]}}
+
+    def iterate(self, min_timestamp: int = 0, max_timestamp: int = None, batch_size=1000) -> Iterator[CacheEntry]:
+        self.flush()
+        with self.elastic_connection.get_scroller() as scroller:
+            for document in scroller.query(self.index, {"size": batch_size, "sort": ["_doc"],
+                                                        "query": self.__query(min_timestamp, max_timestamp)}):
+                yield self.__build_entry(document)
+
+    def most_recent(self, count: int, min_timestamp: int = 0) -> List[CacheEntry]:
+        self.flush()
+        response = self.elastic_connection.search(self.index, {"size": count, "query": self.__query(min_timestamp),
+                                                               "sort": [{"lookup_timestamp": "desc"}]})
+        return [self.__build_entry(document) for document in response['hits']['hits']]
+
+    def close(self):
+        if self.__closed.is_set():
+            return
+        self.__closed.set()
+        self.__wake.set()
+        self.__writer.join()
+        self.flush()
+        self.bulk_processor.close()
+        atexit.unregister(self.close)
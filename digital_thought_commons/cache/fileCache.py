@@ -0,0 +1,229 @@
+import atexit
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+from .cacheBackend import CacheBackend, CacheEntry
+from .sqliteEngine import SQLiteEngine
+
+vacuum_modes = ['incremental', 'full', 'none']
+max_variables_per_query = 900
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    SQLite backed cache store.
+    Holds a single row per signature (writes are upserts) and groups writes into a single commit once
+    commit_batch_size writes are pending or commit_interval seconds have passed.  The SQLiteEngine may be shared with
+    the backends of other cache names using the same database file.
+    """
+
+    def __init__(self, engine: SQLiteEngine, cache_name, commit_batch_size=100, commit_interval=1.0,
+                 vacuum='incremental') -> None:
+        if vacuum.lower() not in vacuum_modes:
+            raise Exception('Unknown vacuum mode: {}.  Expected one of: {}'.format(vacuum, vacuum_modes))
+
+        self.engine = engine
+        self.cache_file = engine.database_file
+        self.cache_name = cache_name
+        self.commit_batch_size = max(int(commit_batch_size), 1)
+        self.commit_interval = commit_interval
+        self.vacuum = vacuum.lower()
+        self.pending = OrderedDict()
+        self.last_commit = time.monotonic()
+        self.__lock = threading.RLock()
+        self.__closed = threading.Event()
+
+        self.__create_table()
+
+        if self.commit_interval and self.commit_interval > 0:
+            self.__flusher = threading.Thread(target=self.__flush_periodically, daemon=True,
+                                              name='FileCacheFlusher:{}'.format(self.cache_name))
+            self.__flusher.start()
+        atexit.register(self.close)
+
+    def __create_table(self):
+        create_cache_table = """ CREATE TABLE IF NOT EXISTS cache (
+                                                id integer PRIMARY KEY,
+                                                signature_hash text NOT NULL,
+                                                lookup_timestamp integer,
+                                                encoded_response blob,
+                                                username text,
+                                                cache_name text
+                                            ); """
+        with self.engine.write_lock:
+            connection = self.engine.writer
+            with connection:
+                connection.execute(create_cache_table)
+                if not self.__index_exists('cache_signature_hash_idx'):
+                    self.__remove_superseded_rows()
+                    connection.execute('CREATE UNIQUE INDEX cache_signature_hash_idx ON cache(signature_hash)')
+                connection.execute('CREATE INDEX IF NOT EXISTS cache_signature_timestamp_idx '
+                                   'ON cache(signature_hash, lookup_timestamp)')
+                connection.execute('CREATE INDEX IF NOT EXISTS cache_lookup_timestamp_idx ON cache(lookup_timestamp)')
+                connection.execute('CREATE INDEX IF NOT EXISTS cache_name_timestamp_idx '
+                                   'ON cache(cache_name, lookup_timestamp)')
+
+    def __index_exists(self, index_name):
+        cursor = self.engine.writer.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (index_name,))
+        return cursor.fetchone() is not None
+
+    def __remove_superseded_rows(self):
+        # Caches created before upserts were used may hold several rows per signature.  Keep the newest.
+        cursor = self.engine.writer.execute("""DELETE FROM cache WHERE id NOT IN (
+                                                SELECT id FROM (
+                                                    SELECT id, ROW_NUMBER() OVER (PARTITION BY signature_hash
+                                                        ORDER BY lookup_timestamp DESC, id DESC) AS row_number
+                                                    FROM cache)
+                                                WHERE row_number = 1)""")
+        if cursor.rowcount > 0:
+            logging.info('Removed {} superseded rows from cache file {}'.format(cursor.rowcount, self.cache_file))
+
+    def __flush_periodically(self):
+        while not self.__closed.wait(self.commit_interval):
+            if len(self.pending) > 0 and time.monotonic() - self.last_commit >= self.commit_interval:
+                self.flush()
+
+    def lookup(self, signature_hash: str, min_timestamp: int = 0) -> Optional[CacheEntry]:
+        with self.__lock:
+            entry = self.pending.get(signature_hash)
+        if entry is not None:
+            return entry if entry.lookup_timestamp >= min_timestamp else None
+
+        rows = self.engine.read("SELECT lookup_timestamp, encoded_response FROM cache "
+                                "WHERE signature_hash=? AND lookup_timestamp>=?", (signature_hash, min_timestamp))
+        if len(rows) == 0:
+            return None
+        return CacheEntry(signature_hash=signature_hash, lookup_timestamp=rows[0][0], encoded_response=rows[0][1],
+                          cache_name=self.cache_name)
+
+    def lookup_many(self, signature_hashes: List[str], min_timestamp: int = 0) -> Dict[str, CacheEntry]:
+        entries = {}
+        remaining = []
+        with self.__lock:
+            for signature_hash in signature_hashes:
+                entry = self.pending.get(signature_hash)
+                if entry is None:
+                    remaining.append(signature_hash)
+                elif entry.lookup_timestamp >= min_timestamp:
+                    entries[signature_hash] = entry
+
+        for index in range(0, len(remaining), max_variables_per_query):
+            chunk = remaining[index:index + max_variables_per_query]
+            rows = self.engine.read("SELECT signature_hash, lookup_timestamp, encoded_response FROM cache "
+                                    "WHERE signature_hash IN ({}) AND lookup_timestamp>=?"
+                                    .format(','.join('?' * len(chunk))), (*chunk, min_timestamp))
+            for row in rows:
+                entries[row[0]] = CacheEntry(signature_hash=row[0], lookup_timestamp=row[1],
+                                             encoded_response=row[2], cache_name=self.cache_name)
+        return entries
+
+    def store(self, entry: CacheEntry):
+        with self.__lock:
+            self.pending.pop(entry.signature_hash, None)
+            self.pending[entry.signature_hash] = entry
+            if len(self.pending) >= self.commit_batch_size or (
+                    self.commit_interval is not None and time.monotonic() - self.last_commit >= self.commit_interval):
+                self.flush()
+
+    def store_many(self, entries: List[CacheEntry]):
+        with self.__lock:
+            for entry in entries:
+                self.pending.pop(entry.signature_hash, None)
+                self.pending[entry.signature_hash] = entry
+            self.flush()
+
+    def flush(self):
+        with self.__lock:
+            self.last_commit = time.monotonic()
+            if len(self.pending) == 0:
+                return
+
+            rows = [(entry.signature_hash, entry.lookup_timestamp, entry.encoded_response,
+                     entry.cache_name or self.cache_name, entry.username) for entry in self.pending.values()]
+            try:
+                self.engine.write_many(
+                    "INSERT INTO cache(signature_hash, lookup_timestamp, encoded_response, cache_name, username)"
+                    " VALUES(?,?,?,?,?) ON CONFLICT(signature_hash) DO UPDATE SET"
+                    " lookup_timestamp=excluded.lookup_timestamp, encoded_response=excluded.encoded_response,"
+                    " cache_name=excluded.cache_name, username=excluded.username"
+                    " WHERE excluded.lookup_timestamp>=cache.lookup_timestamp", rows)
+                logging.debug('Committed {} entries to cache file {}'.format(len(rows), self.cache_file))
+            except Exception as ex:
+                # The entries stay pending, so they are still served and are written by the next flush
+                logging.exception('Error encountered while committing {} entries to cache file {}: {}'
+                                  .format(len(rows), self.cache_file, str(ex)))
+                return
+            self.pending.clear()
+
+    def iterate(self, min_timestamp: int = 0, max_timestamp: int = None, batch_size=1000) -> Iterator[CacheEntry]:
+        self.flush()
+        if max_timestamp is None:
+            max_timestamp = sys.maxsize
+
+        last_id = 0
+        while True:
+            rows = self.engine.read("SELECT id, signature_hash, lookup_timestamp, encoded_response, username FROM cache "
+                                    "WHERE cache_name=? AND id>? AND lookup_timestamp>=? AND lookup_timestamp<? "
+                                    "ORDER BY id LIMIT ?", (self.cache_name, last_id, min_timestamp, max_timestamp,
+                                                            batch_size))
+            for row in rows:
+                yield CacheEntry(signature_hash=row[1], lookup_timestamp=row[2], encoded_response=row[3],
+                                 cache_name=self.cache_name, username=row[4])
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def most_recent(self, count: int, min_timestamp: int = 0) -> List[CacheEntry]:
+        self.flush()
+        rows = self.engine.read("SELECT signature_hash, lookup_timestamp, encoded_response, username FROM cache "
+                                "WHERE cache_name=? AND lookup_timestamp>=? ORDER BY lookup_timestamp DESC LIMIT ?",
+                                (self.cache_name, min_timestamp, count))
+        return [CacheEntry(signature_hash=row[0], lookup_timestamp=row[1], encoded_response=row[2],
+                           cache_name=self.cache_name, username=row[3]) for row in rows]
+
+    def __database_size(self):
+        return self.engine.pragma('page_size') * self.engine.pragma('page_count')
+
+    def compact(self, min_timestamp: int, vacuum=None) -> dict:
+        """
+        Deletes rows of this cache with a lookup_timestamp older than min_timestamp and then vacuums the database
+        file.  An incremental vacuum only releases free pages, a full vacuum rebuilds the file and blocks writers
+        while it runs.  The first incremental vacuum of a cache file created without auto_vacuum performs a full
+        vacuum to convert it.
+        """
+        vacuum = (vacuum or self.vacuum).lower()
+        if vacuum not in vacuum_modes:
+            raise Exception('Unknown vacuum mode: {}.  Expected one of: {}'.format(vacuum, vacuum_modes))
+
+        self.flush()
+        with self.engine.write_lock:
+            size_before = self.__database_size()
+            expired = self.engine.write('DELETE FROM cache WHERE lookup_timestamp<? AND cache_name=?',
+                                        (min_timestamp, self.cache_name))
+
+            if vacuum == 'full':
+                self.engine.execute_script('VACUUM;')
+            elif vacuum == 'incremental':
+                if self.engine.pragma('auto_vacuum') != 2:
+                    logging.info('Converting cache file {} to incremental auto vacuum'.format(self.cache_file))
+                    self.engine.execute_script('PRAGMA auto_vacuum=INCREMENTAL; VACUUM;')
+                else:
+                    # executescript steps the pragma to completion, execute would only free a single page
+                    self.engine.execute_script('PRAGMA incremental_vacuum;')
+            self.engine.execute_script('PRAGMA wal_checkpoint(TRUNCATE);')
+            size_after = self.__database_size()
+
+        return {'expired': expired, 'superseded': 0, 'bytes_reclaimed': max(size_before - size_after, 0)}
+
+    def close(self):
+        # The engine belongs to the registry and may be shared with other caches, so it is left open
+        with self.__lock:
+            if self.__closed.is_set():
+                return
+            self.flush()
+            self.__closed.set()
+        atexit.unregister(self.close)
@@ -0,0 +1,94 @@
+import argparse
+import json
+import logging
+from typing import Iterable, Iterator, List
+
+
+def migrate_keys(cache, list_of_kwargs: Iterable, batch_size=1000) -> int:
+    """
+    Copies the entries stored under the legacy signature hash of each lookup (arguments in call order, formatted with
+    str()) to its canonical signature hash, keeping their lookup_timestamp.  Signature hashes can not be reversed, so
+    the lookups to migrate must be supplied, e.g. the IP addresses previously enriched.  Each lookup is the keyword
+    arguments passed to APICache.lookup, or a (kwargs, legacy_key) pair for lookups made with
+    APICache.lookup_with_legacy_key, whose legacy hash is built from legacy_key instead.  Legacy entries are left to
+    expire and be removed by compaction.  Returns the number of entries migrated.
+    """
+    count = 0
+    batch = []
+    for kwargs in list_of_kwargs:
+        batch.append(kwargs)
+        if len(batch) >= batch_size:
+            count += _migrate_batch(cache, batch)
+            batch = []
+
+    if len(batch) > 0:
+        count += _migrate_batch(cache, batch)
+    cache.backend.flush()
+
+    logging.info('Migrated {} entries of cache {} to canonical keys'.format(count, cache.cache_name))
+    return count
+
+
+def _migrate_batch(cache, batch: List) -> int:
+    legacy_hashes = {}
+    for lookup in batch:
+        kwargs, legacy_key = (lookup, None) if isinstance(lookup, dict) else lookup
+        signature_hash = cache._generate_hash(kwargs)
+        legacy_hash = cache._legacy_hash(kwargs if legacy_key is None else legacy_key)
+        if legacy_hash != signature_hash:
+            legacy_hashes[signature_hash] = legacy_hash
+
+    # Lookups already stored under their canonical key are not overwritten by an older legacy entry
+    existing = cache.backend.lookup_many(list(legacy_hashes.keys()))
+    return len(cache._migrate_entries({signature_hash: legacy_hash for signature_hash, legacy_hash
+                                       in legacy_hashes.items() if signature_hash not in existing}, 0))
+
+
+def read_lookups(lookups_file) -> Iterator:
+    with open(lookups_file, 'r', encoding='UTF-8') as lookups:
+        for line in lookups:
+            if line.strip():
+                yield json.loads(line)
+
+
+# -----------------------------------------------------------------------------
+# Main entry point
+# -----------------------------------------------------------------------------
+
+def main():
+    from digital_thought_commons import logging as logger
+    from digital_thought_commons.cache import get_cache
+
+    logger.init(app_name='digital-thought-api-cache-migrate-keys')
+
+    arg_parser = argparse.ArgumentParser(prog='python -m digital_thought_commons.cache.keyMigration',
+                                         description='Rehash APICache entries to canonical cache keys')
+    arg_parser.add_argument('--cache-name', action='store', type=str, required=True, help="Name of the cache")
+    arg_parser.add_argument('--lookups', action='store', type=str, required=True,
+                            help="NDJSON file holding the keyword arguments of one lookup per line, or a "
+                                 "[kwargs, legacy_key] pair, e.g. [{\"query_url\": \"whois/?domain=example.com\"}, "
+                                 "{\"query_url\": \"whois/?domain=Example.com.\"}]")
+    arg_parser.add_argument('--config', action='store', type=str, required=False,
+                            help="Cache configuration file selecting the backend to migrate")
+    arg_parser.add_argument('--normalize-ip', action='append', type=str, required=False, default=[],
+                            help="Argument holding an IP address, normalised as the lookup client does")
+    arg_parser.add_argument('--normalize-domain', action='append', type=str, required=False, default=[],
+                            help="Argument holding a domain name, normalised as the lookup client does")
+
+    args = arg_parser.parse_args()
+
+    from .cacheKey import normalize_domain, normalize_ip
+
+    cache = get_cache(args.cache_name, custom_config_file=args.config)
+    for argument in args.normalize_ip:
+        cache.add_key_normalizer(argument, normalize_ip)
+    for argument in args.normalize_domain:
+        cache.add_key_normalizer(argument, normalize_domain)
+    try:
+        migrate_keys(cache, read_lookups(args.lookups))
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class EvictionPolicy:
+
+    def record_access(self, key):
+        raise NotImplementedError
+
+    def prepare_admission(self, key):
+        pass
+
+    def select_victim(self, incoming_key=None):
+        raise NotImplementedError
+
+    def record_admission(self, key):
+        raise NotImplementedError
+
+    def record_removal(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+
+    def __init__(self, capacity=None) -> None:
+        self.order = OrderedDict()
+
+    def record_access(self, key):
+        self.order.move_to_end(key)
+
+    def select_victim(self, incoming_key=None):
+        key, _ = self.order.popitem(last=False)
+        return key
+
+    def record_admission(self, key):
+        self.order[key] = None
+
+    def record_removal(self, key):
+        self.order.pop(key, None)
+
+    def clear(self):
+        self.order.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Least Frequently Used, with ties broken by least recently used.  Keys are bucketed by access frequency so that
+    every operation is O(1).
+    """
+
+    def __init__(self, capacity=None) -> None:
+        self.frequencies = {}
+        self.buckets = {}
+        self.min_frequency = 0
+
+    def __bucket_remove(self, key, frequency):
+        bucket = self.buckets[frequency]
+        bucket.pop(key)
+        if len(bucket) == 0:
+            self.buckets.pop(frequency)
+            if self.min_frequency == frequency:
+                self.min_frequency = frequency + 1
+
+    def record_access(self, key):
+        frequency = self.frequencies[key]
+        self.__bucket_remove(key, frequency)
+        self.frequencies[key] = frequency + 1
+        self.buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    def select_victim(self, incoming_key=None):
+        if self.min_frequency not in self.buckets:
+            self.min_frequency = min(self.buckets)
+        key, _ = self.buckets[self.min_frequency].popitem(last=False)
+        if len(self.buckets[self.min_frequency]) == 0:
+            self.buckets.pop(self.min_frequency)
+        self.frequencies.pop(key)
+        return key
+
+    def record_admission(self, key):
+        self.frequencies[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_frequency = 1
+
+    def record_removal(self, key):
+        if key in self.frequencies:
+            self.__bucket_remove(key, self.frequencies.pop(key))
+
+    def clear(self):
+        self.frequencies.clear()
+        self.buckets.clear()
+        self.min_frequency = 0
+
+
+class ARCPolicy(EvictionPolicy):
+    """
+    Adaptive Replacement Cache (Megiddo & Modha).  Balances recency (T1) against frequency (T2) using ghost lists
+    (B1, B2) of recently evicted keys.  When the cache is only bounded by bytes, the number of resident entries is
+    used as the target capacity.
+    """
+
+    def __init__(self, capacity=None) -> None:
+        self.capacity = capacity
+        self.target = 0.0
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+        self.incoming_from_b2 = False
+
+    def __capacity(self):
+        if self.capacity:
+            return self.capacity
+        return max(len(self.t1) + len(self.t2), 1)
+
+    def record_access(self, key):
+        if key in self.t1:
+            self.t1.pop(key)
+        else:
+            self.t2.pop(key)
+        self.t2[key] = None
+
+    def prepare_admission(self, key):
+        capacity = self.__capacity()
+        self.incoming_from_b2 = False
+        if key in self.b1:
+            self.target = min(capacity, self.target + max(len(self.b2) / len(self.b1), 1))
+        elif key in self.b2:
+            self.target = max(0.0, self.target - max(len(self.b1) / len(self.b2), 1))
+            self.incoming_from_b2 = True
+
+    def select_victim(self, incoming_key=None):
+        if len(self.t1) > 0 and (len(self.t1) > self.target or (self.incoming_from_b2 and len(self.t1) == self.target)
+                                 or len(self.t2) == 0):
+            key, _ = self.t1.popitem(last=False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last=False)
+            self.b2[key] = None
+        return key
+
+    def record_admission(self, key):
+        if key in self.b1 or key in self.b2:
+            self.b1.pop(key, None)
+            self.b2.pop(key, None)
+            self.t2[key] = None
+        else:
+            self.t1[key] = None
+
+        capacity = self.__capacity()
+        while len(self.b1) > 0 and len(self.t1) + len(self.b1) > capacity:
+            self.b1.popitem(last=False)
+        while len(self.b1) + len(self.b2) > capacity:
+            if len(self.b2) > 0:
+                self.b2.popitem(last=False)
+            else:
+                self.b1.popitem(last=False)
+
+    def record_removal(self, key):
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+
+    def clear(self):
+        self.t1.clear()
+        self.t2.clear()
+        self.b1.clear()
+        self.b2.clear()
+        self.target = 0.0
+
+
+eviction_policies = {'lru': LRUPolicy, 'lfu': LFUPolicy, 'arc': ARCPolicy}
+
+
+def size_of(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return sys.getsizeof(obj)
+
+
+class MemoryCache:
+    """
+    Thread safe in-process cache with O(1) lookup and insertion.
+    Entries are evicted by the selected policy (lru, lfu or arc) once either max_entries or max_bytes is exceeded.
+    A value of 0 or None for either limit disables that limit.  Entries put with a ttl (in milliseconds) are dropped
+    on the first lookup after they expire.
+    """
+
+    def __init__(self, name, max_entries=None, max_bytes=None, policy='lru', sizeof=size_of) -> None:
+        if policy.lower() not in eviction_policies:
+            raise Exception('Unknown Eviction Policy: {}.  Expected one of: {}'.format(policy, list(eviction_policies)))
+
+        self.name = name
+        self.max_entries = max_entries or None
+        self.max_bytes = max_bytes or None
+        self.policy_name = policy.lower()
+        self.policy: EvictionPolicy = eviction_policies[self.policy_name](self.max_entries)
+        self.sizeof = sizeof
+        self.entries = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __over_budget(self, incoming_entries, incoming_bytes):
+        if self.max_entries and len(self.entries) + incoming_entries > self.max_entries:
+            return True
+        if self.max_bytes and self.current_bytes + incoming_bytes > self.max_bytes:
+            return True
+        return False
+
+    def __evict(self, incoming_key, incoming_entries, incoming_bytes):
+        while len(self.entries) > 0 and self.__over_budget(incoming_entries, incoming_bytes):
+            victim = self.policy.select_victim(incoming_key)
+            _, size, _ = self.entries.pop(victim)
+            self.current_bytes -= size
+            self.evictions += 1
+            logging.debug("Cache Full. Evicted key %s from MemoryCache: %s", victim, self.name)
+
+    def put(self, key, obj, ttl=None):
+        size = self.sizeof(obj)
+        if self.max_bytes and size > self.max_bytes:
+            logging.debug("Object for key %s exceeds byte budget of MemoryCache: %s", key, self.name)
+            self.remove(key)
+            return
+
+        expires = time.monotonic() + ttl / 1000 if ttl else None
+        with self.__lock:
+            if key in self.entries:
+                # Replacing a cached key counts as an access, so ARC promotes it to T2 rather than readmitting it to T1
+                _, previous_size, _ = self.entries[key]
+                self.entries[key] = (obj, size, expires)
+                self.current_bytes += size - previous_size
+                self.policy.record_access(key)
+                self.__evict(key, 0, 0)
+                return
+
+            self.policy.prepare_admission(key)
+            self.__evict(key, 1, size)
+            self.entries[key] = (obj, size, expires)
+            self.current_bytes += size
+            self.policy.record_admission(key)
+
+    def lookup(self, key):
+        with self.__lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self.entries.pop(key)
+                self.current_bytes -= entry[1]
+                self.policy.record_removal(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.policy.record_access(key)
+            return entry[0]
+
+    def remove(self, key):
+        with self.__lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry[1]
+            self.policy.record_removal(key)
+            return entry[0]
+
+    def clear(self):
+        with self.__lock:
+            self.entries.clear()
+            self.policy.clear()
+            self.current_bytes = 0
+
+    def items(self):
+        with self.__lock:
+            return {key: entry[0] for key, entry in self.entries.items()}
+
+    def keys(self):
+        with self.__lock:
+            return list(self.entries.keys())
+
+    def stats(self):
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {'name': self.name, 'policy': self.policy_name, 'entries': len(self.entries),
+                    'bytes': self.current_bytes, 'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_ratio': self.hits / lookups if lookups > 0 else 0.0}
+
+
+class QueueCache(MemoryCache):
+    """
+    Retained for backwards compatibility.  A MemoryCache bounded by entry count using LRU eviction.
+    """
+
+    def __init__(self, size, name) -> None:
+        super().__init__(name=name, max_entries=size, policy='lru')
+        self.size = size
@@ -0,0 +1,145 @@
+import bisect
+import logging
+import threading
+import time
+from typing import List
+
+latency_bounds_ms = [0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+age_bounds_ms = [60000, 600000, 3600000, 21600000, 43200000, 86400000, 172800000, 345600000, 604800000,
+                 1209600000, 2592000000]
+
+counter_names = ['memory_hits', 'backend_hits', 'stale_hits', 'misses', 'live_fetches', 'coalesced',
+                 'suspended_lookups', 'error_responses', 'live_errors', 'backend_errors', 'entries_stored',
+                 'bytes_stored']
+
+
+class Histogram:
+    """
+    Fixed bucket histogram.  Each bucket counts observations less than or equal to its bound, the last bucket counts
+    everything above the largest bound.  Percentiles are estimated as the bound of the bucket they fall in, capped at
+    the largest observation.
+    """
+
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.__lock = threading.Lock()
+
+    def record(self, value: float):
+        with self.__lock:
+            self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def __percentile(self, percentile):
+        rank = percentile * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            if self.count == 0:
+                return {'count': 0}
+            buckets = {'le_{}'.format(bound): count for bound, count in zip(self.bounds, self.buckets)}
+            buckets['le_inf'] = self.buckets[-1]
+            return {'count': self.count, 'mean': self.total / self.count, 'min': self.min, 'max': self.max,
+                    'p50': self.__percentile(0.5), 'p95': self.__percentile(0.95), 'p99': self.__percentile(0.99),
+                    'buckets': buckets}
+
+    def reset(self):
+        with self.__lock:
+            self.buckets = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+
+class CacheMetrics:
+    """
+    Counters and latency histograms (in milliseconds) for a single APICache.  Latencies are recorded for the memory
+    tier, the persistent backend, backend writes and live lookups.  The age of entries served by the backend is also
+    recorded, which shows how much of the hit rate depends on max_age.  A lookup that waits for the live lookup of
+    another caller in flight for the same signature is counted as coalesced rather than as a miss, so misses match
+    the live lookups made.
+    """
+
+    def __init__(self, cache_name) -> None:
+        self.cache_name = cache_name
+        self.counters = dict.fromkeys(counter_names, 0)
+        self.latency = {tier: Histogram(latency_bounds_ms) for tier in ['memory', 'backend', 'store', 'live']}
+        self.backend_hit_age = Histogram(age_bounds_ms)
+        self.started = time.time()
+        self.__lock = threading.Lock()
+
+    def increment(self, counter, amount=1):
+        with self.__lock:
+            self.counters[counter] += amount
+
+    def observe(self, tier, start):
+        """
+        Records the time elapsed since start, a time.perf_counter() value, against tier.
+        """
+        self.latency[tier].record((time.perf_counter() - start) * 1000)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['backend_hits'] + counters['misses'] + counters['coalesced']
+        stats = {'cache_name': self.cache_name, 'uptime_seconds': int(time.time() - self.started),
+                 'lookups': lookups}
+        stats.update(counters)
+        stats['memory_hit_ratio'] = counters['memory_hits'] / lookups if lookups > 0 else 0.0
+        stats['hit_ratio'] = (counters['memory_hits'] + counters['backend_hits']) / lookups if lookups > 0 else 0.0
+        stats['latency_ms'] = {tier: histogram.snapshot() for tier, histogram in self.latency.items()}
+        stats['backend_hit_age_ms'] = self.backend_hit_age.snapshot()
+        return stats
+
+    def reset(self):
+        with self.__lock:
+            self.counters = dict.fromkeys(counter_names, 0)
+        for histogram in list(self.latency.values()) + [self.backend_hit_age]:
+            histogram.reset()
+        self.started = time.time()
+
+
+class MetricsReporter(threading.Thread):
+    """
+    Periodically logs the stats() of a set of caches.  The stats are attached to the record as extra, so the
+    Elasticsearch log handler indexes them as a document when it is configured for logger_name.
+    """
+
+    def __init__(self, caches: List, interval: float, logger_name='api_cache_metrics') -> None:
+        threading.Thread.__init__(self, name='CacheMetricsReporter', daemon=True)
+        self.caches = caches
+        self.interval = interval
+        self.logger = logging.getLogger(logger_name)
+        self.__stop_event = threading.Event()
+
+    def report(self):
+        for cache in self.caches:
+            try:
+                stats = cache.stats()
+                self.logger.info('API cache statistics for {}: {} lookups, {:.1%} hit ratio, {} live fetches, {} errors'
+                                 .format(cache.cache_name, stats['lookups'], stats['hit_ratio'], stats['live_fetches'],
+                                         stats['live_errors'] + stats['backend_errors']), extra={'extra': stats})
+            except Exception as ex:
+                logging.exception('Error encountered while reporting statistics for cache {}: {}'
+                                  .format(cache.cache_name, str(ex)))
+
+    def run(self) -> None:
+        while not self.__stop_event.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        self.__stop_event.set()
@@ -0,0 +1,134 @@
+import base64
+import json
+import logging
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAME_MAGIC = 0xDC
+
+FORMAT_JSON = 1
+FORMAT_MSGPACK = 2
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+serializers = ['auto', 'json', 'orjson', 'msgpack']
+compressions = ['none', 'zlib', 'zstd']
+
+
+class PayloadCodec:
+    """
+    Converts cached responses between objects, serialized payloads and stored values.
+
+    Serialized payloads (held by the memory cache) are produced by the configured serializer.  Stored values are
+    framed: a magic byte, the payload format and the compression used, followed by the payload, which is compressed
+    when it is at least compression_threshold bytes long.  Values written before framing was introduced (base64
+    encoded JSON text) are still decoded.
+    """
+
+    def __init__(self, serializer='auto', compression='zlib', compression_level=6, compression_threshold=1024) -> None:
+        serializer = serializer.lower()
+        compression = compression.lower()
+        if serializer not in serializers:
+            raise Exception('Unknown serializer: {}.  Expected one of: {}'.format(serializer, serializers))
+        if compression not in compressions:
+            raise Exception('Unknown compression: {}.  Expected one of: {}'.format(compression, compressions))
+
+        if serializer == 'auto':
+            serializer = 'orjson' if orjson is not None else 'json'
+        elif serializer == 'orjson' and orjson is None:
+            logging.warning('orjson is not installed.  Falling back to json serializer')
+            serializer = 'json'
+        elif serializer == 'msgpack' and msgpack is None:
+            logging.warning('msgpack is not installed.  Falling back to json serializer')
+            serializer = 'json'
+
+        if compression == 'zstd' and zstandard is None:
+            logging.warning('zstandard is not installed.  Falling back to zlib compression')
+            compression = 'zlib'
+
+        self.serializer = serializer
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_threshold = compression_threshold
+        self.payload_format = FORMAT_MSGPACK if serializer == 'msgpack' else FORMAT_JSON
+
+    def serialize(self, obj) -> bytes:
+        return self.__serialize(obj, self.payload_format)
+
+    def deserialize(self, payload: bytes):
+        return self.__deserialize(payload, self.payload_format)
+
+    def __serialize(self, obj, payload_format) -> bytes:
+        if payload_format == FORMAT_MSGPACK:
+            return msgpack.packb(obj, use_bin_type=True)
+        if orjson is not None and self.serializer == 'orjson':
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj).encode('UTF-8')
+
+    def __deserialize(self, payload: bytes, payload_format):
+        if payload_format == FORMAT_MSGPACK:
+            if msgpack is None:
+                raise Exception('Cached payload is msgpack encoded, but msgpack is not installed')
+            return msgpack.unpackb(payload, raw=False)
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+    def encode(self, payload: bytes) -> bytes:
+        """
+        Frames a serialized payload for storage, compressing it when it is large enough.
+        """
+        compression = COMPRESSION_NONE
+        if self.compression != 'none' and len(payload) >= self.compression_threshold:
+            if self.compression == 'zstd':
+                compression = COMPRESSION_ZSTD
+                payload = zstandard.ZstdCompressor(level=self.compression_level).compress(payload)
+            else:
+                compression = COMPRESSION_ZLIB
+                payload = zlib.compress(payload, self.compression_level)
+
+        return bytes((FRAME_MAGIC, self.payload_format, compression)) + payload
+
+    def decode(self, value) -> bytes:
+        """
+        Converts a stored value back to a payload produced by the configured serializer.
+        """
+        if isinstance(value, str):
+            value = base64.b64decode(value)
+        value = bytes(value)
+
+        if len(value) < 3 or value[0] != FRAME_MAGIC:
+            payload_format = FORMAT_JSON
+            payload = value
+        else:
+            payload_format = value[1]
+            compression = value[2]
+            payload = value[3:]
+            if compression == COMPRESSION_ZLIB:
+                payload = zlib.decompress(payload)
+            elif compression == COMPRESSION_ZSTD:
+                if zstandard is None:
+                    raise Exception('Cached payload is zstd compressed, but zstandard is not installed')
+                payload = zstandard.ZstdDecompressor().decompress(payload)
+            elif compression != COMPRESSION_NONE:
+                raise Exception('Unknown compression in cached payload: {}'.format(compression))
+
+        if payload_format != self.payload_format:
+            payload = self.__serialize(self.__deserialize(payload, payload_format), self.payload_format)
+        return payload
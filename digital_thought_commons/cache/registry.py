@@ -0,0 +1,90 @@
+import os
+import threading
+
+import yaml
+
+from .sqliteEngine import SQLiteEngine
+
+
+class CacheRegistry:
+    """
+    Process wide registry of cache configuration, SQLite engines and APICache instances.
+    Configuration files are parsed once, each database file is opened by a single SQLiteEngine and each cache name
+    (per configuration file) maps to a single APICache and an AsyncAPICache using its tiers, so lookup classes created
+    on many threads share connections.
+    """
+
+    def __init__(self) -> None:
+        self.configurations = {}
+        self.engines = {}
+        self.caches = {}
+        self.async_caches = {}
+        self.backoffs = {}
+        self.__lock = threading.RLock()
+
+    def configuration(self, configuration_file) -> dict:
+        key = os.path.abspath(configuration_file)
+        with self.__lock:
+            if key not in self.configurations:
+                with open(configuration_file, 'r') as config_file:
+                    self.configurations[key] = yaml.safe_load(config_file)
+            return self.configurations[key]
+
+    def engine(self, database_file, journal_mode='wal', synchronous='normal', busy_timeout=5000) -> SQLiteEngine:
+        key = os.path.abspath(database_file)
+        with self.__lock:
+            if key not in self.engines:
+                self.engines[key] = SQLiteEngine(database_file=database_file, journal_mode=journal_mode,
+                                                 synchronous=synchronous, busy_timeout=busy_timeout)
+            return self.engines[key]
+
+    def get_cache(self, cache_name, custom_config_file: str = None):
+        from . import APICache
+
+        key = (os.path.abspath(custom_config_file) if custom_config_file else None, cache_name)
+        with self.__lock:
+            if key not in self.caches:
+                self.caches[key] = APICache(cache_name, custom_config_file=custom_config_file)
+            return self.caches[key]
+
+    def get_async_cache(self, cache_name, custom_config_file: str = None):
+        from .asyncCache import AsyncAPICache
+
+        key = (os.path.abspath(custom_config_file) if custom_config_file else None, cache_name)
+        with self.__lock:
+            if key not in self.async_caches:
+                self.async_caches[key] = AsyncAPICache(cache_name, custom_config_file=custom_config_file,
+                                                       api_cache=self.get_cache(cache_name, custom_config_file))
+            return self.async_caches[key]
+
+    def back_off(self, cache_name, until: int):
+        """
+        Suspends live lookups for cache_name until the epoch time in milliseconds, shared by every APICache and
+        AsyncAPICache of that name.
+        """
+        with self.__lock:
+            self.backoffs[cache_name] = max(self.backoffs.get(cache_name, 0), until)
+
+    def backing_off_until(self, cache_name) -> int:
+        return self.backoffs.get(cache_name, 0)
+
+    def close(self):
+        with self.__lock:
+            for cache in list(self.caches.values()) + list(self.async_caches.values()):
+                cache.close()
+            for engine in self.engines.values():
+                engine.close()
+            self.caches.clear()
+            self.async_caches.clear()
+            self.engines.clear()
+
+
+registry = CacheRegistry()
+
+
+def get_cache(cache_name, custom_config_file: str = None):
+    return registry.get_cache(cache_name, custom_config_file=custom_config_file)
+
+
+def get_async_cache(cache_name, custom_config_file: str = None):
+    return registry.get_async_cache(cache_name, custom_config_file=custom_config_file)
@@ -0,0 +1,53 @@
+import threading
+
+
+class SingleFlightCall:
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error: Exception = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key.  The first caller runs the function, callers arriving while it is in
+    flight wait for and share its result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self.calls = {}
+        self.__lock = threading.Lock()
+
+    def in_flight(self, key) -> bool:
+        with self.__lock:
+            return key in self.calls
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Returns a tuple of the result and whether it was shared from another caller's call.
+        """
+        with self.__lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = SingleFlightCall()
+                self.calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self.__lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
@@ -0,0 +1,118 @@
+import argparse
+import base64
+import gzip
+import json
+import logging
+import time
+from typing import Iterator
+
+from .cacheBackend import CacheEntry
+
+snapshot_version = 1
+
+
+def export_snapshot(cache, snapshot_file, min_timestamp: int = 0, max_timestamp: int = None) -> int:
+    """
+    Writes the entries of an APICache with a lookup_timestamp in [min_timestamp, max_timestamp) to a gzip compressed
+    NDJSON snapshot.  The first line is a header naming the cache, every following line is one entry.  Returns the
+    number of entries written.
+    """
+    count = 0
+    with gzip.open(snapshot_file, 'wt', encoding='UTF-8') as snapshot:
+        snapshot.write(json.dumps({'snapshot_version': snapshot_version, 'cache_name': cache.cache_name,
+                                   'created': int(round(time.time() * 1000)), 'min_timestamp': min_timestamp,
+                                   'max_timestamp': max_timestamp}) + '\n')
+        for entry in cache.backend.iterate(min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+            encoded_response = entry.encoded_response
+            if isinstance(encoded_response, str):
+                # Entries written before the payload codec are re-encoded so snapshots only hold framed payloads
+                encoded_response = cache.codec.encode(cache.codec.decode(encoded_response))
+            snapshot.write(json.dumps({'signature_hash': entry.signature_hash,
+                                       'lookup_timestamp': entry.lookup_timestamp,
+                                       'encoded_response': base64.b64encode(encoded_response).decode('UTF-8'),
+                                       'username': entry.username}) + '\n')
+            count += 1
+
+    logging.info('Exported {} entries of cache {} to {}'.format(count, cache.cache_name, snapshot_file))
+    return count
+
+
+def read_snapshot(snapshot_file) -> Iterator[dict]:
+    with gzip.open(snapshot_file, 'rt', encoding='UTF-8') as snapshot:
+        for line in snapshot:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_snapshot(cache, snapshot_file, min_timestamp: int = 0, batch_size=1000) -> int:
+    """
+    Stores the entries of a snapshot created by export_snapshot in the backend of an APICache, skipping entries
+    older than min_timestamp.  Signature hashes include the cache name, so the snapshot must have been exported from
+    a cache of the same name.  Returns the number of entries imported.
+    """
+    records = read_snapshot(snapshot_file)
+    header = next(records, None)
+    if header is None or header.get('snapshot_version') != snapshot_version:
+        raise Exception('{} is not a supported cache snapshot'.format(snapshot_file))
+    if header['cache_name'] != cache.cache_name:
+        raise Exception('Snapshot {} holds cache {}, it can not be imported into cache {}'
+                        .format(snapshot_file, header['cache_name'], cache.cache_name))
+
+    count = 0
+    entries = []
+    for record in records:
+        if record['lookup_timestamp'] < min_timestamp:
+            continue
+        entries.append(CacheEntry(signature_hash=record['signature_hash'], lookup_timestamp=record['lookup_timestamp'],
+                                  encoded_response=base64.b64decode(record['encoded_response']),
+                                  cache_name=cache.cache_name, username=record.get('username')))
+        if len(entries) >= batch_size:
+            cache.backend.store_many(entries)
+            count += len(entries)
+            entries = []
+
+    if len(entries) > 0:
+        cache.backend.store_many(entries)
+        count += len(entries)
+    cache.backend.flush()
+
+    logging.info('Imported {} entries from {} into cache {}'.format(count, snapshot_file, cache.cache_name))
+    return count
+
+
+# -----------------------------------------------------------------------------
+# Main entry point
+# -----------------------------------------------------------------------------
+
+def main():
+    from digital_thought_commons import logging as logger
+    from digital_thought_commons.cache import get_cache
+
+    logger.init(app_name='digital-thought-api-cache-snapshot')
+
+    arg_parser = argparse.ArgumentParser(prog='python -m digital_thought_commons.cache.snapshot',
+                                         description='Export and import APICache snapshots')
+    arg_parser.add_argument('action', choices=['export', 'import'])
+    arg_parser.add_argument('--cache-name', action='store', type=str, required=True, help="Name of the cache")
+    arg_parser.add_argument('--file', action='store', type=str, required=True, help="Path of the snapshot file")
+    arg_parser.add_argument('--config', action='store', type=str, required=False,
+                            help="Cache configuration file selecting the backend to export from or import into")
+    arg_parser.add_argument('--min-timestamp', action='store', type=int, required=False, default=0,
+                            help="Only export entries looked up at or after this epoch time in milliseconds")
+    arg_parser.add_argument('--max-timestamp', action='store', type=int, required=False,
+                            help="Only export entries looked up before this epoch time in milliseconds")
+
+    args = arg_parser.parse_args()
+
+    cache = get_cache(args.cache_name, custom_config_file=args.config)
+    try:
+        if args.action == 'export':
+            cache.export_snapshot(args.file, min_timestamp=args.min_timestamp, max_timestamp=args.max_timestamp)
+        else:
+            cache.import_snapshot(args.file)
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import _sqlite3
+import atexit
+import logging
+import threading
+
+journal_modes = ['wal', 'delete', 'truncate', 'persist', 'memory', 'off']
+synchronous_modes = ['off', 'normal', 'full', 'extra']
+
+
+class SQLiteEngine:
+    """
+    Thread safe access to a single SQLite database file.
+    Each thread reads through its own connection, so lookups run concurrently under WAL journaling.  All writes go
+    through one writer connection and are serialised by a lock, which avoids 'database is locked' errors between
+    writers in the same process.
+    """
+
+    def __init__(self, database_file, journal_mode='wal', synchronous='normal', busy_timeout=5000) -> None:
+        if journal_mode.lower() not in journal_modes:
+            raise Exception('Unknown SQLite journal mode: {}.  Expected one of: {}'.format(journal_mode, journal_modes))
+        if synchronous.lower() not in synchronous_modes:
+            raise Exception('Unknown SQLite synchronous mode: {}.  Expected one of: {}'.format(synchronous, synchronous_modes))
+
+        self.database_file = database_file
+        self.journal_mode = journal_mode.upper()
+        self.synchronous = synchronous.upper()
+        self.busy_timeout = int(busy_timeout)
+        self.write_lock = threading.RLock()
+        self.__local = threading.local()
+        self.__readers = {}
+        self.__readers_lock = threading.Lock()
+        self.__closed = False
+
+        self.writer = self.__connect()
+        # Only takes effect on new database files, existing files are converted by their first full vacuum
+        self.writer.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.writer.execute('PRAGMA journal_mode={}'.format(self.journal_mode))
+        atexit.register(self.close)
+        logging.debug('Opened SQLite engine for {}'.format(self.database_file))
+
+    def __connect(self):
+        connection = _sqlite3.connect(self.database_file, check_same_thread=False, timeout=self.busy_timeout / 1000)
+        connection.execute('PRAGMA synchronous={}'.format(self.synchronous))
+        connection.execute('PRAGMA busy_timeout={}'.format(self.busy_timeout))
+        return connection
+
+    def __reader(self):
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            if self.__closed:
+                raise Exception('SQLite engine for {} has been closed'.format(self.database_file))
+            connection = self.__connect()
+            self.__local.connection = connection
+            with self.__readers_lock:
+                # Connections of threads that have since finished are closed here
+                for thread in [thread for thread in self.__readers if not thread.is_alive()]:
+                    self.__readers.pop(thread).close()
+                self.__readers[threading.current_thread()] = connection
+        return connection
+
+    def read(self, sql, parameters=()):
+        return self.__reader().execute(sql, parameters).fetchall()
+
+    def write(self, sql, parameters=()) -> int:
+        with self.write_lock:
+            with self.writer:
+                return self.writer.execute(sql, parameters).rowcount
+
+    def write_many(self, sql, rows) -> int:
+        with self.write_lock:
+            with self.writer:
+                return self.writer.executemany(sql, rows).rowcount
+
+    def execute_script(self, script):
+        with self.write_lock:
+            self.writer.executescript(script)
+
+    def pragma(self, name):
+        with self.write_lock:
+            return self.writer.execute('PRAGMA {}'.format(name)).fetchone()[0]
+
+    def close(self):
+        with self.write_lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            with self.__readers_lock:
+                for connection in self.__readers.values():
+                    connection.close()
+                self.__readers.clear()
+            self.writer.close()
+        atexit.unregister(self.close)
@@ -0,0 +1,116 @@
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .cacheBackend import CacheBackend, CacheEntry
+
+
+class TieredCacheBackend(CacheBackend):
+    """
+    Read-through hierarchy of a local cache store (normally the SQLite file backend) in front of a shared store
+    (normally the Elasticsearch backend) used by every node.
+    Lookups are answered by the local tier first and only misses are sent to the shared tier.  Shared hits are promoted
+    into the local tier with their original lookup_timestamp, so they expire at the same time on every node.  Writes
+    are committed to the local tier and queued for the shared tier, which sends them in the background.
+    """
+
+    def __init__(self, local: CacheBackend, shared: CacheBackend, promote=True) -> None:
+        self.local = local
+        self.shared = shared
+        self.promote = promote
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'promotions': 0, 'shared_errors': 0}
+        self.__lock = threading.Lock()
+
+    def __increment(self, counter, amount=1):
+        with self.__lock:
+            self.counters[counter] += amount
+
+    def __promote(self, entries: List[CacheEntry]):
+        if not self.promote or len(entries) == 0:
+            return
+        try:
+            self.local.store_many(entries)
+            self.__increment('promotions', len(entries))
+        except Exception as ex:
+            logging.exception('Error encountered while promoting {} entries to the local cache tier: {}'
+                              .format(len(entries), str(ex)))
+
+    def lookup(self, signature_hash: str, min_timestamp: int = 0) -> Optional[CacheEntry]:
+        entry = self.local.lookup(signature_hash, min_timestamp=min_timestamp)
+        if entry is not None:
+            self.__increment('local_hits')
+            return entry
+
+        try:
+            entry = self.shared.lookup(signature_hash, min_timestamp=min_timestamp)
+        except Exception as ex:
+            # The local tier keeps serving when the shared tier is unavailable
+            self.__increment('shared_errors')
+            logging.exception('Error encountered while looking up signature {} in the shared cache tier: {}'
+                              .format(signature_hash, str(ex)))
+            return None
+
+        if entry is not None:
+            self.__increment('shared_hits')
+            self.__promote([entry])
+        return entry
+
+    def lookup_many(self, signature_hashes: List[str], min_timestamp: int = 0) -> Dict[str, CacheEntry]:
+        entries = self.local.lookup_many(signature_hashes, min_timestamp=min_timestamp)
+        self.__increment('local_hits', len(entries))
+
+        remaining = [signature_hash for signature_hash in signature_hashes if signature_hash not in entries]
+        if len(remaining) > 0:
+            try:
+                shared_entries = self.shared.lookup_many(remaining, min_timestamp=min_timestamp)
+            except Exception as ex:
+                self.__increment('shared_errors')
+                logging.exception('Error encountered while looking up {} signatures in the shared cache tier: {}'
+                                  .format(len(remaining), str(ex)))
+                return entries
+
+            self.__increment('shared_hits', len(shared_entries))
+            self.__promote(list(shared_entries.values()))
+            entries.update(shared_entries)
+        return entries
+
+    def store(self, entry: CacheEntry):
+        self.store_many([entry])
+
+    def store_many(self, entries: List[CacheEntry]):
+        self.local.store_many(entries)
+        try:
+            self.shared.store_many(entries)
+        except Exception as ex:
+            self.__increment('shared_errors')
+            logging.exception('Error encountered while queueing {} entries for the shared cache tier: {}'
+                              .format(len(entries), str(ex)))
+
+    def compact(self, min_timestamp: int) -> dict:
+        local = self.local.compact(min_timestamp)
+        shared = self.shared.compact(min_timestamp)
+        return {'expired': local['expired'] + shared['expired'],
+                'superseded': local['superseded'] + shared['superseded'],
+                'bytes_reclaimed': local['bytes_reclaimed'], 'tiers': {'local': local, 'shared': shared}}
+
+    def iterate(self, min_timestamp: int = 0, max_timestamp: int = None) -> Iterator[CacheEntry]:
+        # The shared tier holds the entries of every node
+        return self.shared.iterate(min_timestamp=min_timestamp, max_timestamp=max_timestamp)
+
+    def most_recent(self, count: int, min_timestamp: int = 0) -> List[CacheEntry]:
+        # This node's own hot set
+        return self.local.most_recent(count, min_timestamp=min_timestamp)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.counters)
+
+    def flush(self):
+        self.local.flush()
+        self.shared.flush()
+
+    def close(self):
+        try:
+            self.shared.close()
+        finally:
+            self.local.close()
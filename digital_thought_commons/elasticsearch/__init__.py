@@ -1,54 +1,176 @@
+import copy
 import glob
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import pathlib
 import re
+import threading
+import time
 
 from .. import internet
-from .bulkProcessor import BulkProcessor
+from .aggregationPager import AggregationPager
+from .bulkProcessor import BulkDeadLetterSink, BulkProcessor, NDJSONDeadLetterSink
+from .connectionRegistry import ConnectionRegistry, get_connection, registry
 from .scrollQuery import ScrollQuery
-from elasticsearch import Elasticsearch
+from .streamingParser import StreamingResponseParser
+from elasticsearch import Elasticsearch, VERSION as elasticsearch_version
 
 import base64
 
+_bundled_resources = {}
+_bundled_resources_lock = threading.Lock()
 
-class ElasticsearchConnection:
 
-    def __init__(self, server, port, api_key):
+def _bundled_resource_files(directory) -> dict:
+    """
+    Parses the JSON files of one _resources/elasticsearch sub-directory the first time they are asked for and keeps
+    them for the life of the process.
+    """
+    with _bundled_resources_lock:
+        if directory not in _bundled_resources:
+            resources = {}
+            for resource_file in glob.glob(directory + "/*.json"):
+                with open(resource_file) as resource_json_file:
+                    resources[pathlib.Path(resource_file).stem] = json.load(resource_json_file)
+            _bundled_resources[directory] = resources
+        return _bundled_resources[directory]
+
+
+class ElasticsearchConnection:
+    """
+    With http_compress, request bodies (bulk, search, scroll and aggregation requests alike) are sent gzip compressed
+    at compression_level and responses are requested gzip compressed.  BulkProcessor and ScrollQuery instances
+    created by the connection share its session, so they are compressed too.
+    The names of the component templates, index templates and lifecycle policies on the cluster are cached for
+    metadata_ttl seconds (or until refresh_metadata()) and updated as templates are installed, so installing a
+    template costs a fixed, small number of requests.
+    Construction makes no requests: the cluster is checked on first use of request_session, and the official client
+    is only created by get_client().  Every request goes through one pooled session holding up to pool_size
+    connections; use get_connection() to share a connection across the process.  close() does nothing on a shared
+    connection, which stays open for its other users until the registry's close_all().
+    """
+
+    def __init__(self, server, port, api_key, http_compress=False, compression_level=6, metadata_ttl=300,
+                 pool_size=10):
         self.api_key = api_key
+        self.server = server
+        self.port = port
         self.root_url = 'https://{}:{}/'.format(server, port)
         self.root_directory = str(pathlib.Path(__file__).parent.absolute()) + '/../_resources/elasticsearch'
-        self.request_session = internet.retry_request_session(
-            headers={'Authorization': 'ApiKey {}'.format(self.api_key)})
+        self.http_compress = http_compress
+        self.pool_size = pool_size
+        self.metadata_ttl = metadata_ttl
+        self.__metadata = {}
+        self.__metadata_lock = threading.RLock()
+        self.__session = internet.retry_request_session(
+            headers={'Authorization': 'ApiKey {}'.format(self.api_key)}, http_compress=http_compress,
+            compression_level=compression_level, pool_maxsize=pool_size)
         self.api_key_id = base64.b64decode(api_key.encode(encoding='utf-8')).decode("utf-8").split(':')[0]
         self.api_key_instance = base64.b64decode(api_key.encode(encoding='utf-8')).decode("utf-8").split(':')[1]
-        self.elasticsearch_client = Elasticsearch('https://{}:{}/'.format(server, port), api_key=self.api_key)
-
-        response = self.request_session.get(self.root_url)
-        if response.status_code != 200 or not self.is_cluster_healthy():
-            raise Exception(
-                "Failed to connect to Elasticsearch server or cluster status is not healthy: {}".format(self.root_url))
+        self.__client = None
+        self.__connected = False
+        self.__connect_lock = threading.Lock()
+        self.registry_managed = False
+
+    @property
+    def request_session(self):
+        if not self.__connected:
+            self.connect()
+        return self.__session
+
+    def connect(self):
+        """
+        Checks the server answers and the cluster is not red.  Called on first use of request_session; later calls
+        return at once.
+        """
+        with self.__connect_lock:
+            if self.__connected:
+                return
+            response = self.__session.get(self.root_url)
+            if response.status_code != 200 or not self.__is_cluster_healthy(self.__session):
+                raise Exception(
+                    "Failed to connect to Elasticsearch server or cluster status is not healthy: {}".format(self.root_url))
 
-        logging.getLogger('elastic').info("Successfully connected to: {}".format(self.root_url))
+            self.__connected = True
+            logging.getLogger('elastic').info("Successfully connected to: {}".format(self.root_url))
 
     def __enter__(self):
         return self
 
     def close(self):
-        self.request_session.close()
-        self.elasticsearch_client.close()
+        if self.registry_managed:
+            return
+        self._close()
+
+    def _close(self):
+        self.__session.close()
+        with self.__connect_lock:
+            if self.__client is not None:
+                self.__client.close()
+                self.__client = None
 
     def __exit__(self, type, value, traceback):
         self.close()
 
     def get_client(self) -> Elasticsearch:
-        return self.elasticsearch_client
+        with self.__connect_lock:
+            if self.__client is None:
+                # elasticsearch-py 8 renamed the pool size argument from maxsize
+                pool_argument = 'connections_per_node' if elasticsearch_version[0] >= 8 else 'maxsize'
+                self.__client = Elasticsearch(self.root_url, api_key=self.api_key, http_compress=self.http_compress,
+                                              **{pool_argument: self.pool_size})
+            return self.__client
+
+    @property
+    def elasticsearch_client(self) -> Elasticsearch:
+        return self.get_client()
 
     def flush_index(self, index: str) -> dict:
         return self.request_session.post(self.root_url + index + '/_flush').json()
 
-    def delete_by_id(self, index: str, _id: str):
-        return self.elasticsearch_client.delete(index=index, id=_id)
+    def delete_by_id(self, index: str, _id: str) -> dict:
+        response = self.request_session.delete('{}{}/_doc/{}'.format(self.root_url, index, _id))
+        if response.status_code != 200:
+            raise Exception('Delete of {} from {} failed.  Status code: {}, Error: {}'
+                            .format(_id, index, str(response.status_code), response.text))
+        return response.json()
+
+    def delete_by_query(self, index: str, query: dict, conflicts='proceed') -> dict:
+        response = self.request_session.post(self.root_url + '{}/_delete_by_query?conflicts={}'.format(index, conflicts),
+                                             json=query)
+        if response.status_code != 200:
+            raise Exception('Delete by query on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()
+
+    def refresh_metadata(self, kind=None):
+        """
+        Drops the cached names of kind ('component_templates', 'index_templates' or 'lifecycle_policies'), or of all
+        of them, so they are read from the cluster on next use.
+        """
+        with self.__metadata_lock:
+            if kind is None:
+                self.__metadata.clear()
+            else:
+                self.__metadata.pop(kind, None)
+
+    def __cluster_metadata(self, kind, path, names, refresh=False) -> list:
+        with self.__metadata_lock:
+            cached = self.__metadata.get(kind)
+            if refresh or cached is None or time.time() - cached[0] > self.metadata_ttl:
+                response = self.request_session.get(self.root_url + path)
+                if response.status_code != 200:
+                    raise Exception('Reading {} failed.  Status code: {}, Error: {}'
+                                    .format(path, str(response.status_code), response.text))
+                cached = (time.time(), names(response.json()))
+                self.__metadata[kind] = cached
+            return list(cached[1])
+
+    def __metadata_installed(self, kind, name):
+        with self.__metadata_lock:
+            if kind in self.__metadata and name not in self.__metadata[kind][1]:
+                self.__metadata[kind][1].append(name)
 
     def install_component_template(self, template_name, template, description=None, version=None, requires_prefix=None):
         if template_name not in self.loaded_component_templates():
@@ -65,6 +187,7 @@ class ElasticsearchConnection:
                 raise Exception(
                     'Failed to create Component Template {}.  Error: {}'.format(template_name, str(resp)))
 
+            self.__metadata_installed('component_templates', template_name)
             return {'status': 'created'}
         return {'status': 'already_present'}
 
@@ -81,6 +204,7 @@ class ElasticsearchConnection:
                 logging.getLogger('elastic').error('Failed to create ILM Policy {}.  Error: {}'.format(policy_name, str(resp)))
                 raise Exception('Failed to create ILM Policy {}.  Error: {}'.format(policy_name, str(resp)))
 
+            self.__metadata_installed('lifecycle_policies', policy_name)
             return {'status': 'created'}
         return {'status': 'already_present'}
 
@@ -109,29 +233,34 @@ class ElasticsearchConnection:
         if template_name not in self.loaded_index_templates():
             missing_components = []
             if 'composed_of' in template:
+                loaded_components = self.loaded_component_templates()
+                default_components = self.default_component_templates()
                 for component in template['composed_of']:
-                    if component not in self.loaded_component_templates() and component not in self.default_component_templates():
+                    if component not in loaded_components and component not in default_components:
                         missing_components.append(component)
                 if len(missing_components) > 0:
                     logging.getLogger('elastic').error('Missing required template component: {}'.format(str(missing_components)))
                     raise Exception('Missing required template component: {}'.format(str(missing_components)))
 
                 for component in template['composed_of']:
-                    if component not in self.loaded_component_templates():
-                        self.install_component_template(component, self.default_component_templates()[component])
+                    if component not in loaded_components:
+                        self.install_component_template(component, default_components[component])
 
             if 'index.lifecycle.name' in template['template']['settings']:
                 required_lcp = template['template']['settings']['index.lifecycle.name']
-                if required_lcp not in self.loaded_lifecycle_policies() and required_lcp not in self.default_lifecycle_policies():
-                    logging.getLogger('elastic').error('Missing required Lifecycle Policy: {}'.format(required_lcp))
-                    raise Exception('Missing required Lifecycle Policy: {}'.format(required_lcp))
+                if required_lcp not in self.loaded_lifecycle_policies():
+                    default_policies = self.default_lifecycle_policies()
+                    if required_lcp not in default_policies:
+                        logging.getLogger('elastic').error('Missing required Lifecycle Policy: {}'.format(required_lcp))
+                        raise Exception('Missing required Lifecycle Policy: {}'.format(required_lcp))
 
-                self.install_lifecycle_policy(required_lcp, self.default_lifecycle_policies()[required_lcp])
+                    self.install_lifecycle_policy(required_lcp, default_policies[required_lcp])
 
             resp = self.request_session.put(self.root_url + '_index_template/' + template_name, json=template).json()
             if not resp['acknowledged']:
                 logging.getLogger('elastic').error('Failed to create Template {}.  Error: {}'.format(template_name, str(resp)))
                 raise Exception('Failed to create Template {}.  Error: {}'.format(template_name, str(resp)))
+            self.__metadata_installed('index_templates', template_name)
 
             alias_name = template['template']['settings']['index.lifecycle.rollover_alias']
             create_index_json = {'aliases': {alias_name: {'is_write_index': True}}}
@@ -144,69 +273,52 @@ class ElasticsearchConnection:
         return {'status': 'already_present'}
 
     def default_component_templates(self):
-        component_templates = {}
-        for template_file in glob.glob(self.root_directory + "/component_templates/*.json"):
-            template_name = template_file.replace('.json', '').replace(self.root_directory, '') \
-                .replace('\\', '').replace('/', '').replace('component_templates', '')
-            with open(template_file) as template_json_file:
-                template_json = json.load(template_json_file)
-            component_templates[template_name] = template_json
-        return component_templates
+        # Copies, as installing a template fills in its _meta and prefix
+        return copy.deepcopy(_bundled_resource_files(self.root_directory + "/component_templates"))
 
     def default_index_templates(self):
-        index_templates = {}
-        for template_file in glob.glob(self.root_directory + "/index_templates/*.json"):
-            template_name = template_file.replace('.json', '').replace(self.root_directory, '') \
-                .replace('\\', '').replace('/', '').replace('index_templates', '')
-            with open(template_file) as template_json_file:
-                template_json = json.load(template_json_file)
-            index_templates[template_name] = template_json
-        return index_templates
+        return copy.deepcopy(_bundled_resource_files(self.root_directory + "/index_templates"))
 
     def default_lifecycle_policies(self):
-        lifecycle_policies = {}
-        for ilm_file in glob.glob(self.root_directory + "/lifecycles/*.json"):
-            ilm_name = ilm_file.replace('.json', '').replace(self.root_directory, '') \
-                .replace('\\', '').replace('/', '').replace('lifecycles', '')
-            with open(ilm_file) as ilm_json_file:
-                _json = json.load(ilm_json_file)
-            lifecycle_policies[ilm_name] = _json
-        return lifecycle_policies
-
-    def loaded_component_templates(self):
-        component_templates = []
-        for c_temp in self.request_session.get(self.root_url + '_component_template').json()['component_templates']:
-            component_templates.append(c_temp['name'])
-        return component_templates
-
-    def loaded_index_templates(self):
-        index_templates = []
-        for i_temp in self.request_session.get(self.root_url + '_index_template').json()['index_templates']:
-            index_templates.append(i_temp['name'])
-        return index_templates
-
-    def loaded_lifecycle_policies(self):
-        lifecycle_policies = []
-        for lc_temp in self.request_session.get(self.root_url + '_ilm/policy').json():
-            lifecycle_policies.append(lc_temp)
-        return lifecycle_policies
+        return copy.deepcopy(_bundled_resource_files(self.root_directory + "/lifecycles"))
+
+    def loaded_component_templates(self, refresh=False):
+        return self.__cluster_metadata('component_templates', '_component_template',
+                                       lambda resp: [c_temp['name'] for c_temp in resp['component_templates']],
+                                       refresh=refresh)
+
+    def loaded_index_templates(self, refresh=False):
+        return self.__cluster_metadata('index_templates', '_index_template',
+                                       lambda resp: [i_temp['name'] for i_temp in resp['index_templates']],
+                                       refresh=refresh)
+
+    def loaded_lifecycle_policies(self, refresh=False):
+        return self.__cluster_metadata('lifecycle_policies', '_ilm/policy', lambda resp: list(resp), refresh=refresh)
 
     def get_cluster_health(self):
         return self.request_session.get(self.root_url + '_cluster/health').json()
 
     def is_cluster_healthy(self):
+        return self.__is_cluster_healthy(self.request_session)
+
+    def __is_cluster_healthy(self, session):
         try:
-            json = self.get_cluster_health()
+            json = session.get(self.root_url + '_cluster/health').json()
             if json['status'] == 'yellow':
                 logging.getLogger('elastic').warning("Cluster is healthy.  However, it is in a YELLOW state. Recommend a check of the cluster.")
             return json['status'] != 'red'
         except Exception as ex:
-            logging.getLogger('elastic').exception()
-            logging.getLogger("elastic").exception()
+            logging.getLogger('elastic').exception('Cluster health check failed: {}'.format(self.root_url))
             return False
 
-    def bulk_processor(self, batch_size=1000, batch_max_size_bytes=5000000):
-        return BulkProcessor(request_session=self.request_session, root_url=self.root_url, batch_size=batch_size, batch_max_size_bytes=batch_max_size_bytes)
+    def bulk_processor(self, batch_size=1000, batch_max_size_bytes=5000000, concurrent_requests=0, queue_size=None,
+                       flush_interval=None, json_encoder='auto', max_retries=3, initial_backoff=0.5, max_backoff=30,
+                       dead_letter_sink: BulkDeadLetterSink = None, ignore_status=()):
+        return BulkProcessor(request_session=self.request_session, root_url=self.root_url, batch_size=batch_size,
+                             batch_max_size_bytes=batch_max_size_bytes, concurrent_requests=concurrent_requests,
+                             queue_size=queue_size, flush_interval=flush_interval, json_encoder=json_encoder,
+                             max_retries=max_retries, initial_backoff=initial_backoff, max_backoff=max_backoff,
+                             dead_letter_sink=dead_letter_sink, ignore_status=ignore_status)
 
     def index_document(self, index, document, _id=None):
         if _id is None:
@@ -236,19 +348,138 @@ class ElasticsearchConnection:
             else:
                 return {'_index': response['hits']['hits'][0]['_index'], '_type': '_doc', '_id': _id, 'found': True, '_source': response['hits']['hits'][0]['_source']}
 
-    def get_scroller(self):
-        return ScrollQuery(request_session=self.request_session, root_url=self.root_url)
+    @staticmethod
+    def __in_chunks(items, chunk_size, workers, request) -> list:
+        """
+        Sends items in chunks of chunk_size, up to workers chunks at a time, and returns the concatenated results of
+        request(chunk) in the order of items.
+        """
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        if len(chunks) <= 1 or workers <= 1:
+            results = [request(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                results = list(executor.map(request, chunks))
+        return [result for chunk_results in results for result in chunk_results]
+
+    def __mget(self, index, ids) -> list:
+        response = self.request_session.get('{}{}/_mget'.format(self.root_url, index), json={'ids': ids})
+        if response.status_code != 200:
+            raise Exception('Multi get on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()['docs']
+
+    def __search_ids(self, index, ids) -> list:
+        query = {'size': len(ids), 'query': {'bool': {'filter': {'terms': {'_id': ids}}}}}
+        hits = {}
+        for hit in self.search(index, query)['hits']['hits']:
+            if hit['_id'] in hits:
+                raise Exception(f'ID: {hit["_id"]} has returned more than 1 result.  Expected only 1 or 0 entries.')
+            hits[hit['_id']] = hit
+        return [{'_index': hits[_id]['_index'], '_type': '_doc', '_id': _id, 'found': True,
+                 '_source': hits[_id]['_source']} if _id in hits else
+                {'_index': index, '_type': '_doc', '_id': _id, 'found': False} for _id in ids]
+
+    def find_by_ids(self, index, ids, alias_index=False, chunk_size=1000, workers=4) -> list:
+        """
+        Returns one document per id, in the order of ids, found or not.  ids are fetched with _mget, or with a terms
+        search when alias_index is set (as for find_by_id), in chunks of chunk_size sent up to workers at a time.
+        """
+        ids = list(ids)
+        if alias_index:
+            return self.__in_chunks(ids, chunk_size, workers, lambda chunk: self.__search_ids(index, chunk))
+        return self.__in_chunks(ids, chunk_size, workers, lambda chunk: self.__mget(index, chunk))
+
+    def __msearch(self, searches) -> list:
+        lines = []
+        for index, query in searches:
+            lines.append(json.dumps({'index': index}))
+            lines.append(json.dumps(query))
+        response = self.request_session.post(self.root_url + '_msearch', data=('\n'.join(lines) + '\n').encode('utf-8'),
+                                             headers={'Content-Type': 'application/x-ndjson'})
+        if response.status_code != 200:
+            raise Exception('Multi search failed.  Status code: {}, Error: {}'
+                            .format(str(response.status_code), response.text))
+        return response.json()['responses']
+
+    def multi_search(self, searches, chunk_size=100, workers=4) -> list:
+        """
+        Runs a list of (index, query) searches with _msearch, in chunks of chunk_size sent up to workers at a time, and
+        returns one response per search in the same order.  A search that failed has an error instead of hits.
+        """
+        return self.__in_chunks(list(searches), chunk_size, workers, self.__msearch)
+
+    def find_by_terms(self, index, term, values, chunk_size=100, workers=4) -> list:
+        """
+        find_by_term for many value sets at once: returns the search response of each set of values, in order.
+        """
+        return self.multi_search([(index, {'query': {'terms': {term: value}}}) for value in values],
+                                 chunk_size=chunk_size, workers=workers)
+
+    def search(self, index, query) -> dict:
+        response = self.request_session.get(self.root_url + '{}/_search'.format(index), json=query)
+        if response.status_code != 200:
+            raise Exception('Search on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()
+
+    def stream_search(self, index, query, path=('hits', 'hits'), chunk_size=65536):
+        """
+        Yields each element of the array at path in the search response as soon as it is decoded from the response
+        stream, rather than loading the whole response with json().
+        """
+        response = self.request_session.get(self.root_url + '{}/_search'.format(index), json=query, stream=True)
+        try:
+            if response.status_code != 200:
+                raise Exception('Search on {} failed.  Status code: {}, Error: {}'
+                                .format(index, str(response.status_code), response.text))
+            yield from StreamingResponseParser(response.iter_content(chunk_size=chunk_size)).items(path)
+        finally:
+            response.close()
+
+    def get_scroller(self, keep_alive='1m', chunk_size=65536):
+        return ScrollQuery(request_session=self.request_session, root_url=self.root_url, keep_alive=keep_alive,
+                           chunk_size=chunk_size)
+
+    def aggregation(self, index, query, aggregation_name, streaming=False):
+        if streaming:
+            return self.stream_search(index, query, path=('aggregations', aggregation_name, 'buckets'))
 
-    def aggregation(self, index, query, aggregation_name):
         json_data = self.raw_aggregation(index, query)
         if "aggregations" in json_data and aggregation_name in json_data['aggregations']:
             return json_data['aggregations'][aggregation_name]['buckets']
 
         return []
 
+    def get_aggregation_pager(self) -> AggregationPager:
+        return AggregationPager(request_session=self.request_session, root_url=self.root_url)
+
+    def composite_aggregation(self, index, sources, query=None, page_size=1000, aggregations=None):
+        """
+        Yields every bucket of a composite aggregation over sources (field names or composite source definitions),
+        paging with after_key.  For example the IP and ASN pairs of an enrichment index:
+        composite_aggregation(index, ['source.ip', 'source.as.number']).
+        """
+        return self.get_aggregation_pager().composite(index, sources, query=query, page_size=page_size,
+                                                      aggregations=aggregations)
+
+    def partitioned_terms_aggregation(self, index, field, num_partitions, size=10000, query=None, workers=4,
+                                      aggregations=None):
+        """
+        Yields every bucket of a terms aggregation on field, read as num_partitions include.partition requests of up to
+        size terms each, workers at a time.
+        """
+        return self.get_aggregation_pager().partitioned_terms(index, field, num_partitions, size=size, query=query,
+                                                              workers=workers, aggregations=aggregations)
+
     def raw_aggregation(self, index, query):
         response = self.request_session.get(self.root_url + '{}/_search'.format(index), json=query)
         if response.status_code != 200:
             raise Exception(response.text)
 
         return response.json()
+
+
+from .asyncBulkProcessor import AsyncBulkProcessor
+from .asyncConnection import AsyncElasticsearchConnection
+from .asyncScrollQuery import AsyncScrollQuery
@@ -0,0 +1,102 @@
+import collections
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+aggregation_name = 'pages'
+
+
+def composite_sources(sources) -> list:
+    """
+    Builds composite sources from field names, so ['source.ip', 'source.as.number'] becomes one terms source per field,
+    named after it.  Sources that are already composite source definitions are kept as they are.
+    """
+    return [{source: {'terms': {'field': source}}} if isinstance(source, str) else source for source in sources]
+
+
+def aggregation_body(query, aggregation: dict, aggregations=None) -> dict:
+    """
+    A search body running aggregation, with aggregations as its sub-aggregations, over the documents matching query
+    without returning any hits.
+    """
+    if aggregations:
+        aggregation['aggs'] = aggregations
+    body = {'size': 0, 'track_total_hits': False, 'aggs': {aggregation_name: aggregation}}
+    if query is not None:
+        body['query'] = query
+    return body
+
+
+def partition_terms(field, partition, num_partitions, size) -> dict:
+    return {'terms': {'field': field, 'size': size,
+                      'include': {'partition': partition, 'num_partitions': num_partitions}}}
+
+
+def check_partition(result: dict, field, partition, num_partitions, size):
+    if result.get('sum_other_doc_count', 0) > 0:
+        logging.getLogger('elastic').warning(
+            'Partition {} of {} on {} has more than {} terms.  Increase num_partitions or size'
+            .format(partition, num_partitions, field, size))
+
+
+class AggregationPager:
+    """
+    Reads every bucket of a high-cardinality aggregation without one large response.
+    composite() pages a composite aggregation with after_key, page_size buckets per request, yielding buckets as each
+    page arrives.  partitioned_terms() splits a terms aggregation into num_partitions with include.partition, as
+    composite sources do not accept include, and reads up to workers partitions at a time, yielding the buckets of each
+    partition in partition order.  aggregations are run as sub-aggregations of every bucket.
+    """
+
+    def __init__(self, request_session, root_url) -> None:
+        super().__init__()
+        self.request_session = request_session
+        self.root_url = root_url
+
+    def __aggregate(self, index, body) -> dict:
+        r = self.request_session.post(self.root_url + index + "/_search", json=body)
+        if r.status_code != 200:
+            raise Exception('Aggregation on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(r.status_code), r.text))
+        return r.json()['aggregations'][aggregation_name]
+
+    def composite(self, index, sources, query=None, page_size=1000, aggregations=None):
+        composite = {'size': page_size, 'sources': composite_sources(sources)}
+        body = aggregation_body(query, {'composite': composite}, aggregations)
+        while True:
+            page = self.__aggregate(index, body)
+            for bucket in page['buckets']:
+                yield bucket
+            # after_key can follow a short page when sub-aggregations drop buckets, so only an empty page ends it
+            if len(page['buckets']) == 0 or 'after_key' not in page:
+                return
+            composite['after'] = page['after_key']
+
+    def __partition(self, index, field, partition, num_partitions, size, query, aggregations) -> list:
+        result = self.__aggregate(index, aggregation_body(query, partition_terms(field, partition, num_partitions, size),
+                                                          aggregations))
+        check_partition(result, field, partition, num_partitions, size)
+        return result['buckets']
+
+    def partitioned_terms(self, index, field, num_partitions, size=10000, query=None, workers=4, aggregations=None):
+        with ThreadPoolExecutor(max_workers=max(min(workers, num_partitions), 1),
+                                thread_name_prefix='AggregationPager') as executor:
+            partitions = iter(range(num_partitions))
+            pending = collections.deque()
+            try:
+                # Only workers partitions are read ahead of the caller, so at most that many are held in memory
+                for partition in partitions:
+                    pending.append(executor.submit(self.__partition, index, field, partition, num_partitions, size,
+                                                   query, aggregations))
+                    if len(pending) >= workers:
+                        break
+                while len(pending) > 0:
+                    buckets = pending.popleft().result()
+                    partition = next(partitions, None)
+                    if partition is not None:
+                        pending.append(executor.submit(self.__partition, index, field, partition, num_partitions,
+                                                       size, query, aggregations))
+                    for bucket in buckets:
+                        yield bucket
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+
+from .bulkProcessor import BulkDeadLetterSink, BulkProcessor
+
+
+class AsyncBulkProcessor(BulkProcessor):
+    """
+    asyncio counterpart of BulkProcessor, batching, retrying and dead-lettering actions the same way.
+    request_session must be an AsyncRetrySession.  Full batches are sent as tasks on the event loop, with up to
+    concurrent_requests _bulk requests in flight; adding an action waits while that many are in flight, applying
+    backpressure to the caller.  With flush_interval (seconds) a partial batch is also sent once it has waited that
+    long.  A failed batch raises on the next action or aclose(), which returns the totals of every batch.
+    """
+
+    def __init__(self, request_session, root_url, batch_size, batch_max_size_bytes, concurrent_requests=4,
+                 flush_interval=None, json_encoder='auto', max_retries=3, initial_backoff=0.5, max_backoff=30,
+                 dead_letter_sink: BulkDeadLetterSink = None) -> None:
+        super().__init__(request_session=request_session, root_url=root_url, batch_size=batch_size,
+                         batch_max_size_bytes=batch_max_size_bytes, json_encoder=json_encoder,
+                         max_retries=max_retries, initial_backoff=initial_backoff, max_backoff=max_backoff,
+                         dead_letter_sink=dead_letter_sink)
+        self.concurrent_requests = max(concurrent_requests, 1)
+        self.flush_interval = flush_interval
+        self.in_flight = set()
+        self.__slots = None
+        self.__timer = None
+        self.__closing = None
+        self.__error = None
+        self.__closed = False
+
+    def __start(self):
+        # Created on first use so they belong to the running loop
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.concurrent_requests)
+        if self.flush_interval and self.__timer is None and not self.__closed:
+            self.__closing = asyncio.Event()
+            self.__timer = asyncio.ensure_future(self.__flush_periodically())
+
+    async def __flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.__closing.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                batch = self._take_batch()
+                if batch is not None:
+                    await self.__dispatch(*batch)
+            except Exception as ex:
+                logging.getLogger('elastic').exception("Error encountered during interval flush: {}".format(str(ex)))
+
+    def __raise_error(self):
+        if self.__error is not None:
+            error = self.__error
+            self.__error = None
+            raise error
+
+    async def __send(self, entries, batch_size):
+        try:
+            attempt = 0
+            while True:
+                logging.getLogger('elastic').info("Processing Bulk Index Batch. Size: {}".format(str(len(entries))))
+                r = await self.request_session.post(self.root_url + "/_bulk", data=b''.join(entries),
+                                                    headers={'Content-Type': 'application/x-ndjson'})
+                entries = self._handle_response(r, entries, attempt)
+                if len(entries) == 0:
+                    return
+                attempt += 1
+                await asyncio.sleep(self._backoff_delay(attempt))
+        except Exception as ex:
+            self.__error = self.__error or ex
+        finally:
+            self.__slots.release()
+
+    async def __dispatch(self, entries, batch_size):
+        self.__raise_error()
+        await self.__slots.acquire()
+        task = asyncio.ensure_future(self.__send(entries, batch_size))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def process_batch(self):
+        self.__start()
+        batch = self._take_batch()
+        if batch is None:
+            logging.getLogger('elastic').warning("Request to process batch was made.  But batch is currently empty.")
+            return
+        await self.__dispatch(*batch)
+
+    async def _check_for_processing(self):
+        if self.current_batch_bytes > self.batch_max_size_bytes:
+            logging.getLogger('elastic').warning("Length of entries exceeds {} bytes.  Processing current batch before adding new entry.".format(self.batch_max_size_bytes))
+            await self.process_batch()
+        elif self.current_batch_size >= self.batch_size:
+            await self.process_batch()
+
+    async def __add(self, action: dict, source: dict = None):
+        if self.__closed:
+            raise Exception('AsyncBulkProcessor is closed')
+        self.__start()
+        self.__raise_error()
+        await self._check_for_processing()
+        self._append(action, source)
+        await self._check_for_processing()
+
+    async def delete(self, index, _id):
+        await self.__add({"delete": {"_index": index, "_id": _id}})
+
+    async def update(self, index, entry, _id, doc_as_upsert=False):
+        if doc_as_upsert:
+            await self.__add({"update": {"_index": index, "_id": _id}}, {"doc": entry, "doc_as_upsert": True})
+        else:
+            await self.__add({"update": {"_index": index, "_id": _id}}, {"doc": entry})
+
+    async def index(self, index, entry, _id=None):
+        if _id is not None:
+            await self.__add({"index": {"_index": index, "_id": _id}}, entry)
+        else:
+            await self.__add({"index": {"_index": index}}, entry)
+
+    async def create(self, index, entry, _id=None):
+        if _id is not None:
+            await self.__add({"create": {"_index": index, "_id": _id}}, entry)
+        else:
+            await self.__add({"create": {"_index": index}}, entry)
+
+    async def aclose(self):
+        if self.__closed:
+            return self.results
+        self.__closed = True
+        if self.__timer is not None:
+            # Lets an interval flush that is under way hand its batch over before the last batch is taken
+            self.__closing.set()
+            await self.__timer
+
+        self.__start()
+        batch = self._take_batch()
+        if batch is not None:
+            await self.__dispatch(*batch)
+        if len(self.in_flight) > 0:
+            await asyncio.gather(*self.in_flight)
+        self.__raise_error()
+        return self.results
+
+    def close(self):
+        raise Exception('AsyncBulkProcessor must be closed with aclose()')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+
+from .. import internet
+from .aggregationPager import aggregation_body, aggregation_name, check_partition, composite_sources, partition_terms
+from .asyncBulkProcessor import AsyncBulkProcessor
+from .asyncScrollQuery import AsyncScrollQuery
+from .bulkProcessor import BulkDeadLetterSink
+from .streamingParser import StreamingResponseParser
+
+
+class AsyncElasticsearchConnection:
+    """
+    asyncio counterpart of the searches, lookups, indexing and deletes of ElasticsearchConnection.  Every method that
+    talks to the cluster is a coroutine sent through an AsyncRetrySession, so every AsyncElasticsearchConnection on an
+    event loop shares that loop's aiohttp connection pool; bulk_processor() and get_scroller() return an
+    AsyncBulkProcessor and an AsyncScrollQuery on the same session.  The cluster is checked by aconnect(), called on
+    first request.  Templates and lifecycle policies are installed with an ElasticsearchConnection at start up.
+    Asynchronous requests are not compressed.
+    """
+
+    def __init__(self, server, port, api_key):
+        self.api_key = api_key
+        self.server = server
+        self.port = port
+        self.root_url = 'https://{}:{}/'.format(server, port)
+        self.async_request_session = internet.async_retry_request_session(
+            headers={'Authorization': 'ApiKey {}'.format(self.api_key)})
+        self.__connected = False
+        self.__connect_lock = None
+
+    async def aconnect(self):
+        if self.__connected:
+            return
+        if self.__connect_lock is None:
+            self.__connect_lock = asyncio.Lock()
+        async with self.__connect_lock:
+            if self.__connected:
+                return
+            response = await self.async_request_session.get(self.root_url)
+            if response.status_code != 200 or not await self.is_cluster_healthy():
+                raise Exception(
+                    "Failed to connect to Elasticsearch server or cluster status is not healthy: {}".format(self.root_url))
+
+            self.__connected = True
+            logging.getLogger('elastic').info("Successfully connected to: {}".format(self.root_url))
+
+    async def __request(self, method, url, **kwargs):
+        await self.aconnect()
+        return await self.async_request_session.request(method, url, **kwargs)
+
+    async def aclose(self):
+        await self.async_request_session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
+
+    async def flush_index(self, index: str) -> dict:
+        return (await self.__request('POST', self.root_url + index + '/_flush')).json()
+
+    async def delete_by_id(self, index: str, _id: str) -> dict:
+        response = await self.__request('DELETE', '{}{}/_doc/{}'.format(self.root_url, index, _id))
+        if response.status_code != 200:
+            raise Exception('Delete of {} from {} failed.  Status code: {}, Error: {}'
+                            .format(_id, index, str(response.status_code), response.text))
+        return response.json()
+
+    async def delete_by_query(self, index: str, query: dict, conflicts='proceed') -> dict:
+        response = await self.__request('POST', self.root_url + '{}/_delete_by_query?conflicts={}'
+                                        .format(index, conflicts), json=query)
+        if response.status_code != 200:
+            raise Exception('Delete by query on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()
+
+    async def get_cluster_health(self):
+        return (await self.async_request_session.get(self.root_url + '_cluster/health')).json()
+
+    async def is_cluster_healthy(self):
+        try:
+            json_data = await self.get_cluster_health()
+            if json_data['status'] == 'yellow':
+                logging.getLogger('elastic').warning("Cluster is healthy.  However, it is in a YELLOW state. Recommend a check of the cluster.")
+            return json_data['status'] != 'red'
+        except Exception as ex:
+            logging.getLogger('elastic').exception('Cluster health check failed: {}'.format(self.root_url))
+            return False
+
+    def bulk_processor(self, batch_size=1000, batch_max_size_bytes=5000000, concurrent_requests=4,
+                       flush_interval=None, json_encoder='auto', max_retries=3, initial_backoff=0.5, max_backoff=30,
+                       dead_letter_sink: BulkDeadLetterSink = None) -> AsyncBulkProcessor:
+        return AsyncBulkProcessor(request_session=self.async_request_session, root_url=self.root_url,
+                                  batch_size=batch_size, batch_max_size_bytes=batch_max_size_bytes,
+                                  concurrent_requests=concurrent_requests, flush_interval=flush_interval,
+                                  json_encoder=json_encoder, max_retries=max_retries,
+                                  initial_backoff=initial_backoff, max_backoff=max_backoff,
+                                  dead_letter_sink=dead_letter_sink)
+
+    async def index_document(self, index, document, _id=None):
+        if _id is None:
+            _id = ''
+        index_url = self.root_url + '{}/_doc/{}'.format(index, _id)
+        response = await self.__request('POST', index_url, json=document)
+        return {'status_code': response.status_code, 'elastic': response.json()}
+
+    async def find_by_term(self, index, term, value):
+        query = {'query': {'terms': {term: value}}}
+        response = await self.__request('GET', self.root_url + '{}/_search'.format(index), json=query)
+        return {'status_code': response.status_code, 'elastic': response.json()}
+
+    async def find_by_id(self, index, _id, alias_index=True):
+        if not alias_index:
+            return (await self.__request('GET', '{}{}/_doc/{}'.format(self.root_url, index, _id))).json()
+        return (await self.__search_ids(index, [_id]))[0]
+
+    @staticmethod
+    async def __in_chunks(items, chunk_size, workers, request) -> list:
+        """
+        Sends items in chunks of chunk_size, up to workers chunks at a time, and returns the concatenated results of
+        request(chunk) in the order of items.
+        """
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        slots = asyncio.Semaphore(max(workers, 1))
+
+        async def bounded(chunk):
+            async with slots:
+                return await request(chunk)
+
+        results = await asyncio.gather(*[bounded(chunk) for chunk in chunks])
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def __mget(self, index, ids) -> list:
+        response = await self.__request('GET', '{}{}/_mget'.format(self.root_url, index), json={'ids': ids})
+        if response.status_code != 200:
+            raise Exception('Multi get on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()['docs']
+
+    async def __search_ids(self, index, ids) -> list:
+        query = {'size': len(ids), 'query': {'bool': {'filter': {'terms': {'_id': ids}}}}}
+        hits = {}
+        for hit in (await self.search(index, query))['hits']['hits']:
+            if hit['_id'] in hits:
+                raise Exception(f'ID: {hit["_id"]} has returned more than 1 result.  Expected only 1 or 0 entries.')
+            hits[hit['_id']] = hit
+        return [{'_index': hits[_id]['_index'], '_type': '_doc', '_id': _id, 'found': True,
+                 '_source': hits[_id]['_source']} if _id in hits else
+                {'_index': index, '_type': '_doc', '_id': _id, 'found': False} for _id in ids]
+
+    async def find_by_ids(self, index, ids, alias_index=False, chunk_size=1000, workers=4) -> list:
+        ids = list(ids)
+        if alias_index:
+            return await self.__in_chunks(ids, chunk_size, workers, lambda chunk: self.__search_ids(index, chunk))
+        return await self.__in_chunks(ids, chunk_size, workers, lambda chunk: self.__mget(index, chunk))
+
+    async def __msearch(self, searches) -> list:
+        lines = []
+        for index, query in searches:
+            lines.append(json.dumps({'index': index}))
+            lines.append(json.dumps(query))
+        response = await self.__request('POST', self.root_url + '_msearch',
+                                        data=('\n'.join(lines) + '\n').encode('utf-8'),
+                                        headers={'Content-Type': 'application/x-ndjson'})
+        if response.status_code != 200:
+            raise Exception('Multi search failed.  Status code: {}, Error: {}'
+                            .format(str(response.status_code), response.text))
+        return response.json()['responses']
+
+    async def multi_search(self, searches, chunk_size=100, workers=4) -> list:
+        return await self.__in_chunks(list(searches), chunk_size, workers, self.__msearch)
+
+    async def find_by_terms(self, index, term, values, chunk_size=100, workers=4) -> list:
+        return await self.multi_search([(index, {'query': {'terms': {term: value}}}) for value in values],
+                                       chunk_size=chunk_size, workers=workers)
+
+    async def search(self, index, query) -> dict:
+        response = await self.__request('GET', self.root_url + '{}/_search'.format(index), json=query)
+        if response.status_code != 200:
+            raise Exception('Search on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        return response.json()
+
+    def get_scroller(self, keep_alive='1m') -> AsyncScrollQuery:
+        return AsyncScrollQuery(request_session=self.async_request_session, root_url=self.root_url,
+                                keep_alive=keep_alive)
+
+    async def stream_search(self, index, query, path=('hits', 'hits'), chunk_size=65536):
+        """
+        Yields each element of the array at path in the search response as it is decoded.  The response body is read
+        whole, as for every asynchronous request, but is decoded one element at a time rather than with json().
+        """
+        response = await self.__request('GET', self.root_url + '{}/_search'.format(index), json=query)
+        if response.status_code != 200:
+            raise Exception('Search on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(response.status_code), response.text))
+        content = response.content
+        chunks = (content[start:start + chunk_size] for start in range(0, len(content), chunk_size))
+        for item in StreamingResponseParser(chunks).items(path):
+            yield item
+
+    async def aggregation(self, index, query, aggregation_name, streaming=False):
+        if streaming:
+            return self.stream_search(index, query, path=('aggregations', aggregation_name, 'buckets'))
+
+        json_data = await self.raw_aggregation(index, query)
+        if "aggregations" in json_data and aggregation_name in json_data['aggregations']:
+            return json_data['aggregations'][aggregation_name]['buckets']
+
+        return []
+
+    async def __aggregate(self, index, body) -> dict:
+        return (await self.raw_aggregation(index, body))['aggregations'][aggregation_name]
+
+    async def composite_aggregation(self, index, sources, query=None, page_size=1000, aggregations=None):
+        composite = {'size': page_size, 'sources': composite_sources(sources)}
+        body = aggregation_body(query, {'composite': composite}, aggregations)
+        while True:
+            page = await self.__aggregate(index, body)
+            for bucket in page['buckets']:
+                yield bucket
+            if len(page['buckets']) == 0 or 'after_key' not in page:
+                return
+            composite['after'] = page['after_key']
+
+    async def __partition(self, index, field, partition, num_partitions, size, query, aggregations) -> list:
+        result = await self.__aggregate(index, aggregation_body(
+            query, partition_terms(field, partition, num_partitions, size), aggregations))
+        check_partition(result, field, partition, num_partitions, size)
+        return result['buckets']
+
+    async def partitioned_terms_aggregation(self, index, field, num_partitions, size=10000, query=None, workers=4,
+                                            aggregations=None):
+        pending = []
+        partitions = iter(range(num_partitions))
+        try:
+            for partition in partitions:
+                pending.append(asyncio.ensure_future(self.__partition(index, field, partition, num_partitions, size,
+                                                                      query, aggregations)))
+                if len(pending) >= workers:
+                    break
+            while len(pending) > 0:
+                buckets = await pending.pop(0)
+                partition = next(partitions, None)
+                if partition is not None:
+                    pending.append(asyncio.ensure_future(self.__partition(index, field, partition, num_partitions,
+                                                                          size, query, aggregations)))
+                for bucket in buckets:
+                    yield bucket
+        finally:
+            for task in pending:
+                task.cancel()
+            if len(pending) > 0:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def raw_aggregation(self, index, query):
+        response = await self.__request('GET', self.root_url + '{}/_search'.format(index), json=query)
+        if response.status_code != 200:
+            raise Exception(response.text)
+
+        return response.json()
@@ -0,0 +1,162 @@
+import asyncio
+
+from .scrollQuery import _slice_done
+
+
+class AsyncScrollQuery:
+    """
+    asyncio counterpart of ScrollQuery: query() is an async generator of every hit, reading slices concurrently as
+    tasks on the event loop instead of threads, with the same slices, workers, page_size, source and point_in_time
+    options.  request_session must be an AsyncRetrySession.  Scroll contexts left open by an abandoned query are
+    cleared by aclose().
+    """
+
+    def __init__(self, request_session, root_url, keep_alive='1m') -> None:
+        super().__init__()
+        self.request_session = request_session
+        self.root_url = root_url
+        self.keep_alive = keep_alive
+        self.scroll_ids = []
+
+    async def aclose(self):
+        scroll_ids = list(self.scroll_ids)
+        self.scroll_ids.clear()
+        if len(scroll_ids) > 0:
+            await self.request_session.request('DELETE', self.root_url + "_search/scroll",
+                                               json={"scroll_id": scroll_ids})
+
+    async def __search(self, url, body) -> dict:
+        r = await self.request_session.post(url, json=body)
+        if r.status_code != 200:
+            raise Exception('Search {} failed.  Status code: {}, Error: {}'.format(url, str(r.status_code), r.text))
+        return r.json()
+
+    async def __release_scroll(self, scroll_id):
+        if scroll_id not in self.scroll_ids:
+            return
+        self.scroll_ids.remove(scroll_id)
+        await self.request_session.request('DELETE', self.root_url + "_search/scroll", json={"scroll_id": [scroll_id]})
+
+    async def __scroll_pages(self, index, body):
+        resp = await self.__search(self.root_url + index + "/_search?scroll=" + self.keep_alive, body)
+        scroll_id = resp['_scroll_id']
+        self.scroll_ids.append(scroll_id)
+
+        try:
+            while len(resp['hits']['hits']) > 0:
+                yield resp['hits']['hits']
+                resp = await self.__search(self.root_url + "_search/scroll", {"scroll": self.keep_alive,
+                                                                               "scroll_id": scroll_id})
+                if resp.get('_scroll_id', scroll_id) != scroll_id:
+                    self.scroll_ids[self.scroll_ids.index(scroll_id)] = resp['_scroll_id']
+                    scroll_id = resp['_scroll_id']
+        finally:
+            # Frees the search context as soon as the cursor is exhausted or abandoned
+            await self.__release_scroll(scroll_id)
+
+    async def __pit_pages(self, body, pit_id):
+        body = dict(body)
+        body['pit'] = {'id': pit_id, 'keep_alive': self.keep_alive}
+        body.setdefault('sort', ['_shard_doc'])
+        while True:
+            resp = await self.__search(self.root_url + "_search", body)
+            hits = resp['hits']['hits']
+            if len(hits) == 0:
+                return
+            yield hits
+            body['pit'] = {'id': resp.get('pit_id', pit_id), 'keep_alive': self.keep_alive}
+            body['search_after'] = hits[-1]['sort']
+
+    async def __open_point_in_time(self, index) -> str:
+        r = await self.request_session.post(self.root_url + index + "/_pit?keep_alive=" + self.keep_alive)
+        if r.status_code != 200:
+            raise Exception('Opening point in time on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(r.status_code), r.text))
+        return r.json()['id']
+
+    async def __close_point_in_time(self, pit_id):
+        await self.request_session.request('DELETE', self.root_url + "_pit", json={"id": pit_id})
+
+    @staticmethod
+    async def __read_slices(cursor, slice_ids, pages: asyncio.Queue):
+        try:
+            for slice_id in slice_ids:
+                slice_pages = cursor(slice_id)
+                try:
+                    async for page in slice_pages:
+                        await pages.put(page)
+                finally:
+                    await slice_pages.aclose()
+        except Exception as ex:
+            await pages.put(ex)
+        # Not reached when the reader is cancelled, as nothing reads the queue any more
+        await pages.put(_slice_done)
+
+    async def __merge(self, cursor, slices, workers):
+        workers = min(workers or slices, slices)
+        pages = asyncio.Queue(maxsize=workers * 2)
+        readers = [asyncio.ensure_future(self.__read_slices(cursor, range(worker, slices, workers), pages))
+                   for worker in range(workers)]
+
+        finished = 0
+        try:
+            while finished < len(readers):
+                page = await pages.get()
+                if page is _slice_done:
+                    finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for hit in page:
+                        yield hit
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+
+    async def query(self, index, query, slices=1, workers=None, page_size=None, source=None, point_in_time=False):
+        body = dict(query)
+        if page_size is not None:
+            body['size'] = page_size
+        if source is not None:
+            body['_source'] = source
+
+        pit_id = await self.__open_point_in_time(index) if point_in_time else None
+
+        def cursor(slice_id):
+            sliced_body = body
+            if slices > 1:
+                sliced_body = dict(body)
+                sliced_body['slice'] = {'id': slice_id, 'max': slices}
+            if point_in_time:
+                return self.__pit_pages(sliced_body, pit_id)
+            return self.__scroll_pages(index, sliced_body)
+
+        try:
+            if slices > 1:
+                hits = self.__merge(cursor, slices, workers)
+            else:
+                hits = self.__single(cursor(0))
+            try:
+                async for hit in hits:
+                    yield hit
+            finally:
+                await hits.aclose()
+        finally:
+            if pit_id is not None:
+                await self.__close_point_in_time(pit_id)
+
+    @staticmethod
+    async def __single(pages):
+        try:
+            async for page in pages:
+                for hit in page:
+                    yield hit
+        finally:
+            await pages.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
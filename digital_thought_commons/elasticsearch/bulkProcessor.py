@@ -1,7 +1,39 @@
 import json
 import logging
+import queue
+import random
+import threading
+import time
 from typing import List
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_encoders = ['auto', 'json', 'orjson']
+NEWLINE = b'\n'
+
+retryable_statuses = frozenset([429])
+retryable_error_types = frozenset(['es_rejected_execution_exception'])
+
+_processing = threading.local()
+
+
+def is_processing() -> bool:
+    """
+    True on a flusher or timer thread of a BulkProcessor, or while a thread is sending a _bulk request.  Log handlers
+    that ship records through a BulkProcessor use it to skip the records it logs itself, which would otherwise wait on
+    the handler that is waiting on the processor.
+    """
+    return getattr(_processing, 'active', False)
+
+
+def _set_processing(active: bool) -> bool:
+    previous = getattr(_processing, 'active', False)
+    _processing.active = active
+    return previous
+
 
 class BulkProcessedItem:
 
@@ -22,6 +54,48 @@ class BulkProcessedItem:
         return item
 
 
+class BulkDeadLetterSink:
+    """
+    Receives the actions that failed permanently or were still rejected after the last retry.
+    action holds the NDJSON lines of the action as sent to _bulk, error is the item's error from the response.
+    """
+
+    def write(self, action: bytes, error):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class NDJSONDeadLetterSink(BulkDeadLetterSink):
+    """
+    Appends each dead letter to a local NDJSON file as {"failed_at": epoch ms, "error": ..., "lines": [...]}, where
+    lines are the action's _bulk lines, so they can be replayed.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__file = open(path, 'a', encoding='UTF-8')
+
+    def write(self, action: bytes, error):
+        record = json.dumps({'failed_at': int(round(time.time() * 1000)), 'error': error,
+                             'lines': [json.loads(line) for line in action.splitlines() if line.strip()]})
+        with self.__lock:
+            self.__file.write(record + '\n')
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
 class BulkProcessorListener:
 
     def created(self, entries: List[BulkProcessedItem]):
@@ -38,17 +112,69 @@ class BulkProcessorListener:
 
 
 class BulkProcessor:
-
-    def __init__(self, request_session, root_url, batch_size, batch_max_size_bytes) -> None:
+    """
+    Batches index, create, update and delete actions into _bulk requests.
+    By default a batch is sent on the calling thread once batch_size actions or batch_max_size_bytes are reached.  With
+    concurrent_requests > 0 full batches are handed to a queue of at most queue_size batches (default
+    2 * concurrent_requests) drained by concurrent_requests flusher threads, each keeping one _bulk request in flight,
+    so callers only block when the queue is full.  With flush_interval (seconds) a partial batch is also sent once it
+    has waited that long.  Listeners are called on the flusher threads in concurrent mode.
+    Each action is serialized once, straight to bytes (with orjson when json_encoder is auto and it is installed), and
+    kept in a list with a running byte count that is joined once when the batch is sent.
+    Actions rejected with a 429 or es_rejected_execution_exception are resent on their own up to max_retries times,
+    waiting a random delay of up to initial_backoff * 2^(attempt - 1) seconds (capped at max_backoff) between attempts.
+    Actions that still fail, or fail with any other error, are passed to dead_letter_sink when one is set.  Actions
+    failing with a status in ignore_status, e.g. 409 for writes with external versioning, are counted as noop instead.
+    flush() sends the current batch and waits for every batch handed over so far, close() returns the totals of every
+    batch.
+    """
+
+    def __init__(self, request_session, root_url, batch_size, batch_max_size_bytes, concurrent_requests=0,
+                 queue_size=None, flush_interval=None, json_encoder='auto', max_retries=3, initial_backoff=0.5,
+                 max_backoff=30, dead_letter_sink: BulkDeadLetterSink = None, ignore_status=()) -> None:
         super().__init__()
+        if json_encoder not in json_encoders:
+            raise Exception('Unknown JSON encoder: {}.  Expected one of {}'.format(json_encoder, json_encoders))
+        if json_encoder == 'orjson' and orjson is None:
+            raise Exception('The orjson package is required for the orjson JSON encoder')
+
         self.request_session = request_session
-        self.entries = ""
+        self.use_orjson = orjson is not None and json_encoder in ('auto', 'orjson')
+        self.entries: List[bytes] = []
+        self.current_batch_bytes = 0
         self.batch_size = batch_size
         self.batch_max_size_bytes = batch_max_size_bytes
         self.root_url = root_url
         self.current_batch_size = 0
         self.listeners: List[BulkProcessorListener] = []
-        self.results = {"created": 0, "updated": 0, "errors": 0, "error_entries": []}
+        self.results = {"created": 0, "updated": 0, "deleted": 0, "noop": 0, "errors": 0, "retried": 0,
+                        "dead_lettered": 0, "error_entries": []}
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.dead_letter_sink = dead_letter_sink
+        self.ignore_status = frozenset(ignore_status)
+        self.__results_lock = threading.Lock()
+        self.concurrent_requests = concurrent_requests
+        self.flush_interval = flush_interval
+        self.__lock = threading.RLock()
+        self.__closed = threading.Event()
+        self.__error = None
+        self.__batches = None
+        self.__flushers = []
+        self.__timer = None
+
+        if self.concurrent_requests > 0:
+            self.__batches = queue.Queue(maxsize=queue_size or self.concurrent_requests * 2)
+            for number in range(self.concurrent_requests):
+                flusher = threading.Thread(target=self.__flush_batches, daemon=True,
+                                           name='BulkProcessorFlusher-{}'.format(number))
+                flusher.start()
+                self.__flushers.append(flusher)
+        if self.flush_interval:
+            self.__timer = threading.Thread(target=self.__flush_periodically, daemon=True,
+                                            name='BulkProcessorTimer')
+            self.__timer.start()
 
     def __enter__(self):
         return self
@@ -59,25 +185,23 @@ class BulkProcessor:
     def remove_listener(self, listener: BulkProcessorListener):
         self.listeners.remove(listener)
 
-    def __process_listeners(self, resp: dict):
+    def __process_listeners(self, items: List[BulkProcessedItem]):
         created = []
         updated = []
         errors = []
         noops = []
 
-        for item in resp['items']:
-            for key in item:
-                entry = BulkProcessedItem.build(item[key])
-                if entry.result == 'updated':
-                    updated.append(entry)
-                elif entry.result == 'created':
-                    created.append(entry)
-                elif entry.result == 'error':
-                    errors.append(entry)
-                elif entry.result == 'noop':
-                    noops.append(entry)
-                else:
-                    logging.error(f'Unexpected response for item in BulkProcessor while processing listeners: {json.dumps(item)}')
+        for entry in items:
+            if entry.result == 'updated':
+                updated.append(entry)
+            elif entry.result == 'created':
+                created.append(entry)
+            elif entry.result == 'error':
+                errors.append(entry)
+            elif entry.result == 'noop':
+                noops.append(entry)
+            elif entry.result not in ('deleted', 'not_found'):
+                logging.error(f'Unexpected response for item in BulkProcessor while processing listeners: {entry.result}')
 
         for listener in self.listeners:
             if len(created) > 0:
@@ -89,104 +213,272 @@ class BulkProcessor:
             if len(noops) > 0:
                 listener.no_changes(noops)
 
+    def __flush_batches(self):
+        _set_processing(True)
+        while True:
+            batch = self.__batches.get()
+            try:
+                if batch is None:
+                    return
+                self.__send(*batch)
+            except Exception as ex:
+                # Raised on the caller's thread by the next action or close()
+                self.__error = self.__error or ex
+            finally:
+                self.__batches.task_done()
+
+    def __flush_periodically(self):
+        _set_processing(True)
+        while not self.__closed.wait(self.flush_interval):
+            try:
+                batch = self._take_batch()
+                if batch is not None:
+                    self.__dispatch(*batch)
+            except Exception as ex:
+                logging.getLogger('elastic').exception("Error encountered during interval flush: {}".format(str(ex)))
+
+    def __raise_error(self):
+        if self.__error is not None:
+            error = self.__error
+            self.__error = None
+            raise error
+
+    def _take_batch(self):
+        with self.__lock:
+            if self.current_batch_size == 0:
+                return None
+            batch = (self.entries, self.current_batch_size)
+            self.entries = []
+            self.current_batch_size = 0
+            self.current_batch_bytes = 0
+            return batch
+
+    def __dispatch(self, entries, batch_size):
+        if self.__batches is None:
+            self.__send(entries, batch_size)
+        else:
+            self.__raise_error()
+            # Blocks while queue_size batches are waiting, applying backpressure to the caller
+            self.__batches.put((entries, batch_size))
+
     def process_batch(self):
-        if self.current_batch_size == 0:
+        batch = self._take_batch()
+        if batch is None:
             logging.getLogger('elastic').warning("Request to process batch was made.  But batch is currently empty.")
             return
-
-        logging.getLogger('elastic').info("Processing Bulk Index Batch. Size: {}".format(str(self.current_batch_size)))
-        headers = self.request_session.headers
-        headers['Content-Type'] = 'application/x-ndjson'
-        r = self.request_session.post(self.root_url + "/_bulk", data=self.entries, headers=headers)
+        self.__dispatch(*batch)
+
+    @staticmethod
+    def __is_retryable(item: dict) -> bool:
+        error = item.get('error')
+        return item.get('status') in retryable_statuses or \
+            (isinstance(error, dict) and error.get('type') in retryable_error_types)
+
+    def __dead_letter(self, action: bytes, error):
+        with self.__results_lock:
+            self.results['errors'] += 1
+            self.results['error_entries'].append(error)
+        if self.dead_letter_sink is not None:
+            try:
+                self.dead_letter_sink.write(action, error)
+                with self.__results_lock:
+                    self.results['dead_lettered'] += 1
+            except Exception as ex:
+                logging.getLogger('elastic').exception("Error writing dead letter: {}".format(str(ex)))
+
+    def __process_response(self, resp_json: dict, entries: List[bytes], can_retry: bool) -> List[bytes]:
+        """
+        Records the outcome of each action of a _bulk response and returns the actions to retry.
+        """
+        retry = []
+        items = []
+        stats = {'errors': 0}
+        for action_item, entry in zip(resp_json['items'], entries):
+            for item in action_item.values():
+                if 'error' in item and can_retry and self.__is_retryable(item):
+                    retry.append(entry)
+                    stats['retried'] = stats.get('retried', 0) + 1
+                    continue
+                if 'error' in item and item.get('status') in self.ignore_status:
+                    items.append(BulkProcessedItem(result='noop', index=item.get('_index'), id_=item.get('_id')))
+                    stats['noop'] = stats.get('noop', 0) + 1
+                    continue
+
+                processed_item = BulkProcessedItem.build(item)
+                items.append(processed_item)
+                if processed_item.result == 'error':
+                    stats['errors'] = stats['errors'] + 1
+                    error = item['error']
+                    if isinstance(error, dict):
+                        error_msg = "Error of Type: {}.  Caused by: {}. For Document ID: {}, in Index: {}" \
+                            .format(error.get('type'), error.get('reason'), item.get('_id'), item.get('_index'))
+                    else:
+                        error_msg = "Error: {}. For Document ID: {}, in Index: {}" \
+                            .format(error, item.get('_id'), item.get('_index'))
+                    logging.getLogger('elastic').error(error_msg)
+                    self.__dead_letter(entry, {'_index': item.get('_index'), '_id': item.get('_id'),
+                                               'status': item.get('status'), 'error': error})
+                else:
+                    stats[processed_item.result] = stats.get(processed_item.result, 0) + 1
+
+        with self.__results_lock:
+            for result, count in stats.items():
+                if result not in ('errors', 'retried'):
+                    self.results[result] = self.results.get(result, 0) + count
+            self.results['retried'] += stats.get('retried', 0)
+        self.__process_listeners(items)
+
+        msg = ''
+        for key, value in stats.items():
+            if len(msg) > 0:
+                msg = msg + ',\t'
+            msg = msg + key + ': ' + str(value)
+        logging.getLogger('elastic').info("Bulk index took: {}, with the following results: {}"
+                                          .format(str(resp_json.get('took')), msg))
+        return retry
+
+    def _backoff_delay(self, attempt) -> float:
+        # Full jitter, so the flushers of many processors do not retry in step
+        return random.uniform(0, min(self.initial_backoff * (2 ** (attempt - 1)), self.max_backoff))
+
+    def _handle_response(self, r, entries: List[bytes], attempt) -> List[bytes]:
+        """
+        Records the outcome of the _bulk response r to entries, already retried attempt times, and returns the actions
+        to resend.
+        """
         if r.status_code >= 400:
             logging.getLogger('elastic').error("Bulk index returned Error Code: {} [{}]".format(str(r.status_code), r.content))
 
-        self.entries = ""
-        self.current_batch_size = 0
-
+        can_retry = attempt < self.max_retries
+        if r.status_code in retryable_statuses:
+            # The whole request was rejected
+            if not can_retry:
+                for entry in entries:
+                    self.__dead_letter(entry, {'status': r.status_code, 'error': r.text})
+                return []
+            retry = entries
+            with self.__results_lock:
+                self.results['retried'] += len(retry)
+        else:
+            try:
+                retry = self.__process_response(r.json(), entries, can_retry)
+            except Exception as ex:
+                logging.getLogger('elastic').exception("Error: {}.  Response: {}".format(str(ex), str(r.content)))
+                raise ex
+
+        if len(retry) > 0:
+            logging.getLogger('elastic').warning("Retrying {} rejected bulk actions.  Attempt {} of {}"
+                                                 .format(len(retry), attempt + 1, self.max_retries))
+        return retry
+
+    def __send(self, entries: List[bytes], batch_size):
+        previous = _set_processing(True)
         try:
-            resp_json = r.json()
-            self.__process_listeners(resp_json)
-            took = resp_json['took']
-            errors = resp_json['errors']
-            stats = {'errors': 0}
-
-            if errors:
-                logging.getLogger('elastic').error('An Error occurred while performing the bulk index')
-
-            for item in resp_json['items']:
-                if "index" in item:
-                    if 'error' in item['index']:
-                        stats['errors'] = stats['errors'] + 1
-                        error_msg = "Error of Type: {}.  Caused by: {}. For Document ID: {}, in Index: {}" \
-                            .format(item['index']['error']['type'], item['index']['error']['reason']
-                                    , item['index']['_id'], item['index']['_index'])
-                        logging.getLogger('elastic').error(error_msg)
-                    else:
-                        if item['index']['result'] not in stats:
-                            stats[item['index']['result']] = 0
-
-                        stats[item['index']['result']] = stats[item['index']['result']] + 1
-
-            msg = ''
-            for key, value in stats.items():
-                if len(msg) > 0:
-                    msg = msg + ',\t'
-                msg = msg + key + ': ' + str(value)
-            logging.getLogger('elastic').info("Bulk index took: {}, with the following results: {}".format(str(took), msg))
-
-        except Exception as ex:
-            logging.getLogger('elastic').exception("Error: {}.  Response: {}".format(str(ex), str(r.json)))
-            raise ex
+            attempt = 0
+            while True:
+                logging.getLogger('elastic').info("Processing Bulk Index Batch. Size: {}".format(str(len(entries))))
+                # The only copy of the batch.  requests streams a bytearray or memoryview as an iterable, so bytes are
+                # sent
+                r = self.request_session.post(self.root_url + "/_bulk", data=b''.join(entries),
+                                              headers={'Content-Type': 'application/x-ndjson'})
+                entries = self._handle_response(r, entries, attempt)
+                if len(entries) == 0:
+                    return
+                attempt += 1
+                time.sleep(self._backoff_delay(attempt))
+        finally:
+            _set_processing(previous)
+
+    def __dumps(self, obj) -> bytes:
+        if self.use_orjson:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj).encode('utf-8')
+
+    def _append(self, action: dict, source: dict = None):
+        # One bytes object per action, so rejected actions can be resent on their own
+        chunks = [self.__dumps(action), NEWLINE]
+        if source is not None:
+            chunks.extend([self.__dumps(source), NEWLINE])
+        entry = b''.join(chunks)
+        self.entries.append(entry)
+        self.current_batch_bytes += len(entry)
+        self.current_batch_size += 1
 
-    def _check_for_processing(self):
-        if len(self.entries.encode('utf-8')) > self.batch_max_size_bytes:
+    def _take_full_batch(self):
+        """
+        Takes the current batch if it has reached batch_size actions or batch_max_size_bytes.  Called under the lock;
+        the batch is sent after the lock is released, so other callers keep adding actions while it is sent and
+        retried.
+        """
+        if self.current_batch_bytes > self.batch_max_size_bytes:
             logging.getLogger('elastic').warning("Length of entries exceeds {} bytes.  Processing current batch before adding new entry.".format(self.batch_max_size_bytes))
-            self.process_batch()
+            return self._take_batch()
         elif self.current_batch_size >= self.batch_size:
-            if len(self.entries) <= 5:
+            if self.current_batch_bytes <= 5:
                 logging.getLogger('elastic').warning("Batch size is {}, but length of content is {}. Content: {}"
-                                                     .format(str(self.batch_size), str(len(self.entries)), self.entries))
-            self.process_batch()
+                                                     .format(str(self.batch_size), str(self.current_batch_bytes),
+                                                             b''.join(self.entries)))
+            return self._take_batch()
+        return None
+
+    def __add(self, action: dict, source: dict = None):
+        with self.__lock:
+            batches = [self._take_full_batch()]
+            self._append(action, source)
+            batches.append(self._take_full_batch())
+        for batch in batches:
+            if batch is not None:
+                self.__dispatch(*batch)
 
     def delete(self, index, _id):
-        self._check_for_processing()
-        self.entries = self.entries + json.dumps({"delete": {"_index": index, "_id": _id}}) + "\n"
-        self.current_batch_size += 1
-        self._check_for_processing()
-
-    def update(self, index, entry, _id):
-        self._check_for_processing()
-        self.entries = self.entries + json.dumps({"update": {"_index": index, "_id": _id}}) + "\n"
-        self.entries = self.entries + json.dumps({"doc": entry}) + "\n"
-        self.current_batch_size += 1
-        self._check_for_processing()
+        self.__add({"delete": {"_index": index, "_id": _id}})
 
-    def index(self, index, entry, _id=None):
-        self._check_for_processing()
+    def update(self, index, entry, _id, doc_as_upsert=False):
+        if doc_as_upsert:
+            self.__add({"update": {"_index": index, "_id": _id}}, {"doc": entry, "doc_as_upsert": True})
+        else:
+            self.__add({"update": {"_index": index, "_id": _id}}, {"doc": entry})
 
+    def index(self, index, entry, _id=None, version=None, version_type=None):
+        action = {"_index": index}
         if _id is not None:
-            self.entries = self.entries + json.dumps({"index": {"_index": index, "_id": _id}}) + "\n"
-        else:
-            self.entries = self.entries + json.dumps({"index": {"_index": index}}) + "\n"
-        self.entries = self.entries + json.dumps(entry) + "\n"
-        self.current_batch_size += 1
-        self._check_for_processing()
+            action["_id"] = _id
+        if version is not None:
+            action["version"] = version
+            action["version_type"] = version_type or 'external'
+        self.__add({"index": action}, entry)
 
     def create(self, index, entry, _id=None):
-        self._check_for_processing()
-
         if _id is not None:
-            self.entries = self.entries + json.dumps({"create": {"_index": index, "_id": _id}}) + "\n"
+            self.__add({"create": {"_index": index, "_id": _id}}, entry)
         else:
-            self.entries = self.entries + json.dumps({"create": {"_index": index}}) + "\n"
-        self.entries = self.entries + json.dumps(entry) + "\n"
-        self.current_batch_size += 1
-        self._check_for_processing()
+            self.__add({"create": {"_index": index}}, entry)
+
+    def flush(self):
+        batch = self._take_batch()
+        if batch is not None:
+            self.__dispatch(*batch)
+        if self.__batches is not None:
+            self.__batches.join()
+            self.__raise_error()
 
     def close(self):
-        self.process_batch()
+        if self.__closed.is_set():
+            return self.results
+        self.__closed.set()
+        if self.__timer is not None:
+            self.__timer.join()
+
+        batch = self._take_batch()
+        if batch is not None:
+            self.__dispatch(*batch)
+        if self.__batches is not None:
+            for _ in self.__flushers:
+                self.__batches.put(None)
+            for flusher in self.__flushers:
+                flusher.join()
+            self.__raise_error()
         return self.results
 
     def __exit__(self, type, value, traceback):
-        self.process_batch()
+        self.close()
@@ -0,0 +1,41 @@
+import threading
+
+
+class ConnectionRegistry:
+    """
+    Process wide registry of ElasticsearchConnection instances, keyed by server, port, API key and compression
+    settings, so every cache, log handler and analyser talking to the same cluster shares one connection pool.  The
+    pool is sized by the first caller for a key.  As a connection may have other users, its close() (and leaving a
+    with block) does not close it; close_all() closes every connection, e.g. at shutdown.
+    """
+
+    def __init__(self) -> None:
+        self.connections = {}
+        self.__lock = threading.Lock()
+
+    def get_connection(self, server, port, api_key, http_compress=False, compression_level=6, pool_size=10):
+        from . import ElasticsearchConnection
+
+        key = (server, str(port), api_key, http_compress, compression_level if http_compress else None)
+        with self.__lock:
+            if key not in self.connections:
+                self.connections[key] = ElasticsearchConnection(server=server, port=port, api_key=api_key,
+                                                                http_compress=http_compress,
+                                                                compression_level=compression_level,
+                                                                pool_size=pool_size)
+                self.connections[key].registry_managed = True
+            return self.connections[key]
+
+    def close_all(self):
+        with self.__lock:
+            for connection in self.connections.values():
+                connection._close()
+            self.connections.clear()
+
+
+registry = ConnectionRegistry()
+
+
+def get_connection(server, port, api_key, http_compress=False, compression_level=6, pool_size=10):
+    return registry.get_connection(server, port, api_key, http_compress=http_compress,
+                                   compression_level=compression_level, pool_size=pool_size)
@@ -1,36 +1,238 @@
+import queue
+import threading
+
+from .streamingParser import StreamingResponseParser
+
+_slice_done = object()
+
+
 class ScrollQuery:
+    """
+    Iterates every hit of a query, one page of page_size hits at a time, parsing each page once.
+    By default a single scroll cursor is walked.  With slices > 1 the query is split into that many slices
+    (slice: {id, max}) read concurrently by up to workers threads (default one per slice) and the hits of every slice
+    are merged into one generator, in no particular order across slices.  With point_in_time each slice is paged with
+    search_after against a point in time instead of a scroll context, sorted by _shard_doc unless the query sets a
+    sort.  source is sent as _source to limit the fields returned.
+    With streaming, each response is read in chunk_size chunks and its hits are yielded as they are decoded, so a page
+    of large documents is never held in memory at once.
+    """
 
-    def __init__(self, request_session, root_url) -> None:
+    def __init__(self, request_session, root_url, keep_alive='1m', chunk_size=65536) -> None:
         super().__init__()
         self.request_session = request_session
         self.root_url = root_url
+        self.keep_alive = keep_alive
+        self.chunk_size = chunk_size
         self.scroll_ids = []
+        self.__lock = threading.Lock()
 
     def close(self):
-        body = {"scroll_id": self.scroll_ids}
-        r = self.request_session.delete(self.root_url + "_search/scroll", json=body)
-        self.scroll_ids.clear()
+        with self.__lock:
+            scroll_ids = list(self.scroll_ids)
+            self.scroll_ids.clear()
+        if len(scroll_ids) > 0:
+            body = {"scroll_id": scroll_ids}
+            r = self.request_session.delete(self.root_url + "_search/scroll", json=body)
 
     def clear(self):
         self.close()
 
-    def query(self, index, query):
-        scroll = "1m"
-        body = query
+    def __search(self, url, body) -> dict:
+        r = self.request_session.post(url, json=body)
+        if r.status_code != 200:
+            raise Exception('Search {} failed.  Status code: {}, Error: {}'.format(url, str(r.status_code), r.text))
+        return r.json()
+
+    def __stream(self, url, body):
+        response = self.request_session.post(url, json=body, stream=True)
+        if response.status_code != 200:
+            try:
+                raise Exception('Search {} failed.  Status code: {}, Error: {}'
+                                .format(url, str(response.status_code), response.text))
+            finally:
+                response.close()
+        return response, StreamingResponseParser(response.iter_content(chunk_size=self.chunk_size))
+
+    def __track_scroll(self, scroll_id, previous_scroll_id=None):
+        with self.__lock:
+            if previous_scroll_id in self.scroll_ids:
+                self.scroll_ids[self.scroll_ids.index(previous_scroll_id)] = scroll_id
+            elif scroll_id not in self.scroll_ids:
+                self.scroll_ids.append(scroll_id)
+
+    def __release_scroll(self, scroll_id):
+        with self.__lock:
+            if scroll_id not in self.scroll_ids:
+                return
+            self.scroll_ids.remove(scroll_id)
+        self.request_session.delete(self.root_url + "_search/scroll", json={"scroll_id": [scroll_id]})
+
+    def __scroll_pages(self, index, body, stop: threading.Event):
+        resp = self.__search(self.root_url + index + "/_search?scroll=" + self.keep_alive, body)
+        scroll_id = resp['_scroll_id']
+        self.__track_scroll(scroll_id)
+
+        try:
+            while len(resp['hits']['hits']) > 0 and not stop.is_set():
+                yield resp['hits']['hits']
+                resp = self.__search(self.root_url + "_search/scroll", {"scroll": self.keep_alive,
+                                                                         "scroll_id": scroll_id})
+                if resp.get('_scroll_id', scroll_id) != scroll_id:
+                    self.__track_scroll(resp['_scroll_id'], scroll_id)
+                    scroll_id = resp['_scroll_id']
+        finally:
+            # Frees the search context as soon as the cursor is exhausted or abandoned
+            self.__release_scroll(scroll_id)
+
+    def __streamed_scroll_pages(self, index, body, stop: threading.Event):
+        url = self.root_url + index + "/_search?scroll=" + self.keep_alive
+        scroll_id = None
+        try:
+            while not stop.is_set():
+                response, parser = self.__stream(url, body)
+                hits = 0
+                try:
+                    for hit in parser.items():
+                        if hits == 0:
+                            # _scroll_id precedes the hits, so the context can be released if the page is abandoned
+                            self.__track_scroll(parser.metadata['_scroll_id'], scroll_id)
+                            scroll_id = parser.metadata['_scroll_id']
+                        hits += 1
+                        yield [hit]
+                finally:
+                    response.close()
+
+                if hits == 0:
+                    if '_scroll_id' in parser.metadata:
+                        self.__track_scroll(parser.metadata['_scroll_id'], scroll_id)
+                        scroll_id = parser.metadata['_scroll_id']
+                    return
+                url = self.root_url + "_search/scroll"
+                body = {"scroll": self.keep_alive, "scroll_id": scroll_id}
+        finally:
+            if scroll_id is not None:
+                self.__release_scroll(scroll_id)
+
+    def __pit_pages(self, body, pit_id, stop: threading.Event, streaming=False):
+        body = dict(body)
+        body['pit'] = {'id': pit_id, 'keep_alive': self.keep_alive}
+        body.setdefault('sort', ['_shard_doc'])
+        while not stop.is_set():
+            if streaming:
+                response, parser = self.__stream(self.root_url + "_search", body)
+                last_hit = None
+                try:
+                    for hit in parser.items():
+                        last_hit = hit
+                        yield [hit]
+                finally:
+                    response.close()
+                metadata = parser.metadata
+            else:
+                metadata = self.__search(self.root_url + "_search", body)
+                hits = metadata['hits']['hits']
+                last_hit = hits[-1] if len(hits) > 0 else None
+                if last_hit is not None:
+                    yield hits
+
+            if last_hit is None:
+                return
+            body['pit'] = {'id': metadata.get('pit_id', pit_id), 'keep_alive': self.keep_alive}
+            body['search_after'] = last_hit['sort']
+
+    def __open_point_in_time(self, index) -> str:
+        r = self.request_session.post(self.root_url + index + "/_pit?keep_alive=" + self.keep_alive)
+        if r.status_code != 200:
+            raise Exception('Opening point in time on {} failed.  Status code: {}, Error: {}'
+                            .format(index, str(r.status_code), r.text))
+        return r.json()['id']
+
+    def __close_point_in_time(self, pit_id):
+        self.request_session.delete(self.root_url + "_pit", json={"id": pit_id})
+
+    @staticmethod
+    def __put(pages: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __read_slices(self, cursor, slice_ids, pages: queue.Queue, stop: threading.Event):
+        try:
+            for slice_id in slice_ids:
+                slice_pages = cursor(slice_id, stop)
+                try:
+                    for page in slice_pages:
+                        if not self.__put(pages, page, stop):
+                            return
+                finally:
+                    slice_pages.close()
+        except Exception as ex:
+            self.__put(pages, ex, stop)
+        finally:
+            self.__put(pages, _slice_done, stop)
+
+    def __merge(self, cursor, slices, workers):
+        workers = min(workers or slices, slices)
+        pages = queue.Queue(maxsize=workers * 2)
+        stop = threading.Event()
+        readers = [threading.Thread(target=self.__read_slices, name='ScrollQuerySlice-{}'.format(worker), daemon=True,
+                                    args=(cursor, range(worker, slices, workers), pages, stop))
+                   for worker in range(workers)]
+        for reader in readers:
+            reader.start()
+
+        finished = 0
+        try:
+            while finished < len(readers):
+                page = pages.get()
+                if page is _slice_done:
+                    finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for hit in page:
+                        yield hit
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
 
-        r = self.request_session.post(self.root_url + index + "/_search?scroll=1m", json=body)
+    def query(self, index, query, slices=1, workers=None, page_size=None, source=None, point_in_time=False,
+              streaming=False):
+        body = dict(query)
+        if page_size is not None:
+            body['size'] = page_size
+        if source is not None:
+            body['_source'] = source
 
-        scroll_id = r.json()['_scroll_id']
-        self.scroll_ids.append(scroll_id)
-        hits = r.json()['hits']['hits']
-        scroll_query = {"scroll": scroll, "scroll_id": scroll_id}
+        pit_id = self.__open_point_in_time(index) if point_in_time else None
 
-        while len(hits) > 0:
-            for hit in hits:
-                yield hit
+        def cursor(slice_id, stop):
+            sliced_body = body
+            if slices > 1:
+                sliced_body = dict(body)
+                sliced_body['slice'] = {'id': slice_id, 'max': slices}
+            if point_in_time:
+                return self.__pit_pages(sliced_body, pit_id, stop, streaming=streaming)
+            if streaming:
+                return self.__streamed_scroll_pages(index, sliced_body, stop)
+            return self.__scroll_pages(index, sliced_body, stop)
 
-            r = self.request_session.post(self.root_url + "_search/scroll", json=scroll_query)
-            hits = r.json()['hits']['hits']
+        try:
+            if slices > 1:
+                yield from self.__merge(cursor, slices, workers)
+            else:
+                for page in cursor(0, threading.Event()):
+                    for hit in page:
+                        yield hit
+        finally:
+            if pit_id is not None:
+                self.__close_point_in_time(pit_id)
 
     def __enter__(self):
         """Return self object to use with "with" statement."""
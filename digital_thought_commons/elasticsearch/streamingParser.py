@@ -0,0 +1,122 @@
+import codecs
+import json
+from typing import Iterator, Sequence
+
+whitespace = ' \t\n\r'
+
+
+class StreamingResponseParser:
+    """
+    Incrementally parses a JSON response body from an iterator of byte chunks.
+    items(path) yields each element of the array found by following path (e.g. ('hits', 'hits')) as soon as it is
+    decoded, while every other field along the way is decoded whole into metadata.  Only the element being decoded
+    and the unread part of the current chunks are held in memory, so peak memory is about one document rather than one
+    page.  Fields that come before the array in the response (_scroll_id, pit_id, took) are in metadata once the first
+    element has been yielded, fields after it (aggregations) once the items are exhausted.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = iter(chunks)
+        self.metadata = {}
+        self.__text = codecs.getincrementaldecoder('utf-8')()
+        self.__json = json.JSONDecoder()
+        self.__buffer = ''
+        self.__position = 0
+        self.__eof = False
+
+    def __fill(self, min_length=1) -> bool:
+        """
+        Reads chunks until at least min_length unread characters are buffered or the body ends.  Returns False when
+        nothing more could be read.
+        """
+        if self.__eof:
+            return False
+        parts = [self.__buffer[self.__position:]]
+        length = len(parts[0])
+        read = False
+        while length < min_length:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                parts.append(self.__text.decode(b'', final=True))
+                self.__eof = True
+                read = True
+                break
+            text = self.__text.decode(chunk)
+            parts.append(text)
+            length += len(text)
+            read = True
+        self.__buffer = ''.join(parts)
+        self.__position = 0
+        return read
+
+    def __peek(self) -> str:
+        while True:
+            while self.__position < len(self.__buffer) and self.__buffer[self.__position] in whitespace:
+                self.__position += 1
+            if self.__position < len(self.__buffer):
+                return self.__buffer[self.__position]
+            if not self.__fill():
+                raise ValueError('Unexpected end of response body')
+
+    def __expect(self, characters) -> str:
+        character = self.__peek()
+        if character not in characters:
+            raise ValueError('Expected one of {} in response body but found {}'.format(list(characters), character))
+        self.__position += 1
+        return character
+
+    def __value(self):
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__json.raw_decode(self.__buffer, self.__position)
+                # A value ending with the buffer may be a truncated number, so it is only trusted once more follows
+                if end < len(self.__buffer) or self.__eof:
+                    self.__position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            # Doubling what is buffered keeps a large value from being decoded once per chunk
+            self.__fill(max(2 * (len(self.__buffer) - self.__position), 1))
+
+    def __object_keys(self):
+        """
+        Yields each key of the object at the current position, leaving the position at the key's value, which the
+        caller must consume before resuming.
+        """
+        self.__expect('{')
+        if self.__peek() == '}':
+            self.__position += 1
+            return
+        while True:
+            key = self.__value()
+            self.__expect(':')
+            yield key
+            if self.__expect(',}') == '}':
+                return
+
+    def __array_items(self):
+        self.__expect('[')
+        if self.__peek() == ']':
+            self.__position += 1
+            return
+        while True:
+            yield self.__value()
+            if self.__expect(',]') == ']':
+                return
+
+    def __stream(self, path: Sequence[str], metadata: dict):
+        for key in self.__object_keys():
+            if key != path[0]:
+                metadata[key] = self.__value()
+            elif len(path) == 1 and self.__peek() == '[':
+                yield from self.__array_items()
+            elif len(path) > 1 and self.__peek() == '{':
+                metadata[key] = {}
+                yield from self.__stream(path[1:], metadata[key])
+            else:
+                metadata[key] = self.__value()
+
+    def items(self, path: Sequence[str] = ('hits', 'hits')) -> Iterator:
+        yield from self.__stream(path, self.metadata)
@@ -15,15 +15,14 @@ class UrlAnalyser:
     index_name = "malicious-urls"
 
     def __init__(self, elastic_server, elastic_port, elastic_api_key):
-        self.elastic = es.ElasticsearchConnection(server=elastic_server, port=elastic_port,
-                                  api_key=elastic_api_key)
+        self.elastic = es.get_connection(server=elastic_server, port=elastic_port, api_key=elastic_api_key)
 
     def learn(self):
         self.vectorizer, self.lgs = self.tl()
 
     def load_csv(self, path_to_csv):
         logging.info("Processing CSV: {}".format(path_to_csv))
-        bulk_indexer = self.elastic.bulk_processor()
+        bulk_indexer = self.elastic.bulk_processor(concurrent_requests=4)
         with open(path_to_csv, 'r', encoding="UTF-8") as _csv_file:
             csv_reader = csv.reader(_csv_file, delimiter=',')
             for row in csv_reader:
@@ -54,7 +53,7 @@ class UrlAnalyser:
         logging.info("Reading base data")
         data = []
         scroll_query = self.elastic.get_scroller()
-        for entry in scroll_query.query(self.index_name, {"size": 1000}):
+        for entry in scroll_query.query(self.index_name, {}, slices=4, page_size=1000, source=['url', 'status']):
             data.append({'url': entry['_source']['url'], 'status': entry['_source']['status']})
         scroll_query.clear()
 
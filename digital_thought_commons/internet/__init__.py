@@ -1,10 +1,13 @@
+import email.utils
+import gzip
+import time
 from urllib.parse import unquote
 
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
-from digital_thought_commons.internet import requester
+from digital_thought_commons.internet import async_requester, requester
 
 
 class IncompleteDownload(Exception):
@@ -23,14 +26,60 @@ class DownloadException(Exception):
     pass
 
 
+class CompressingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that gzip compresses request bodies of at least min_size bytes (Content-Encoding: gzip) and asks for
+    gzip compressed responses, which requests decompresses transparently.  gzip is added to an Accept-Encoding header
+    that does not list it, the encodings already accepted are kept.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['compression_level', 'min_size']
+
+    def __init__(self, compression_level=6, min_size=1024, **kwargs):
+        self.compression_level = compression_level
+        self.min_size = min_size
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if isinstance(body, bytes) and len(body) >= self.min_size and 'Content-Encoding' not in request.headers:
+            request.body = gzip.compress(body, compresslevel=self.compression_level)
+            request.headers['Content-Encoding'] = 'gzip'
+            request.headers['Content-Length'] = str(len(request.body))
+        accept_encoding = request.headers.get('Accept-Encoding')
+        if not accept_encoding:
+            request.headers['Accept-Encoding'] = 'gzip'
+        elif 'gzip' not in [coding.split(';')[0].strip().lower() for coding in accept_encoding.split(',')]:
+            request.headers['Accept-Encoding'] = accept_encoding + ', gzip'
+        return super().send(request, **kwargs)
+
+
 def new_requester(tor_proxy=None, internet_proxy=None):
     if tor_proxy is None:
         tor_proxy = {"http": 'socks5h://127.0.0.1:9150'}
     return requester.RequesterSession(tor_proxy=tor_proxy, internet_proxy=internet_proxy)
 
 
+def parse_retry_after(value):
+    """
+    Returns the number of seconds a Retry-After header value (delay in seconds or an HTTP date) asks to wait.
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        retry_date = email.utils.parsedate_tz(value)
+        if retry_date is None:
+            return None
+        return max(email.utils.mktime_tz(retry_date) - time.time(), 0)
+
+
 def retry_request_session(retries=3, backoff_factor=0.3, status_forcelist=(400, 500, 502, 504), timeout=60,
-                          user_agent='Mozilla/5.0 (Windows NT 10.0; rv:78.0) Gecko/20100101 Firefox/78.0', headers={}, proxy=None):
+                          user_agent='Mozilla/5.0 (Windows NT 10.0; rv:78.0) Gecko/20100101 Firefox/78.0', headers={}, proxy=None,
+                          respect_retry_after_header=True, http_compress=False, compression_level=6,
+                          pool_connections=10, pool_maxsize=10):
     base_headers = {'User-Agent': user_agent}
     base_headers.update(headers)
     request_session = requests.Session()
@@ -47,15 +96,29 @@ def retry_request_session(retries=3, backoff_factor=0.3, status_forcelist=(400,
         connect=retries,
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
+        respect_retry_after_header=respect_retry_after_header,
     )
 
-    adapter = HTTPAdapter(max_retries=retry)
+    if http_compress:
+        adapter = CompressingHTTPAdapter(compression_level=compression_level, max_retries=retry,
+                                         pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    else:
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
     request_session.mount('http://', adapter)
     request_session.mount('https://', adapter)
 
     return request_session
 
 
+def async_retry_request_session(retries=3, backoff_factor=0.3, status_forcelist=(400, 500, 502, 504), timeout=60,
+                                user_agent='Mozilla/5.0 (Windows NT 10.0; rv:78.0) Gecko/20100101 Firefox/78.0',
+                                headers={}, proxy=None, respect_retry_after_header=True):
+    return async_requester.AsyncRetrySession(retries=retries, backoff_factor=backoff_factor,
+                                             status_forcelist=status_forcelist, timeout=timeout,
+                                             user_agent=user_agent, headers=headers, proxy=proxy,
+                                             respect_retry_after_header=respect_retry_after_header)
+
+
 def source_details(requester_session, source_url):
     headers = requester_session.head(source_url, allow_redirects=True)
 
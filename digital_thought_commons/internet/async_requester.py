@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import weakref
+from urllib.parse import urlparse
+
+from digital_thought_commons import internet
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+retry_after_status_codes = frozenset([413, 429, 503])
+retry_methods = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
+max_backoff = 120
+
+__connectors = weakref.WeakKeyDictionary()
+__pool_users = weakref.WeakKeyDictionary()
+
+
+class RetryError(Exception):
+    pass
+
+
+def connection_pool(limit=100, limit_per_host=0):
+    """
+    Returns the aiohttp connector shared by every AsyncRetrySession on the running event loop.  limit and
+    limit_per_host only apply when the connector is first created on a loop.  The connector is closed when the last
+    AsyncRetrySession using it on the loop is closed, or by close_connection_pool().
+    """
+    if aiohttp is None:
+        raise Exception('The aiohttp package is required for asynchronous requests')
+
+    loop = asyncio.get_running_loop()
+    connector = __connectors.get(loop)
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+        __connectors[loop] = connector
+    return connector
+
+
+def _use_connection_pool():
+    connector = connection_pool()
+    loop = asyncio.get_running_loop()
+    __pool_users[loop] = __pool_users.get(loop, 0) + 1
+    return connector
+
+
+async def _release_connection_pool():
+    loop = asyncio.get_running_loop()
+    users = __pool_users.get(loop, 0) - 1
+    if users > 0:
+        __pool_users[loop] = users
+        return
+    await close_connection_pool()
+
+
+async def close_connection_pool():
+    loop = asyncio.get_running_loop()
+    __pool_users.pop(loop, None)
+    connector = __connectors.pop(loop, None)
+    if connector is not None:
+        await connector.close()
+
+
+class AsyncResponse:
+
+    def __init__(self, url, status_code, headers, content: bytes) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('UTF-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncRetrySession:
+    """
+    asyncio counterpart of internet.retry_request_session.
+    Requests are sent over the shared connection pool, which is closed with the last session using it, and retried with the same semantics as the urllib3 Retry used by
+    the blocking session: connection errors and status codes in status_forcelist are retried up to retries times with
+    an exponential backoff of backoff_factor * 2^(retry - 1) seconds, and unless respect_retry_after_header is False a
+    413, 429 or 503 response with a Retry-After header is retried after the delay it asks for.  Only HTTP proxies are
+    supported.
+    """
+
+    def __init__(self, retries=3, backoff_factor=0.3, status_forcelist=(400, 500, 502, 504), timeout=60,
+                 user_agent='Mozilla/5.0 (Windows NT 10.0; rv:78.0) Gecko/20100101 Firefox/78.0', headers={},
+                 proxy=None, respect_retry_after_header=True) -> None:
+        if aiohttp is None:
+            raise Exception('The aiohttp package is required for asynchronous requests')
+
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = frozenset(status_forcelist or [])
+        self.timeout = timeout
+        self.headers = {'User-Agent': user_agent}
+        self.headers.update(headers)
+        self.proxy = proxy or {}
+        self.respect_retry_after_header = respect_retry_after_header
+        self.__sessions = weakref.WeakKeyDictionary()
+
+    def __session(self):
+        loop = asyncio.get_running_loop()
+        session = self.__sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(connector=_use_connection_pool(), connector_owner=False,
+                                            headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.__sessions[loop] = session
+        return session
+
+    def __backoff(self, retry):
+        if retry <= 1:
+            return 0
+        return min(self.backoff_factor * (2 ** (retry - 1)), max_backoff)
+
+    def __is_retry(self, method, response: AsyncResponse):
+        if method.upper() not in retry_methods:
+            return False
+        if response.status_code in self.status_forcelist:
+            return True
+        return self.respect_retry_after_header and response.status_code in retry_after_status_codes and \
+            'Retry-After' in response.headers
+
+    async def request(self, method, url, headers=None, verify=True, **kwargs) -> AsyncResponse:
+        proxy = self.proxy.get(urlparse(url).scheme)
+        retry = 0
+        while True:
+            try:
+                async with self.__session().request(method, url, headers=headers, proxy=proxy,
+                                                    ssl=None if verify else False, **kwargs) as client_response:
+                    response = AsyncResponse(url, client_response.status, client_response.headers,
+                                             await client_response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                if retry >= self.retries:
+                    raise
+                retry += 1
+                logging.debug('Retrying {} {} after error: {}'.format(method, url, str(ex)))
+                await asyncio.sleep(self.__backoff(retry))
+                continue
+
+            if not self.__is_retry(method, response):
+                return response
+            if retry >= self.retries:
+                raise RetryError('Max retries exceeded with url: {} (too many {} error responses)'
+                                 .format(url, response.status_code))
+
+            retry += 1
+            delay = None
+            if self.respect_retry_after_header and response.status_code in retry_after_status_codes:
+                delay = internet.parse_retry_after(response.headers.get('Retry-After'))
+            logging.debug('Retrying {} {} after status code {}'.format(method, url, response.status_code))
+            await asyncio.sleep(self.__backoff(retry) if delay is None else delay)
+
+    async def get(self, url, **kwargs) -> AsyncResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs) -> AsyncResponse:
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        session = self.__sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            closed = session.closed
+            await session.close()
+            if not closed:
+                await _release_connection_pool()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
@@ -1,37 +1,79 @@
 import logging
+import queue
+import threading
 import traceback
 from logging import LogRecord
 
 from digital_thought_commons import elasticsearch
+from digital_thought_commons.elasticsearch import bulkProcessor
+
+_stop = object()
 
 
 class ElasticsearchLogHandler(logging.Handler):
+    """
+    Ships log records to <prefix>-event-logs.  emit() never blocks: records are put on a queue of at most
+    max_queued_records, drained by a shipper thread into a BulkProcessor that sends a batch every second, and records
+    arriving while the queue is full are dropped and counted in dropped_records.  Records logged by the BulkProcessor,
+    or by anything it calls, while it is sending are not shipped.
+    """
 
-    def __init__(self, prefix, server, port, api_key):
+    def __init__(self, prefix, server, port, api_key, http_compress=False, max_queued_records=10000):
         super().__init__()
         self.prefix = prefix
         self.server = server
         self.port = port
         self.api_key = api_key
+        self.dropped_records = 0
+        self.records = queue.Queue(maxsize=max_queued_records)
 
-        self.elastic = elasticsearch.ElasticsearchConnection(server=self.server, port=self.port, api_key=self.api_key)
+        self.elastic = elasticsearch.get_connection(server=self.server, port=self.port, api_key=self.api_key,
+                                                    http_compress=http_compress)
         self.__initialise_index()
-        self.bulk_indexer = self.elastic.bulk_processor(batch_size=2)
+        self.bulk_indexer = self.elastic.bulk_processor(batch_size=500, flush_interval=1)
+        # Checked before the handler lock is taken, so the shipper and the processor never wait on it
+        self.addFilter(self.__is_shippable)
+        self.__shipper = threading.Thread(target=self.__ship, daemon=True, name='ElasticsearchLogHandlerShipper')
+        self.__shipper.start()
 
     def __initialise_index(self):
         template = self.elastic.default_index_templates()['event-logs-v1']
         self.elastic.install_index_template(template_name='event-logs-v1', template=template, prefix=self.prefix)
 
+    def __is_shippable(self, record: LogRecord) -> bool:
+        return not bulkProcessor.is_processing() and threading.current_thread() is not self.__shipper
+
+    def __ship(self):
+        while True:
+            entry = self.records.get()
+            try:
+                if entry is _stop:
+                    return
+                self.bulk_indexer.index(index='{}-event-logs'.format(self.prefix), entry=entry)
+            except Exception:
+                self.dropped_records += 1
+            finally:
+                self.records.task_done()
+
     def flush(self) -> None:
         super().flush()
-        self.bulk_indexer.process_batch()
+        if self.__shipper.is_alive():
+            self.records.join()
+        if self.bulk_indexer.current_batch_size > 0:
+            self.bulk_indexer.process_batch()
 
     def close(self) -> None:
         super().close()
-        self.bulk_indexer.close()
+        if self.__shipper.is_alive():
+            self.records.put(_stop)
+            self.__shipper.join()
+            self.bulk_indexer.close()
 
     def emit(self, record: LogRecord) -> None:
-        self.bulk_indexer.index(index='{}-event-logs'.format(self.prefix), entry=self.__build_record(record))
+        try:
+            self.records.put_nowait(self.__build_record(record))
+        except queue.Full:
+            self.dropped_records += 1
 
     def __build_exception_details(self, record):
         exception_stack = ""
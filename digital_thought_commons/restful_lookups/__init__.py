@@ -0,0 +1,41 @@
+import re
+
+from digital_thought_commons import internet
+
+retries_exhausted_pattern = re.compile(r'too many (\d{3}) error responses')
+
+
+class LookupStatusError(Exception):
+    """
+    Raised by the lookup clients when an API responds with an unexpected status code.
+    """
+
+    def __init__(self, status_code, content, retry_after=None) -> None:
+        super().__init__('Status code {} encountered while looking up IP address.  Error: {}'
+                         .format(str(status_code), content))
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def status_error(response) -> LookupStatusError:
+    return LookupStatusError(response.status_code, response.content,
+                             internet.parse_retry_after(response.headers.get('Retry-After')))
+
+
+def error_response(ex: Exception) -> dict:
+    """
+    Builds the error response returned by the lookup clients.  The status code (and Retry-After delay in seconds) are
+    included when known, so APICache can apply the negative cache TTL and rate limit backoff for that class of error.
+    """
+    response = {'error': str(ex)}
+    status_code = getattr(ex, 'status_code', None)
+    if status_code is None:
+        # Retries exhausted on a status_forcelist code, the status only survives in the message
+        match = retries_exhausted_pattern.search(str(ex))
+        if match:
+            status_code = int(match.group(1))
+    if status_code is not None:
+        response['status_code'] = status_code
+    if getattr(ex, 'retry_after', None) is not None:
+        response['retry_after'] = ex.retry_after
+    return response
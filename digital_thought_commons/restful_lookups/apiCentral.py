@@ -1,17 +1,20 @@
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class APICentral:
 
-    def __init__(self, base_url, api_key):
+    def __init__(self, base_url, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
         self.base_url = base_url
-        self.request_session = internet.retry_request_session(headers={'x-api-key': self.api_key})
+        self.request_session = internet.retry_request_session(headers={'x-api-key': self.api_key},
+                                                              respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('api-central')
+        self.cache = get_cache('api-central')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
 
     def __lookup_ip(self, ip_address, advanced):
         try:
@@ -21,13 +24,45 @@ class APICentral:
                 url = url + '?advanced=1'
             response = self.request_session.get(url, verify=False)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
+                raise status_error(response)
 
             return response.json()
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def lookup(self, ip_address, advanced=False):
         return self.cache.lookup(self.__lookup_ip, ip_address=ip_address, advanced=advanced)
+
+
+class AsyncAPICentral:
+
+    def __init__(self, base_url, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.request_session = internet.async_retry_request_session(headers={'x-api-key': self.api_key},
+                                                                    respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('api-central')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
+
+    async def __lookup_ip(self, ip_address, advanced):
+        try:
+            logging.debug('Performing API Central Lookup for: {}'.format(ip_address))
+            url = '{}/enrichment/ip-address/{}'.format(self.base_url, ip_address)
+            if advanced:
+                url = url + '?advanced=1'
+            response = await self.request_session.get(url, verify=False)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            return response.json()
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    async def lookup(self, ip_address, advanced=False):
+        return await self.cache.lookup(self.__lookup_ip, ip_address=ip_address, advanced=advanced)
+
+    async def close(self):
+        await self.request_session.close()
@@ -5,7 +5,7 @@ import os
 from datetime import datetime
 
 from digital_thought_commons import date_utils, internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_cache
 
 
 class IanaPortServiceNames:
@@ -16,7 +16,7 @@ class IanaPortServiceNames:
         self.request_session = internet.retry_request_session()
         self.local_db_directory = "./iana"
         self.local_db = "./iana/iana_service_names_port_numbers.sqlite"
-        self.cache = APICache('iana_service_names_port_numbers')
+        self.cache = get_cache('iana_service_names_port_numbers')
         self.iana_csv = '{}/{}'.format(self.local_db_directory, 'service-names-port-numbers.csv')
         self.last_lookup = 0
         self.data = None
@@ -3,7 +3,8 @@ import json
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class IPAbuseDB:
@@ -15,11 +16,40 @@ class IPAbuseDB:
 
     api_url = 'https://api.abuseipdb.com/api/v2/check'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
-        self.request_session = internet.retry_request_session(headers={'Key': self.api_key})
+        self.request_session = internet.retry_request_session(headers={'Key': self.api_key},
+                                                              respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('abuseipdb')
+        self.cache = get_cache('abuseipdb')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
+
+    @classmethod
+    def parse_response(cls, resp):
+        abuse_response = {}
+        if 'errors' not in resp:
+            abuse_response['ip_address'] = resp['data']['ipAddress']
+            abuse_response['abuse_total_reports'] = resp['data']['totalReports']
+            abuse_response['country_name'] = resp['data']['countryName']
+            abuse_response['usage_type'] = resp['data']['usageType']
+            abuse_response['isp'] = resp['data']['isp']
+            abuse_response['original_encoded_response'] = base64.b64encode(json.dumps(resp).encode('UTF-8')) \
+                .decode('UTF-8')
+
+            categories = []
+            if resp['data']['totalReports'] > 0:
+                abuse_response['abuse_lastReportedAt'] = resp['data']['lastReportedAt']
+                for report in resp['data']['reports']:
+                    for cat in report['categories']:
+                        try:
+                            if cls.categories[str(cat)] not in categories:
+                                categories.append(cls.categories[str(cat)])
+                        except Exception as ex:
+                            logging.exception(ex)
+                            continue
+                abuse_response['abuse_categories'] = categories
+
+        return abuse_response
 
     def __lookup_ip(self, ip_address, max_age_in_days):
         try:
@@ -27,37 +57,43 @@ class IPAbuseDB:
             url = '{}?ipAddress={}&maxAgeInDays={}&verbose=true'.format(self.api_url, ip_address, str(max_age_in_days))
             response = self.request_session.get(url)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
-
-            resp = response.json()
-            abuse_response = {}
-            if 'errors' not in resp:
-                abuse_response['ip_address'] = resp['data']['ipAddress']
-                abuse_response['abuse_total_reports'] = resp['data']['totalReports']
-                abuse_response['country_name'] = resp['data']['countryName']
-                abuse_response['usage_type'] = resp['data']['usageType']
-                abuse_response['isp'] = resp['data']['isp']
-                abuse_response['original_encoded_response'] = base64.b64encode(json.dumps(resp).encode('UTF-8')) \
-                    .decode('UTF-8')
-
-                categories = []
-                if resp['data']['totalReports'] > 0:
-                    abuse_response['abuse_lastReportedAt'] = resp['data']['lastReportedAt']
-                    for report in resp['data']['reports']:
-                        for cat in report['categories']:
-                            try:
-                                if self.categories[str(cat)] not in categories:
-                                    categories.append(self.categories[str(cat)])
-                            except Exception as ex:
-                                logging.exception(ex)
-                                continue
-                    abuse_response['abuse_categories'] = categories
-
-            return abuse_response
+                raise status_error(response)
+
+            return self.parse_response(response.json())
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def lookup(self, ip_address, max_age_in_days=90):
         return self.cache.lookup(self.__lookup_ip, ip_address=ip_address, max_age_in_days=max_age_in_days)
+
+
+class AsyncIPAbuseDB:
+    api_url = 'https://api.abuseipdb.com/api/v2/check'
+
+    def __init__(self, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.request_session = internet.async_retry_request_session(headers={'Key': self.api_key},
+                                                                    respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('abuseipdb')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
+
+    async def __lookup_ip(self, ip_address, max_age_in_days):
+        try:
+            logging.debug('Performing AbuseIP Database Lookup for: {}'.format(ip_address))
+            url = '{}?ipAddress={}&maxAgeInDays={}&verbose=true'.format(self.api_url, ip_address, str(max_age_in_days))
+            response = await self.request_session.get(url)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            return IPAbuseDB.parse_response(response.json())
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    async def lookup(self, ip_address, max_age_in_days=90):
+        return await self.cache.lookup(self.__lookup_ip, ip_address=ip_address, max_age_in_days=max_age_in_days)
+
+    async def close(self):
+        await self.request_session.close()
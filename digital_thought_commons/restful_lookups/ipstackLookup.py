@@ -1,17 +1,20 @@
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class IPStack:
     api_url = 'http://api.ipstack.com/{}?access_key={}&hostname=1&security=1'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
-        self.request_session = internet.retry_request_session(headers={'Key': self.api_key})
+        self.request_session = internet.retry_request_session(headers={'Key': self.api_key},
+                                                              respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('ipstack')
+        self.cache = get_cache('ipstack')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
 
     def __lookup_ip(self, ip_address):
         try:
@@ -19,14 +22,45 @@ class IPStack:
             url = self.api_url.format(ip_address, self.api_key)
             response = self.request_session.get(url)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
+                raise status_error(response)
 
             return response.json()
 
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def lookup(self, ip_address):
         return self.cache.lookup(self.__lookup_ip, ip_address=ip_address)
+
+
+class AsyncIPStack:
+    api_url = 'http://api.ipstack.com/{}?access_key={}&hostname=1&security=1'
+
+    def __init__(self, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.request_session = internet.async_retry_request_session(headers={'Key': self.api_key},
+                                                                    respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('ipstack')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
+
+    async def __lookup_ip(self, ip_address):
+        try:
+            logging.debug('Performing IPStack Lookup for: {}'.format(ip_address))
+            url = self.api_url.format(ip_address, self.api_key)
+            response = await self.request_session.get(url)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            return response.json()
+
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    async def lookup(self, ip_address):
+        return await self.cache.lookup(self.__lookup_ip, ip_address=ip_address)
+
+    async def close(self):
+        await self.request_session.close()
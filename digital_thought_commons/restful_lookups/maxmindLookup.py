@@ -10,7 +10,7 @@ from datetime import datetime
 from shutil import copyfile
 
 from digital_thought_commons import date_utils, internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_cache, normalize_ip
 
 
 class MaxMind:
@@ -22,7 +22,8 @@ class MaxMind:
         self.request_session = internet.retry_request_session()
         self.local_db_directory = "./maxmind"
         self.local_db = "./maxmind/GeoLite2-ASN-Blocks.sqlite"
-        self.cache = APICache('max_mind')
+        self.cache = get_cache('max_mind')
+        self.cache.add_key_normalizer('ip_address', normalize_ip)
         self.asn_ipv4_db = '{}/{}'.format(self.local_db_directory, 'GeoLite2-ASN-Blocks-IPv4.csv')
         self.asn_ipv6_db = '{}/{}'.format(self.local_db_directory, 'GeoLite2-ASN-Blocks-IPv6.csv')
         self.asn_db_gzip = '{}/{}'.format(self.local_db_directory, 'GeoLite2-ASN.zip')
@@ -1,17 +1,18 @@
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class Shodan:
     api_url = 'https://api.shodan.io/{}'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
-        self.request_session = internet.retry_request_session()
+        self.request_session = internet.retry_request_session(respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('shodan')
+        self.cache = get_cache('shodan')
 
     def __lookup(self, query_url):
         try:
@@ -20,8 +21,7 @@ class Shodan:
             url = self.api_url.format(query_url) + 'key={}'.format(self.api_key)
             response = self.request_session.get(url)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
+                raise status_error(response)
 
             try:
                 return response.json()
@@ -30,11 +30,12 @@ class Shodan:
                 raise Exception(response.text)
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def lookup_ip(self, ip_address):
-        query_url = 'shodan/host/{}?'.format(ip_address)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'shodan/host/{}?'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'shodan/host/{}?'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def query(self, query):
         query_url = 'shodan/host/search?query={}&'.format(query)
@@ -43,3 +44,47 @@ class Shodan:
     def api_info(self):
         query_url = 'api-info?'
         return self.cache.lookup(self.__lookup, query_url=query_url)
+
+
+class AsyncShodan:
+    api_url = 'https://api.shodan.io/{}'
+
+    def __init__(self, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.request_session = internet.async_retry_request_session(respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('shodan')
+
+    async def __lookup(self, query_url):
+        try:
+            logging.debug('Performing Shodan Lookup for: {}'.format(query_url))
+
+            url = self.api_url.format(query_url) + 'key={}'.format(self.api_key)
+            response = await self.request_session.get(url)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            try:
+                return response.json()
+            except Exception as ex:
+                logging.exception(response.text)
+                raise Exception(response.text)
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    async def lookup_ip(self, ip_address):
+        query_url = 'shodan/host/{}?'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'shodan/host/{}?'.format(ip_address)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def query(self, query):
+        query_url = 'shodan/host/search?query={}&'.format(query)
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def api_info(self):
+        query_url = 'api-info?'
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def close(self):
+        await self.request_session.close()
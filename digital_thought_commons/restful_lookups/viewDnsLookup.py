@@ -1,17 +1,18 @@
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_domain, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class ViewDNS:
     api_url = 'https://api.viewdns.info/{}'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
-        self.request_session = internet.retry_request_session()
+        self.request_session = internet.retry_request_session(respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('view_dns')
+        self.cache = get_cache('view_dns')
 
     def __lookup(self, query_url):
         try:
@@ -20,8 +21,7 @@ class ViewDNS:
             url = self.api_url.format(query_url) + '&apikey={}&output=json'.format(self.api_key)
             response = self.request_session.get(url)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
+                raise status_error(response)
 
             try:
                 return response.json()
@@ -30,36 +30,111 @@ class ViewDNS:
                 raise Exception(response.text)
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def reverseip(self, ip_address):
-        query_url = 'reverseip/?host={}'.format(ip_address)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'reverseip/?host={}'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'reverseip/?host={}'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def whois(self, value):
-        query_url = 'whois/?domain={}'.format(value)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'whois/?domain={}'.format(normalize_domain(value))
+        legacy_key = {'query_url': 'whois/?domain={}'.format(value)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def dnsrecord(self, domain, record_type):
-        query_url = 'dnsrecord/?domain={}&recordtype={}'.format(domain, record_type)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'dnsrecord/?domain={}&recordtype={}'.format(normalize_domain(domain), record_type)
+        legacy_key = {'query_url': 'dnsrecord/?domain={}&recordtype={}'.format(domain, record_type)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def maclookup(self, mac_address):
         query_url = 'maclookup/?mac={}'.format(mac_address)
         return self.cache.lookup(self.__lookup, query_url=query_url)
 
     def reversedns(self, ip_address):
-        query_url = 'reversedns/?ip={}'.format(ip_address)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'reversedns/?ip={}'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'reversedns/?ip={}'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def reversemx(self, mail_server):
-        query_url = 'reversemx/?mx={}'.format(mail_server)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'reversemx/?mx={}'.format(normalize_domain(mail_server))
+        legacy_key = {'query_url': 'reversemx/?mx={}'.format(mail_server)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def reversens(self, name_server):
-        query_url = 'reversens/?ns={}'.format(name_server)
-        return self.cache.lookup(self.__lookup, query_url=query_url)
+        query_url = 'reversens/?ns={}'.format(normalize_domain(name_server))
+        legacy_key = {'query_url': 'reversens/?ns={}'.format(name_server)}
+        return self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
 
     def reversewhois(self, query):
         query_url = 'reversewhois/?q={}'.format(query)
         return self.cache.lookup(self.__lookup, query_url=query_url)
+
+
+class AsyncViewDNS:
+    api_url = 'https://api.viewdns.info/{}'
+
+    def __init__(self, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.request_session = internet.async_retry_request_session(respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('view_dns')
+
+    async def __lookup(self, query_url):
+        try:
+            logging.debug('Performing ViewDNS Lookup for: {}'.format(query_url))
+
+            url = self.api_url.format(query_url) + '&apikey={}&output=json'.format(self.api_key)
+            response = await self.request_session.get(url)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            try:
+                return response.json()
+            except Exception as ex:
+                logging.exception(response.text)
+                raise Exception(response.text)
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    async def reverseip(self, ip_address):
+        query_url = 'reverseip/?host={}'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'reverseip/?host={}'.format(ip_address)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def whois(self, value):
+        query_url = 'whois/?domain={}'.format(normalize_domain(value))
+        legacy_key = {'query_url': 'whois/?domain={}'.format(value)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def dnsrecord(self, domain, record_type):
+        query_url = 'dnsrecord/?domain={}&recordtype={}'.format(normalize_domain(domain), record_type)
+        legacy_key = {'query_url': 'dnsrecord/?domain={}&recordtype={}'.format(domain, record_type)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def maclookup(self, mac_address):
+        query_url = 'maclookup/?mac={}'.format(mac_address)
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def reversedns(self, ip_address):
+        query_url = 'reversedns/?ip={}'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'reversedns/?ip={}'.format(ip_address)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def reversemx(self, mail_server):
+        query_url = 'reversemx/?mx={}'.format(normalize_domain(mail_server))
+        legacy_key = {'query_url': 'reversemx/?mx={}'.format(mail_server)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def reversens(self, name_server):
+        query_url = 'reversens/?ns={}'.format(normalize_domain(name_server))
+        legacy_key = {'query_url': 'reversens/?ns={}'.format(name_server)}
+        return await self.cache.lookup_with_legacy_key(self.__lookup, legacy_key, query_url=query_url)
+
+    async def reversewhois(self, query):
+        query_url = 'reversewhois/?q={}'.format(query)
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def close(self):
+        await self.request_session.close()
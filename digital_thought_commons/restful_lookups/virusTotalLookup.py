@@ -1,7 +1,8 @@
 import logging
 
 from digital_thought_commons import internet
-from digital_thought_commons.cache import APICache
+from digital_thought_commons.cache import get_async_cache, get_cache, normalize_domain, normalize_ip
+from digital_thought_commons.restful_lookups import error_response, status_error
 
 
 class VirusTotalDomain:
@@ -13,24 +14,29 @@ class VirusTotalDomain:
         self.lookup_method = lookup_method
 
     def retrieve_domain_information(self, domain):
-        query_url = 'domains/{}'.format(domain)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'domains/{}'.format(normalize_domain(domain))
+        legacy_key = {'query_url': 'domains/{}'.format(domain)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_domain_comments(self, ip_address):
-        query_url = 'domains/{}/comments'.format(ip_address)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'domains/{}/comments'.format(normalize_domain(ip_address))
+        legacy_key = {'query_url': 'domains/{}/comments'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_domain_relationships(self, ip_address, relationship):
-        query_url = 'domains/{}/{}'.format(ip_address, relationship)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'domains/{}/{}'.format(normalize_domain(ip_address), relationship)
+        legacy_key = {'query_url': 'domains/{}/{}'.format(ip_address, relationship)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_domain_relationship_objects(self, ip_address, relationship):
-        query_url = 'domains/{}/relationships/{}'.format(ip_address, relationship)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'domains/{}/relationships/{}'.format(normalize_domain(ip_address), relationship)
+        legacy_key = {'query_url': 'domains/{}/relationships/{}'.format(ip_address, relationship)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_domain_votes(self, ip_address):
-        query_url = 'domains/{}/votes?limit=10000'.format(ip_address)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'domains/{}/votes?limit=10000'.format(normalize_domain(ip_address))
+        legacy_key = {'query_url': 'domains/{}/votes?limit=10000'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
 
 class VirusTotalIPAddress:
@@ -42,24 +48,29 @@ class VirusTotalIPAddress:
         self.lookup_method = lookup_method
 
     def retrieve_ip_information(self, ip_address):
-        query_url = 'ip_addresses/{}'.format(ip_address)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'ip_addresses/{}'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'ip_addresses/{}'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_ip_comments(self, ip_address):
-        query_url = 'ip_addresses/{}/comments'.format(ip_address)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'ip_addresses/{}/comments'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'ip_addresses/{}/comments'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_ip_relationships(self, ip_address, relationship):
-        query_url = 'ip_addresses/{}/{}'.format(ip_address, relationship)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'ip_addresses/{}/{}'.format(normalize_ip(ip_address), relationship)
+        legacy_key = {'query_url': 'ip_addresses/{}/{}'.format(ip_address, relationship)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_ip_relationship_objects(self, ip_address, relationship):
-        query_url = 'ip_addresses/{}/relationships/{}'.format(ip_address, relationship)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'ip_addresses/{}/relationships/{}'.format(normalize_ip(ip_address), relationship)
+        legacy_key = {'query_url': 'ip_addresses/{}/relationships/{}'.format(ip_address, relationship)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
     def retrieve_ip_votes(self, ip_address):
-        query_url = 'ip_addresses/{}/votes?limit=10000'.format(ip_address)
-        return self.cache.lookup(self.lookup_method, query_url=query_url)
+        query_url = 'ip_addresses/{}/votes?limit=10000'.format(normalize_ip(ip_address))
+        legacy_key = {'query_url': 'ip_addresses/{}/votes?limit=10000'.format(ip_address)}
+        return self.cache.lookup_with_legacy_key(self.lookup_method, legacy_key, query_url=query_url)
 
 
 # class VirusTotalURL:
@@ -97,11 +108,12 @@ class VirusTotalIPAddress:
 class VirusTotal:
     api_url = 'https://www.virustotal.com/api/v3/{}'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, back_off_on_rate_limit=False):
         self.api_key = api_key
-        self.request_session = internet.retry_request_session(headers={'x-apikey': api_key})
+        self.request_session = internet.retry_request_session(headers={'x-apikey': api_key},
+                                                              respect_retry_after_header=not back_off_on_rate_limit)
 
-        self.cache = APICache('virus_total')
+        self.cache = get_cache('virus_total')
 
     def __lookup(self, query_url):
         try:
@@ -109,13 +121,12 @@ class VirusTotal:
             url = self.api_url.format(query_url)
             response = self.request_session.get(url)
             if response.status_code != 200:
-                raise Exception('Status code {} encountered while looking up IP address.  Error: {}'
-                                .format(str(response.status_code), response.content))
+                raise status_error(response)
 
             return response.json()
         except Exception as ex:
             logging.exception(ex)
-            return {'error': str(ex)}
+            return error_response(ex)
 
     def ip_lookups(self):
         return VirusTotalIPAddress(self.request_session, self.cache, self.api_url, self.__lookup)
@@ -133,3 +144,48 @@ class VirusTotal:
     def virus_total_metadata(self):
         query_url = 'metadata'
         return self.cache.lookup(self.__lookup, query_url=query_url)
+
+
+class AsyncVirusTotal:
+    """
+    The ip_lookups and domain_lookups helpers are shared with VirusTotal, their methods return awaitables when
+    created from this class.
+    """
+    api_url = 'https://www.virustotal.com/api/v3/{}'
+
+    def __init__(self, api_key, back_off_on_rate_limit=False):
+        self.api_key = api_key
+        self.request_session = internet.async_retry_request_session(headers={'x-apikey': api_key},
+                                                                    respect_retry_after_header=not back_off_on_rate_limit)
+
+        self.cache = get_async_cache('virus_total')
+
+    async def __lookup(self, query_url):
+        try:
+            logging.debug('Performing VirusTotal Lookup for: {}'.format(query_url))
+            url = self.api_url.format(query_url)
+            response = await self.request_session.get(url)
+            if response.status_code != 200:
+                raise status_error(response)
+
+            return response.json()
+        except Exception as ex:
+            logging.exception(ex)
+            return error_response(ex)
+
+    def ip_lookups(self):
+        return VirusTotalIPAddress(self.request_session, self.cache, self.api_url, self.__lookup)
+
+    def domain_lookups(self):
+        return VirusTotalDomain(self.request_session, self.cache, self.api_url, self.__lookup)
+
+    async def search(self, query):
+        query_url = 'search?query={}'.format(query)
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def virus_total_metadata(self):
+        query_url = 'metadata'
+        return await self.cache.lookup(self.__lookup, query_url=query_url)
+
+    async def close(self):
+        await self.request_session.close()
@@ -21,6 +21,9 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/Digital-Thought/commons",
     install_requires=requirements,
+    extras_require={
+        'async': ['aiohttp>=3.7'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
@@ -34,6 +37,8 @@ setuptools.setup(
     entry_points={
         'console_scripts': [
             'ip_enrichment = digital_thought_commons.enrichers:main',
+            'api_cache_snapshot = digital_thought_commons.cache.snapshot:main',
+            'api_cache_migrate_keys = digital_thought_commons.cache.keyMigration:main',
         ],
     }
 )
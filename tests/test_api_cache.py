@@ -0,0 +1,205 @@
+import asyncio
+import base64
+import hashlib
+import threading
+import time
+
+import pytest
+import yaml
+
+from digital_thought_commons.cache import APICache, normalize_domain
+from digital_thought_commons.cache.cacheBackend import CacheEntry
+
+config_file = 'digital_thought_commons/_resources/cache/default_cache_config.yaml'
+
+
+@pytest.fixture
+def cache_config(tmp_path):
+    with open(config_file) as default_config:
+        config = yaml.safe_load(default_config)
+    config['cache_type'] = 'file'
+    config['file']['cache_location'] = str(tmp_path)
+    config['negative_cache_ttl'] = {'not_found': 300, 'rate_limited': 0, 'server_error': 0, 'error': 0}
+    custom_config_file = tmp_path / 'cache_config.yaml'
+    with open(custom_config_file, 'w') as custom_config:
+        yaml.safe_dump(config, custom_config)
+    return str(custom_config_file)
+
+
+def test_negative_entry_reloaded_from_backend_expires_on_schedule(cache_config):
+    calls = []
+
+    def not_found(query):
+        calls.append(query)
+        return {'error': 'not found', 'status_code': 404}
+
+    cache = APICache('negative', custom_config_file=cache_config)
+    try:
+        cache.lookup(not_found, query='missing')
+        cache.backend.flush()
+        # Served from the backend, which puts it back in the memory tier
+        cache.memory_cache.clear()
+        cache.lookup(not_found, query='missing')
+        cache.lookup(not_found, query='missing')
+        assert calls == ['missing']
+
+        time.sleep(0.4)
+        cache.lookup(not_found, query='missing')
+        assert calls == ['missing', 'missing']
+    finally:
+        cache.close()
+
+
+def test_async_cache_from_registry_shares_tiers_with_sync_cache(cache_config):
+    from digital_thought_commons.cache.registry import CacheRegistry
+
+    calls = []
+
+    def found(query):
+        calls.append(query)
+        return {'value': query}
+
+    async def not_called(query):
+        raise AssertionError('live lookup made for a cached entry')
+
+    registry = CacheRegistry()
+    try:
+        cache = registry.get_cache('shared', custom_config_file=cache_config)
+        async_cache = registry.get_async_cache('shared', custom_config_file=cache_config)
+        assert async_cache.memory_cache is cache.memory_cache
+        assert async_cache.backend is cache.backend
+
+        cache.lookup(found, query='a')
+        assert asyncio.run(async_cache.lookup(not_called, query='a'))['value'] == 'a'
+        assert calls == ['a']
+    finally:
+        registry.close()
+
+
+def test_concurrent_misses_are_counted_once(cache_config):
+    release = threading.Event()
+    calls = []
+
+    def slow(query):
+        calls.append(query)
+        release.wait(5)
+        return {'value': query}
+
+    cache = APICache('coalesced', custom_config_file=cache_config)
+    try:
+        threads = [threading.Thread(target=cache.lookup, args=(slow,), kwargs={'query': 'a'}) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        # Gives every caller time to join the single flight before the live lookup returns
+        while len(calls) == 0:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        stats = cache.stats()
+        assert calls == ['a']
+        assert stats['misses'] == 1
+        assert stats['coalesced'] == 4
+        assert stats['lookups'] == 5
+    finally:
+        cache.close()
+
+
+def baseline_hash(cache_name, args):
+    # The key function of APICache before keys were canonicalised
+    signature_string = cache_name
+    for key, value in args.items():
+        signature_string += '{}={}'.format(key, value)
+    return hashlib.sha256(bytes(signature_string, 'utf-8')).hexdigest()
+
+
+def test_entry_stored_under_baseline_key_is_found(cache_config):
+    def not_called(query_url):
+        raise AssertionError('live lookup made for a cached entry')
+
+    domain = ' Example.COM. '
+    legacy_key = {'query_url': 'whois/?domain={}'.format(domain)}
+    cache = APICache('viewdns', custom_config_file=cache_config)
+    try:
+        cache.backend.store(CacheEntry(signature_hash=baseline_hash('viewdns', legacy_key),
+                                       lookup_timestamp=int(round(time.time() * 1000)),
+                                       encoded_response=base64.b64encode(b'{"whois": "example.com"}').decode('UTF-8'),
+                                       cache_name='viewdns'))
+        cache.backend.flush()
+
+        response = cache.lookup_with_legacy_key(not_called, legacy_key,
+                                                query_url='whois/?domain={}'.format(normalize_domain(domain)))
+        assert response == {'whois': 'example.com'}
+        cache.memory_cache.clear()
+        response = cache.lookup_many(not_called, [{'query_url': 'whois/?domain=example.com'}])
+        assert response == [{'whois': 'example.com'}]
+    finally:
+        cache.close()
+
+
+def test_compaction_keeps_entries_served_while_revalidating(cache_config):
+    with open(cache_config) as custom_config:
+        config = yaml.safe_load(custom_config)
+    config['default_max_age'] = 1000
+    config['stale_while_revalidate'] = 60000
+    with open(cache_config, 'w') as custom_config:
+        yaml.safe_dump(config, custom_config)
+
+    cache = APICache('revalidate', custom_config_file=cache_config)
+    try:
+        stale_timestamp = int(round(time.time() * 1000)) - 5000
+        cache._store_to_cache(cache._generate_hash({'query': 'a'}), stale_timestamp, cache.codec.serialize({'v': 1}))
+        cache.backend.flush()
+
+        assert cache.compact()['expired'] == 0
+        assert cache.preload_memory_cache(10) == 0
+        assert cache.backend.lookup(cache._generate_hash({'query': 'a'})).lookup_timestamp == stale_timestamp
+    finally:
+        cache.close()
+
+
+def test_expired_negative_entry_is_not_served_stale(cache_config):
+    with open(cache_config) as custom_config:
+        config = yaml.safe_load(custom_config)
+    config['stale_while_revalidate'] = 60000
+    with open(cache_config, 'w') as custom_config:
+        yaml.safe_dump(config, custom_config)
+
+    calls = []
+
+    def not_found(query):
+        calls.append(query)
+        return {'error': 'not found', 'status_code': 404}
+
+    cache = APICache('negative_stale', custom_config_file=cache_config)
+    try:
+        cache.lookup(not_found, query='missing')
+        cache.backend.flush()
+        cache.memory_cache.clear()
+        time.sleep(0.4)
+
+        cache.lookup(not_found, query='missing')
+        assert calls == ['missing', 'missing']
+
+        cache.backend.flush()
+        cache.memory_cache.clear()
+        time.sleep(0.4)
+        cache.lookup_many(not_found, [{'query': 'missing'}])
+        assert calls == ['missing', 'missing', 'missing']
+    finally:
+        cache.close()
+
+
+def test_lookup_passes_every_keyword_argument_to_the_lookup_method(cache_config):
+    def echo(lookup_method, legacy_key):
+        return {'lookup_method': lookup_method, 'legacy_key': legacy_key}
+
+    cache = APICache('arguments', custom_config_file=cache_config)
+    try:
+        assert cache.lookup(echo, lookup_method='a', legacy_key='b') == {'lookup_method': 'a', 'legacy_key': 'b'}
+        assert cache.lookup_with_legacy_key(echo, None, lookup_method='c', legacy_key='d') == \
+            {'lookup_method': 'c', 'legacy_key': 'd'}
+    finally:
+        cache.close()
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from digital_thought_commons.elasticsearch import AsyncElasticsearchConnection, ElasticsearchConnection
+from digital_thought_commons.internet.async_requester import AsyncResponse
+
+
+class FakeAsyncSession:
+
+    def __init__(self, body) -> None:
+        self.body = body
+        self.closed = False
+
+    async def request(self, method, url, **kwargs) -> AsyncResponse:
+        return AsyncResponse(url, 200, {}, json.dumps(self.body).encode('utf-8'))
+
+    async def get(self, url, **kwargs) -> AsyncResponse:
+        if url.endswith('_cluster/health'):
+            return AsyncResponse(url, 200, {}, b'{"status": "green"}')
+        return await self.request('GET', url, **kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_async_connection_has_no_blocking_methods():
+    assert not issubclass(AsyncElasticsearchConnection, ElasticsearchConnection)
+    for name in ('install_index_template', 'get_client', 'close', 'request_session'):
+        assert not hasattr(AsyncElasticsearchConnection, name)
+
+
+def test_streaming_aggregation_yields_buckets():
+    buckets = [{'key': str(number), 'doc_count': number} for number in range(50)]
+
+    async def run():
+        connection = AsyncElasticsearchConnection('localhost', 9200, 'aWQ6a2V5')
+        await connection.async_request_session.close()
+        connection.async_request_session = FakeAsyncSession({'took': 1, 'aggregations': {'by_key': {'buckets': buckets}}})
+        async with connection:
+            streamed = [bucket async for bucket in await connection.aggregation('index', {}, 'by_key', streaming=True)]
+            assert streamed == buckets
+            assert await connection.aggregation('index', {}, 'by_key') == buckets
+        assert connection.async_request_session.closed
+
+    asyncio.run(run())
@@ -0,0 +1,28 @@
+import asyncio
+
+from digital_thought_commons.internet.async_requester import AsyncRetrySession, connection_pool
+
+
+def test_connection_pool_closed_with_last_session():
+    async def run():
+        first = AsyncRetrySession()
+        second = AsyncRetrySession()
+        # Opens each session's aiohttp session on the shared pool without sending a request
+        first._AsyncRetrySession__session()
+        second._AsyncRetrySession__session()
+        connector = connection_pool()
+
+        await first.close()
+        assert not connector.closed
+        await second.close()
+        assert connector.closed
+        # A session closed twice does not release the pool of the sessions opened after it
+        third = AsyncRetrySession()
+        third._AsyncRetrySession__session()
+        connector = connection_pool()
+        await second.close()
+        assert not connector.closed
+        await third.close()
+        assert connector.closed
+
+    asyncio.run(run())
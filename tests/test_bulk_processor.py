@@ -0,0 +1,58 @@
+import json
+import threading
+
+from digital_thought_commons.elasticsearch.bulkProcessor import BulkProcessor
+
+
+class FakeResponse:
+
+    def __init__(self, body) -> None:
+        self.status_code = 200
+        self.body = body
+        self.text = json.dumps(body)
+        self.content = self.text.encode('utf-8')
+
+    def json(self):
+        return self.body
+
+
+class BlockingSession:
+    """
+    Holds each _bulk request until released, standing in for a slow request or a retry backoff.
+    """
+
+    def __init__(self) -> None:
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def post(self, url, data=None, headers=None):
+        self.sending.set()
+        self.release.wait(10)
+        lines = [json.loads(line) for line in data.splitlines() if line.strip()]
+        return FakeResponse({'took': 1, 'errors': False,
+                             'items': [{'index': {'_index': action['index']['_index'], '_id': action['index'].get('_id'),
+                                                  'status': 201, 'result': 'created'}} for action in lines[0::2]]})
+
+
+def test_adding_actions_does_not_wait_for_a_batch_being_sent():
+    session = BlockingSession()
+    processor = BulkProcessor(request_session=session, root_url='', batch_size=2, batch_max_size_bytes=5000000)
+
+    def fill_batch():
+        processor.index('index', {'n': 1}, _id='1')
+        processor.index('index', {'n': 2}, _id='2')
+
+    sender = threading.Thread(target=fill_batch)
+    sender.start()
+    assert session.sending.wait(10)
+
+    producer = threading.Thread(target=processor.index, args=('index', {'n': 3}, '3'))
+    producer.start()
+    producer.join(2)
+    blocked = producer.is_alive()
+
+    session.release.set()
+    sender.join(10)
+    producer.join(10)
+    assert not blocked
+    assert processor.close()['created'] == 3
@@ -0,0 +1,35 @@
+import base64
+
+from digital_thought_commons.elasticsearch.connectionRegistry import ConnectionRegistry
+
+api_key = base64.b64encode(b'id:key').decode('utf-8')
+
+
+def test_closing_a_shared_connection_leaves_it_open_for_other_users():
+    registry = ConnectionRegistry()
+    try:
+        with registry.get_connection('localhost', 9200, api_key) as connection:
+            client = connection.get_client()
+        connection.close()
+
+        shared = registry.get_connection('localhost', 9200, api_key)
+        assert shared is connection
+        assert shared.get_client() is client
+    finally:
+        registry.close_all()
+
+    assert registry.connections == {}
+    assert registry.get_connection('localhost', 9200, api_key) is not connection
+    assert connection.get_client() is not client
+    registry.close_all()
+
+
+def test_client_pool_sized_with_the_argument_of_the_installed_client(monkeypatch):
+    import digital_thought_commons.elasticsearch as elasticsearch
+
+    created = []
+    monkeypatch.setattr(elasticsearch, 'Elasticsearch', lambda *args, **kwargs: created.append(kwargs))
+    for version, argument in (((7, 17, 0), 'maxsize'), ((8, 0, 0), 'connections_per_node')):
+        monkeypatch.setattr(elasticsearch, 'elasticsearch_version', version)
+        elasticsearch.ElasticsearchConnection('localhost', 9200, api_key, pool_size=4).get_client()
+        assert created[-1][argument] == 4
@@ -0,0 +1,96 @@
+import json
+
+from digital_thought_commons.cache.cacheBackend import CacheEntry
+from digital_thought_commons.cache.elasticCache import ElasticCacheBackend
+from digital_thought_commons.elasticsearch.bulkProcessor import BulkProcessor
+
+
+class FakeResponse:
+
+    def __init__(self, body) -> None:
+        self.status_code = 200
+        self.body = body
+        self.text = json.dumps(body)
+        self.content = self.text.encode('utf-8')
+
+    def json(self):
+        return self.body
+
+
+class FakeCluster:
+    """
+    Applies _bulk index actions the way Elasticsearch does, including external_gte versioning.
+    """
+
+    def __init__(self) -> None:
+        self.documents = {}
+        self.bulk_requests = 0
+
+    def post(self, url, data=None, headers=None):
+        self.bulk_requests += 1
+        lines = [json.loads(line) for line in data.splitlines() if line.strip()]
+        items = []
+        for action, source in zip(lines[0::2], lines[1::2]):
+            meta = action['index']
+            current = self.documents.get(meta['_id'])
+            if current is not None and meta.get('version_type') == 'external_gte' and \
+                    meta['version'] < current['_version']:
+                items.append({'index': {'_index': meta['_index'], '_id': meta['_id'], 'status': 409,
+                                        'error': {'type': 'version_conflict_engine_exception'}}})
+                continue
+            self.documents[meta['_id']] = {'_version': meta.get('version', 1), '_source': source}
+            items.append({'index': {'_index': meta['_index'], '_id': meta['_id'], 'status': 200,
+                                    'result': 'created' if current is None else 'updated'}})
+        return FakeResponse({'took': 1, 'errors': False, 'items': items})
+
+
+class FakeConnection:
+
+    def __init__(self, cluster) -> None:
+        self.cluster = cluster
+
+    def bulk_processor(self, batch_size, concurrent_requests=0, ignore_status=()):
+        return BulkProcessor(request_session=self.cluster, root_url='', batch_size=batch_size,
+                             batch_max_size_bytes=5000000, concurrent_requests=concurrent_requests,
+                             ignore_status=ignore_status)
+
+    def find_by_id(self, index, _id, alias_index=True):
+        document = self.cluster.documents.get(_id)
+        if document is None:
+            return {'_id': _id, 'found': False}
+        return {'_id': _id, 'found': True, '_source': document['_source']}
+
+
+def test_stale_write_does_not_replace_fresh_entry():
+    cluster = FakeCluster()
+    backend = ElasticCacheBackend(FakeConnection(cluster), 'stale', index='test-cache', flush_interval=60)
+    try:
+        backend.store(CacheEntry(signature_hash='a', lookup_timestamp=2000, encoded_response=b'fresh'))
+        backend.flush()
+        # e.g. a tiered promotion or snapshot import of an older copy
+        backend.store(CacheEntry(signature_hash='a', lookup_timestamp=1000, encoded_response=b'stale'))
+        backend.flush()
+
+        entry = backend.lookup('a')
+        assert entry.lookup_timestamp == 2000
+        assert entry.encoded_response == b'fresh'
+        assert backend.bulk_processor.results['noop'] == 1
+        assert backend.bulk_processor.results['errors'] == 0
+    finally:
+        backend.close()
+
+
+def test_flushes_share_one_bulk_processor():
+    cluster = FakeCluster()
+    backend = ElasticCacheBackend(FakeConnection(cluster), 'shared', index='test-cache', bulk_batch_size=2,
+                                  flush_interval=60)
+    bulk_processor = backend.bulk_processor
+    try:
+        for number in range(5):
+            backend.store(CacheEntry(signature_hash=str(number), lookup_timestamp=1000, encoded_response=b'x'))
+        backend.flush()
+        assert backend.bulk_processor is bulk_processor
+        assert len(cluster.documents) == 5
+        assert cluster.bulk_requests == 3
+    finally:
+        backend.close()
@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+
+from digital_thought_commons import elasticsearch
+from digital_thought_commons.elasticsearch.bulkProcessor import BulkProcessor
+from digital_thought_commons.logging.handlers.elasticsearch import ElasticsearchLogHandler
+
+
+class SlowBulkResponse:
+    status_code = 200
+    content = b''
+    text = ''
+
+    def __init__(self, actions) -> None:
+        self.actions = actions
+
+    def json(self):
+        return {'took': 1, 'errors': False,
+                'items': [{'index': {'_index': 'test-event-logs', '_id': str(n), 'result': 'created', 'status': 201}}
+                          for n in range(self.actions)]}
+
+
+class SlowSession:
+
+    def __init__(self) -> None:
+        self.messages = []
+
+    def post(self, url, data=None, headers=None):
+        lines = data.splitlines()
+        self.messages.extend(line for line in lines[1::2])
+        # A slow cluster keeps the processor sending, and logging, while records keep arriving
+        time.sleep(0.05)
+        return SlowBulkResponse(len(lines) // 2)
+
+
+class FakeConnection:
+
+    def __init__(self) -> None:
+        self.session = SlowSession()
+
+    def default_index_templates(self):
+        return {'event-logs-v1': {}}
+
+    def install_index_template(self, template_name, template, prefix=None):
+        return {'status': 'already_present'}
+
+    def bulk_processor(self, **kwargs):
+        return BulkProcessor(request_session=self.session, root_url='https://localhost:9200/',
+                             batch_max_size_bytes=5000000, **kwargs)
+
+
+def test_emit_does_not_block_while_the_processor_logs(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(elasticsearch, 'get_connection', lambda **kwargs: connection)
+    handler = ElasticsearchLogHandler('test', 'localhost', 9200, 'key', max_queued_records=50)
+    root = logging.getLogger()
+    previous_level = root.level
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+
+    def log_records():
+        for number in range(5000):
+            logging.getLogger('application').info('record {}'.format(number))
+
+    try:
+        writer = threading.Thread(target=log_records, daemon=True)
+        writer.start()
+        writer.join(timeout=30)
+        assert not writer.is_alive(), 'emit blocked while the bulk processor was logging'
+
+        handler.flush()
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(previous_level)
+        handler.close()
+
+    shipped = len(connection.session.messages)
+    assert handler.dropped_records > 0
+    assert shipped + handler.dropped_records == 5000
+    # The processor's own "Bulk index took" records are never shipped
+    assert not any(b'Bulk index' in message for message in connection.session.messages)
@@ -0,0 +1,27 @@
+from digital_thought_commons.cache.cacheBackend import CacheEntry
+from digital_thought_commons.cache.fileCache import FileCacheBackend
+from digital_thought_commons.cache.sqliteEngine import SQLiteEngine
+
+
+def test_failed_commit_keeps_entries_pending(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / 'cache.db'))
+    backend = FileCacheBackend(engine, 'failing', commit_batch_size=100, commit_interval=None)
+    write_many = engine.write_many
+
+    def failing_write_many(sql, rows):
+        raise Exception('disk I/O error')
+
+    try:
+        engine.write_many = failing_write_many
+        backend.store(CacheEntry(signature_hash='a', lookup_timestamp=1, encoded_response=b'1'))
+        backend.flush()
+        assert list(backend.pending) == ['a']
+        assert backend.lookup('a').encoded_response == b'1'
+
+        engine.write_many = write_many
+        backend.flush()
+        assert len(backend.pending) == 0
+        assert engine.read('SELECT encoded_response FROM cache WHERE signature_hash=?', ('a',)) == [(b'1',)]
+    finally:
+        backend.close()
+        engine.close()
@@ -0,0 +1,41 @@
+import gzip
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from digital_thought_commons.internet import CompressingHTTPAdapter
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    requests_sent = []
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda self, request, **kwargs: requests_sent.append(request))
+    return requests_sent
+
+
+def send(headers, data=None):
+    session = requests.Session()
+    request = session.prepare_request(requests.Request('POST', 'http://localhost/', headers=headers, data=data))
+    CompressingHTTPAdapter(min_size=10).send(request)
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, 'gzip, deflate'),
+    ('br', 'br, gzip'),
+    ('deflate, GZIP;q=0.5', 'deflate, GZIP;q=0.5'),
+    ('gzip;q=0', 'gzip;q=0'),
+])
+def test_gzip_added_to_accept_encoding_only_when_missing(sent, accept_encoding, expected):
+    send({'Accept-Encoding': accept_encoding} if accept_encoding else {})
+    assert sent[0].headers['Accept-Encoding'].startswith(expected)
+
+
+def test_caller_headers_left_alone(sent):
+    send({'Content-Encoding': 'identity', 'X-Request': 'kept'}, data=b'x' * 100)
+    assert sent[0].headers['Content-Encoding'] == 'identity'
+    assert sent[0].headers['X-Request'] == 'kept'
+    assert sent[0].body == b'x' * 100
+
+    send({}, data=b'x' * 100)
+    assert gzip.decompress(sent[1].body) == b'x' * 100
@@ -0,0 +1,26 @@
+from digital_thought_commons.cache.memoryCache import MemoryCache
+
+
+def test_arc_promotes_a_replaced_key_to_frequency_list():
+    cache = MemoryCache('arc', max_entries=2, policy='arc')
+    cache.put('a', 1)
+    cache.put('a', 2)
+    cache.put('b', 1)
+    cache.put('c', 1)
+
+    assert cache.lookup('a') == 2
+    assert 'b' not in cache
+    assert list(cache.policy.t2) == ['a']
+
+
+def test_replacing_a_key_keeps_the_byte_count():
+    cache = MemoryCache('bytes', max_bytes=10, policy='arc')
+    cache.put('a', b'12345')
+    cache.put('b', b'123')
+    cache.put('a', b'1234567')
+
+    assert cache.current_bytes == 10
+    assert cache.lookup('a') == b'1234567'
+    cache.put('a', b'12345678')
+    assert cache.current_bytes == 8
+    assert 'b' not in cache